@@ -5,8 +5,8 @@
 # Simulated Predictor process
 #
 # This process is intiailized and started in the Main file
-# Change the import in Main.py from "from predictor import Predictor"
-# to "from FakePredictor import Predictor" to use this
+# Uncomment the import "from FakePredictor import Predictor as PredictorWorker"
+# in Main.py to use this, the PredictorPool then starts simulated workers
 
 
 #################################################################################
@@ -24,7 +24,8 @@ import keyboard
 #
 
 class Predictor(Process):
-    def __init__(self, data_input_queue, gesture_output_queue, direct_control_queue, earlyPredictors_3D, validationPredictors_3D, class_names_3D, earlyPredictors_2D = [], validationPredictors_2D = [], class_names_2D = []):
+    def __init__(self, data_input_queue, gesture_output_queue, direct_control_queue, earlyPredictors_3D, validationPredictors_3D, class_names_3D, earlyPredictors_2D = [], validationPredictors_2D = [], class_names_2D = [], latency_interval = None, **options):
+        #options of a PredictorWorker are ignored
         super(Predictor, self).__init__()
         self.data_3d = Data3D()
         self.data_input_queue = data_input_queue
@@ -1,6 +1,7 @@
 import bluepy
 from bluepy.btle import Scanner, DefaultDelegate, Peripheral, AssignedNumbers, BTLEException
-import threading, binascii, sys, json, logging
+import threading, binascii, sys, json, logging, functools, collections, os, select
+from concurrent.futures import Future
 from configparser import SafeConfigParser
 from struct import *
 import time
@@ -16,6 +17,17 @@ _DEVICE_TO_FIND = ""
 _STREAM_CHAR = ""
 _CFG_CHAR = ""
 
+#default file of the addresses of the last connected TACTI
+DEFAULT_ADDRESS_CACHE = "tacti_addresses.json"
+
+#direct connects to known addresses after a connection loss before a scan,
+#the delay between two attempts doubles starting with RECONNECT_DELAY seconds
+RECONNECT_ATTEMPTS = 4
+RECONNECT_DELAY = 0.1
+
+#a lost TACTI that is not back after this many reconnect cycles is forgotten
+RECONNECT_CYCLES = 5
+
 
 
 def log_it(*args):
@@ -111,6 +123,7 @@ class BTCommunication():
         _DEVICE_TO_FIND = parser.get('ble', 'devicesToFind')
         _STREAM_CHAR = parser.get('ble', 'streamChar')
         _CFG_CHAR = parser.get('ble', 'cfgChar')
+        self.addressCache = parser.get('ble', 'addressCache', fallback=DEFAULT_ADDRESS_CACHE)
 
         # print target in fo
         print("Target device: {}, stream char UUID = {}  --  cmd chat UUID = {}".format(_DEVICE_TO_FIND, _STREAM_CHAR, _CFG_CHAR))
@@ -123,10 +136,23 @@ class BTCommunication():
         self.scanner = Scanner(0)
         self.peripherals = {}
         self.lock = threading.RLock()
+        self.userStreamCB = None
+        self.userDeviceStreamCB = None
+
+        # addresses of the last connected TACTI, most recent first
+        self.knownAddresses = self.loadAddressCache()
+
+        # set by a notification thread that lost its connection
+        self.connectionLost = threading.Event()
+
+        # failed reconnect cycles of the lost TACTI, address -> cycles
+        self.reconnectFailures = {}
 
 
         #current config
         self.mode = DEFAULT_MODE
+        #modes set for single devices, address -> MODE
+        self.deviceModes = {}
         self.dimension = DEFAULT_DIMENSION
         self.usage = DEFAULT_USAGE
         self.ledMode = DEFAULT_LED_MODE
@@ -146,7 +172,20 @@ class BTCommunication():
 
 
     def stayConnected(self):
-        """ scan, connect, keep connected to TACTI
+        """ connect, keep connected to TACTI
+            the addresses of the last connections are tried first
+            (see connectKnown). The first call always scans for TACTI
+            that are not in the address cache, later calls only scan
+            if none of the known TACTI can be reached
+        """
+        if self.connectKnown() and not self.firstTime:
+            return
+        self.firstTime = False
+        self.scanAndConnect()
+
+
+    def scanAndConnect(self):
+        """ scan, connect to all TACTI found
             BLE name and UUID characteristic are specified in twc.cfg file
         """
 
@@ -157,37 +196,152 @@ class BTCommunication():
                 # Remove record and treat it as new
                 # Note, it would be nice to remove a device when it goes offline as opposed to when it comes back
                 # To do this I'd need something like a ping...dunno what best practice is
-                if d.addr in self.peripherals:
-                    with self.lock:
+                with self.lock:
+                    peripheral = self.peripherals.get(d.addr)
+                    if peripheral is not None:
+                        if peripheral.connected and peripheral.is_alive():
+                            continue
                         del self.peripherals[d.addr]
 
                 for (adtype, desc, value) in d.getScanData():
 
                     #search for Tactigon devices
                     if(value.find(_DEVICE_TO_FIND) == 0):
+                        self.connect(d.addr)
 
-                        #create peripheral
-                        logging.info("Starting Thread for %s", d.addr)
-                        self.connectedPeripheral = BleThread(d.addr, self.lock, _STREAM_CHAR, _CFG_CHAR, self.userStreamCB)
-
-                        #start thread to get notifications
-                        with self.lock:
-                            self.peripherals[d.addr] = self.connectedPeripheral
-                        self.connectedPeripheral.daemon = True
-                        self.connectedPeripheral.start()
+            except Exception as e:
+                logging.debug("Unknown error %s", e)
 
-                        #set current config
-                        self.setToCurrentCfg()
 
+    def connectKnown(self):
+        """ connect directly to the addresses in the address cache
+            that are not connected, without a scan
+            returns True if at least one TACTI is connected afterwards
+        """
+        for addr in list(self.knownAddresses):
+            with self.lock:
+                peripheral = self.peripherals.get(addr)
+            if peripheral is not None and peripheral.connected and peripheral.is_alive():
+                continue
+            try:
+                self.connect(addr)
             except Exception as e:
-                logging.debug("Unknown error %s", e)
+                logging.debug("Direct connect to %s failed %s", addr, e)
+        return self.isConnected()
+
+
+    def reconnect(self, attempts=RECONNECT_ATTEMPTS, delay=RECONNECT_DELAY):
+        """ reconnect after a connection loss
+            direct connects to the known addresses are tried attempts
+            times with exponential backoff (delay, 2*delay, ...), then
+            a scan is done
+            returns True if a TACTI is connected and no TACTI that was
+            connected before is lost
+        """
+        for attempt in range(attempts):
+            self.connectKnown()
+            if self.isConnected() and not self.lostAddresses():
+                self.reconnectFailures.clear()
+                return True
+            time.sleep(delay)
+            delay *= 2
+        self.scanAndConnect()
+        self.forgetLost()
+        return self.isConnected() and not self.lostAddresses()
+
+
+    def forgetLost(self, cycles=RECONNECT_CYCLES):
+        """ count a failed reconnect cycle for every lost TACTI, a TACTI
+            that failed cycles times is removed from the peripherals and
+            the address cache, so it is neither reconnected directly nor
+            reported lost anymore
+        """
+        lost = self.lostAddresses()
+        with self.lock:
+            for addr in list(self.reconnectFailures):
+                if addr not in lost:
+                    del self.reconnectFailures[addr]
+            for addr in lost:
+                self.reconnectFailures[addr] = self.reconnectFailures.get(addr, 0) + 1
+                if self.reconnectFailures[addr] < cycles:
+                    continue
+                print("TACTI {} not reachable after {} reconnects, forgotten".format(addr, cycles))
+                del self.reconnectFailures[addr]
+                del self.peripherals[addr]
+                self.deviceModes.pop(addr, None)
+                if addr in self.knownAddresses:
+                    self.knownAddresses.remove(addr)
+            self.saveAddressCache()
+
+
+    def connect(self, addr):
+        """ connect to the TACTI addr, start its notification thread
+            and apply the current config
+            raises an exception if the device can not be reached
+        """
+        #create peripheral
+        logging.info("Starting Thread for %s", addr)
+        streamCB = self.userStreamCB
+        if self.userDeviceStreamCB is not None:
+            streamCB = functools.partial(self.userDeviceStreamCB, addr)
+        peripheral = BleThread(addr, self.lock, _STREAM_CHAR, _CFG_CHAR, streamCB)
+        peripheral.onDisconnect = self.connectionLost.set
+
+        #start thread to get notifications
+        with self.lock:
+            self.peripherals[addr] = peripheral
+        self.connectedPeripheral = peripheral
+        self.connectedPeripheral.daemon = True
+        self.connectedPeripheral.start()
+        self.rememberAddress(addr)
+
+        #set current config
+        self.setToCurrentCfg(addr)
+
+
+    def rememberAddress(self, addr):
+        """ put addr first into the persisted address cache
+        """
+        with self.lock:
+            if addr in self.knownAddresses:
+                self.knownAddresses.remove(addr)
+            self.knownAddresses.insert(0, addr)
+            self.saveAddressCache()
 
 
+    def saveAddressCache(self):
+        with self.lock:
+            try:
+                temporary = self.addressCache + '.tmp'
+                with open(temporary, 'w') as f:
+                    json.dump(self.knownAddresses, f)
+                os.replace(temporary, self.addressCache)
+            except OSError as e:
+                logging.debug("Address cache not saved %s", e)
 
 
+    def loadAddressCache(self):
+        try:
+            with open(self.addressCache) as f:
+                return [str(addr) for addr in json.load(f)]
+        except (OSError, ValueError):
+            return []
+
 
+    def isConnected(self):
+        """ True if at least one TACTI is connected and its
+            notification thread is running
+        """
+        with self.lock:
+            return any(p.connected and p.is_alive() for p in self.peripherals.values())
 
 
+    def lostAddresses(self):
+        """ addresses of the TACTI that were connected and lost
+            their connection
+        """
+        with self.lock:
+            return [addr for addr, p in self.peripherals.items() if not (p.connected and p.is_alive())]
 
 
     def getVersion(self):
@@ -196,93 +350,114 @@ class BTCommunication():
         return VERSION
 
 
-    def setLed(self, mode, color):
+    def setLed(self, mode, color, addr=None):
         """ set LED mode. Refer to LED_COLOR and LED_MOD enum
+            with addr only the TACTI addr is set, otherwise every
+            connected TACTI
         """
-        self.ledMode = mode
-        self.ledColor = color
+        if addr is None:
+            self.ledMode = mode
+            self.ledColor = color
         message = pack('bbb', COMMANDS.LED_CTRL.value, mode.value, color.value)
-        self.connectedPeripheral.msgToWrite = message
+        self.writeToTacti(message, addr)
 
 
-    def setMode(self, mode):
+    def setMode(self, mode, addr=None):
         """ set LED mode. Refer to MODE enum
+            with addr only the mode of the TACTI addr is set, it is
+            kept for reconnects of this device, otherwise every
+            connected TACTI is set to mode
         """
-        self.mode = mode
+        if addr is None:
+            self.mode = mode
+            self.deviceModes.clear()
+        else:
+            self.deviceModes[addr] = mode
         message = pack('bb', COMMANDS.MODE_SET.value, mode.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def setUsage(self, usage):
+    def setUsage(self, usage, addr=None):
         """ set USAGE mode. Refer to USAGE enum
         """
-        self.usage = usage
+        if addr is None:
+            self.usage = usage
         message = pack('bb', COMMANDS.USAGE_SET.value, usage.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def setDimension(self, dimension):
+    def setDimension(self, dimension, addr=None):
         """ set DIMENSION mode. Refer to DIMENSION enum
         """
-        self.dimension = dimension
+        if addr is None:
+            self.dimension = dimension
         message = pack('bb', COMMANDS.DIMENSION_SET.value, dimension.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def setGNorm(self, gnorm):
+    def setGNorm(self, gnorm, addr=None):
         """ Activate/deactivate G force compensation. Refer to GNORM enum
         """
-        self.gnorm = gnorm
+        if addr is None:
+            self.gnorm = gnorm
         message = pack('bb', COMMANDS.NORM_G.value, gnorm.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def setThresholds(self, rTh, pTh, yTh):
+    def setThresholds(self, rTh, pTh, yTh, addr=None):
         """ Set angles threshold for Direct Control mode
             Angle must be passed as float
         """
-        self.rTh = rTh
-        self.pTh = pTh
-        self.yTh = yTh
+        if addr is None:
+            self.rTh = rTh
+            self.pTh = pTh
+            self.yTh = yTh
         message = pack('bHHH', COMMANDS.SET_THRESHOLDS.value, rTh, pTh, yTh)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def startSendingData(self):
+    def startSendingData(self, addr=None):
         """ Start streaming
         """
-        self.dataSending = True
+        if addr is None:
+            self.dataSending = True
         message = pack('b', COMMANDS.START_SENDING_DATA.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def stopSendingData(self):
+    def stopSendingData(self, addr=None):
         """ Stop streaming
         """
-        self.dataSending = False
+        if addr is None:
+            self.dataSending = False
         message = pack('b', COMMANDS.STOP_SENDING_DATA.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def resetTimeStamp(self):
+    def resetTimeStamp(self, addr=None):
         """ reset time stamp
         """
         message = pack('b', COMMANDS.RESET_TS.value)
-        self.writeToTacti(message)
+        self.writeToTacti(message, addr)
 
 
-    def	setToCurrentCfg(self):
-        self.resetTimeStamp()
-        self.setMode(self.mode)
-        self.setUsage(self.usage)
-        self.setDimension(self.dimension)
-        self.setLed(self.ledMode, self.ledColor)
-        self.setThresholds(self.rTh, self.pTh, self.yTh)
-        self.setGNorm(self.gnorm)
+    def	setToCurrentCfg(self, addr=None):
+        """ send the current configuration to the TACTI addr, to every
+            connected TACTI if addr is None
+            the settings of a single TACTI do not change the current
+            configuration of the others
+        """
+        self.resetTimeStamp(addr)
+        self.setMode(self.deviceModes.get(addr, self.mode), addr)
+        self.setUsage(self.usage, addr)
+        self.setDimension(self.dimension, addr)
+        self.setLed(self.ledMode, self.ledColor, addr)
+        self.setThresholds(self.rTh, self.pTh, self.yTh, addr)
+        self.setGNorm(self.gnorm, addr)
         if self.dataSending == True:
-            self.startSendingData()
+            self.startSendingData(addr)
         else:
-            self.stopSendingData()
+            self.stopSendingData(addr)
 
 
 
@@ -320,36 +495,72 @@ class BTCommunication():
         self.userStreamCB = cbFunc
 
 
+    def setDeviceStreamCallBack(self, cbFunc):
+        """ Set call back for data stream of several devices
+            This function will be called at every new BLE data packet
+            received from any connected device and replaces the
+            call back set with setStreamCallBack
+
+            Function prototype must be as following:
+
+                def myStreamCB(addr, cHandle, data):
+
+                    .... do something
+                    .... do something
+
+            where:
+                addr:       address of the device that sent the packet
+                cHandle: 	characteristic identifier
+                data: 		the data packet
+        """
+        self.userDeviceStreamCB = cbFunc
+
+
 
 
     ####################################################################
     ### reserved func: user shouldn't use these
 
 
-    def writeToTacti(self, message):
-        if self.connectedPeripheral.connected == True:
-            if self.waitWriteQueue() == True:
-                self.connectedPeripheral.msgToWrite = message
-                return True
+    def writeToTacti(self, message, addr=None):
+        """ queue a command for the TACTI addr, or for every connected
+            TACTI if addr is None
+            returns a list with one Future per TACTI the command was
+            queued for, it is done when the command was written (result
+            True) or could not be written (exception)
+        """
+        with self.lock:
+            if addr is None:
+                peripherals = list(self.peripherals.values())
             else:
-                return False
+                peripherals = [self.peripherals[addr]] if addr in self.peripherals else []
+        return [peripheral.sendCommand(message) for peripheral in peripherals
+                if peripheral.connected == True and peripheral.is_alive()]
 
 
-    def waitWriteQueue(self):
-        timeout = 2  #sec
-        mustend = time.time() + timeout
-        while time.time() < mustend:
-            if self.connectedPeripheral.msgToWrite == "":
-                return True
-            time.sleep(0.2)
-        return False
+    def flushCommands(self, timeout=2):
+        """ wait until the queued commands are written to every
+            connected TACTI
+            returns False if they were not written to all of them
+            within timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            peripherals = list(self.peripherals.values())
+        flushed = True
+        for peripheral in peripherals:
+            if peripheral.connected == True and peripheral.is_alive():
+                if not peripheral.waitCommands(max(0.0, deadline - time.monotonic())):
+                    flushed = False
+        return flushed
 
 
 
 ############################################################################################################
 class BleThread(Peripheral, threading.Thread):
     ## @var WAIT_TIME
-    # Time of waiting for notifications in seconds
+    # Longest time of waiting for notifications in seconds, a queued
+    # command wakes the thread up at once (see waitForEvents)
     WAIT_TIME = 0.1
 
     ## @var EXCEPTION_WAIT_TIME
@@ -369,7 +580,18 @@ class BleThread(Peripheral, threading.Thread):
 
         threading.Thread.__init__(self)
         self.lock = lock
-        self.msgToWrite = ""
+
+        # commands for the cfg char, written by this thread in order
+        self.commands = collections.deque()
+        self.commandsCondition = threading.Condition()
+
+        # sendCommand writes a byte into this pipe to wake up run()
+        self.wakeupReader, self.wakeupWriter = os.pipe()
+        os.set_blocking(self.wakeupReader, False)
+        os.set_blocking(self.wakeupWriter, False)
+
+        # called without arguments when the connection is lost
+        self.onDisconnect = None
 
 
 
@@ -402,12 +624,10 @@ class BleThread(Peripheral, threading.Thread):
     def run(self):
         while self.connected:
             try:
-                self.waitForNotifications(self.WAIT_TIME)
+                self.waitForEvents(self.WAIT_TIME)
 
-                #check for message to write from user
-                if self.msgToWrite != "":
-                    self.cfgChar.write(self.msgToWrite, withResponse=False)
-                    self.msgToWrite = ""
+                #write all queued messages from user back to back
+                self.writeCommands()
 
 
 
@@ -430,6 +650,89 @@ class BleThread(Peripheral, threading.Thread):
                 logging.debug("Peripheral exception for %s. %s", self.addr, e)
                 self.connected = False
 
+        #nothing is written anymore
+        self.failCommands(ConnectionError("TACTI {} disconnected".format(self.addr)))
+        os.close(self.wakeupReader)
+        os.close(self.wakeupWriter)
+        if self.onDisconnect is not None:
+            self.onDisconnect()
+
+
+    def waitForEvents(self, timeout):
+        """ wait up to timeout seconds for a notification or a queued
+            command, a notification is handled by the delegate
+        """
+        #bluepy (1.3.0) offers no public file descriptor of its helper
+        #process, waitForNotifications polls the stdout of _helper
+        helper = getattr(self, '_helper', None)
+        if helper is None:
+            self.waitForNotifications(timeout)
+            return
+        readable, _, _ = select.select([helper.stdout, self.wakeupReader], [], [], timeout)
+        if self.wakeupReader in readable:
+            try:
+                os.read(self.wakeupReader, 4096)
+            except BlockingIOError:
+                pass
+        if helper.stdout in readable:
+            self.waitForNotifications(0)
+
+
+    def sendCommand(self, message):
+        """ queue a message for the cfg char, this thread is woken up
+            and writes it
+            returns a Future that is done when the message was written
+        """
+        future = Future()
+        with self.commandsCondition:
+            if not self.connected:
+                future.set_exception(ConnectionError("TACTI {} disconnected".format(self.addr)))
+                return future
+            self.commands.append((message, future))
+            try:
+                os.write(self.wakeupWriter, b'\x00')
+            except (BlockingIOError, OSError):
+                #the pipe is full, a wake up is already pending
+                pass
+        return future
+
+
+    def waitCommands(self, timeout=None):
+        """ wait until all queued messages are written
+        """
+        with self.commandsCondition:
+            return self.commandsCondition.wait_for(lambda: len(self.commands) == 0, timeout)
+
+
+    def writeCommands(self):
+        #a message stays in the queue until it is written, so an empty
+        #queue means that every message reached the TACTI
+        while True:
+            with self.commandsCondition:
+                if len(self.commands) == 0:
+                    self.commandsCondition.notify_all()
+                    return
+                message, future = self.commands[0]
+            try:
+                self.cfgChar.write(message, withResponse=False)
+            except BaseException as e:
+                with self.commandsCondition:
+                    self.commands.popleft()
+                future.set_exception(e)
+                raise
+            with self.commandsCondition:
+                self.commands.popleft()
+            future.set_result(True)
+
+
+    def failCommands(self, exception):
+        with self.commandsCondition:
+            commands = list(self.commands)
+            self.commands.clear()
+            self.commandsCondition.notify_all()
+        for message, future in commands:
+            future.set_exception(exception)
+
 
 
 ############################################################################################################
@@ -22,13 +22,19 @@ from cflib.crazyflie.syncCrazyflie import SyncCrazyflie
 from cflib.crazyflie.syncLogger import SyncLogger
 import time
 from transitions import Machine
+import queue
 from multiprocessing import Process, JoinableQueue
-from struct import *
+from framecodec import decode_direct_control
+from latency import LatencyMonitor
 
 
 #Adresse der Crazyflie
 uri = 'radio://0/80/2M'
 
+#longest time the queueHandler waits for a message before it wakes up,
+#messages wake it up immediately
+WAKEUP_INTERVAL = 1.0
+
 ########################################################################
 #Automat für Gesture Mode
 class StateMachine(object):
@@ -115,16 +121,32 @@ class StateMachine(object):
 
 
 # Application Prozess
+#
+# Latency report (kill -USR1 <pid>, or every latency_interval seconds):
+#   predictor->application   decision of the predictor until dequeue here
+#   gesture dispatch         dequeue until the crazyflie command was sent
+#   ble->command             arrival of the frame in the BLE callback until
+#                            the crazyflie command was sent
+#   direct control dispatch  dequeue of a direct control frame until the
+#                            crazyflie command was sent
+#
+# The predictors put the gesture events and the direct control frames into
+# one input queue (pass it as gesture_output_queue and direct_control_queue),
+# they are handled in the order they arrived.
 class Application(Process):
-    def __init__(self, gesture_input_queue, direct_control_queue):
+    def __init__(self, input_queue, latency_interval = None):
         super(Application, self).__init__()
-        self.gesture_input_queue = gesture_input_queue
-        self.direct_control_queue = direct_control_queue
+        self.input_queue = input_queue
         self.position = []
+        self.monitor = LatencyMonitor('application')
+        self.latency_interval = latency_interval
         print("init")
 
     ########################################################################
     def run(self):
+        self.monitor.install_signal_handler()
+        if self.latency_interval:
+            self.monitor.start(self.latency_interval)
         while True:
             print("run")
             #load crazyflie driver
@@ -156,117 +178,141 @@ class Application(Process):
             expected data:     event(1) | roll(4) | pitch(4) | yaw(4) | btn_1(1) | btn_2(1) | btn_3(1) | btn_4(1)
         """
 
-        self.evt = unpack('B', data[0:1])[0]
+        events, angles, buttons = decode_direct_control(data)
 
-        self.roll = unpack('f', data[1:5])[0]
-        self.pitch = unpack('f', data[5:9])[0]
-        self.yaw = unpack('f', data[9:13])[0]
+        self.evt = int(events[0])
 
-        self.b1 = float(unpack('b', data[14:15])[0])
-        self.b2 = float(unpack('b', data[15:16])[0])
-        self.b3 = float(unpack('b', data[16:17])[0])
-        self.b4 = float(unpack('b', data[17:18])[0])
+        self.roll, self.pitch, self.yaw = angles[0].tolist()
+
+        self.b1, self.b2, self.b3, self.b4 = buttons[0].tolist()
 
         #print("stream: {}, {}, {}, {}".format(evt, roll, pitch, yaw))
 
     ########################################################################
 
     #queueHandler
+    #blocks until the predictor sends something, direct control frames
+    #are bytes, gesture events are lists
     def queueHandler(self,cf):
         self.flag = False
         self.land = True
-        lastgesture ='undefined'
-        counterstill = 0
+        #last gesture per device address (None for a single predictor)
+        self.lastgestures = {}
+        self.counterstill = 0
         while True:
-            if not self.gesture_input_queue.empty():
-                    data = self.gesture_input_queue.get()
-                    if (data[0][1] != 'none') and (data[0][0] == 'early'):
-                        if lastgesture != data[0][1]:
-                            # observing gesture first time
-                            lastgesture = data[0][1]
-                            print("lastgesture: " + lastgesture + " state: " + self.stateMachine.state)
-                            if data[0][1] =='stillGesture':
-                                counterstill= counterstill +1
-                                if counterstill==3:
-                                    counterstill =0
-                                    self.stateMachine.all_retractions()
-                            if data[0][1]=='start':
-                                self.stateMachine.start(cf)
-                                self.land = False
-                            if data[0][1]=='startR':
-                                self.stateMachine.start_retraction()
-                            if data[0][1]=='land':
-                                self.stateMachine.land(cf)
-                                print(self.stateMachine.waypoints)
-                                self.land = True
-                            if data[0][1]=='landR':
-                                self.stateMachine.land_retraction()
-                            if data[0][1]=='wp_back':
-                                self.stateMachine.wp_back(cf)
-                            if data[0][1]=='wp_backR':
-                                self.stateMachine.wp_back_retraction()
-                            if data[0][1]=='wp_del':
-                                self.stateMachine.wp_del()
-                            if data[0][1]=='wp_next':
-                                self.stateMachine.wp_next(cf)
-                            if data[0][1]=='wp_nextR':
-                                self.stateMachine.wp_next_retraction()
-                            if data[0][1]=='wp_set':
-                                self.stateMachine.wp_set(self.position)
-                    self.gesture_input_queue.task_done()
-            if not self.direct_control_queue.empty():
-                    data = self.direct_control_queue.get()
-                    self.unpackDirectControFormat(data)
-                    if self.land:
-                        cf.high_level_commander.takeoff(0.3, 0.6)
-                        print("takeoff")
-                        self.land =False
-                    if(self.evt==2 and self.flag ==False):
-                        cf.high_level_commander.go_to(0.0, 0.1, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("right")
-                        self.flag = True
-                    if (self.evt == 1 and self.flag ==False):
-                        cf.high_level_commander.go_to(0.0, -0.1, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("left")
-                        self.flag = True
-                    if (self.evt == 4 and self.flag ==False):
-                        cf.high_level_commander.go_to(-0.1, 0.0, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("back")
-                        self.flag = True
-                    if (self.evt == 8 and self.flag ==False):
-                        cf.high_level_commander.go_to(0.1,0.0,0.0,0.0,duration_s=0.1,relative=True)
-                        print("forward")
-                        self.flag = True
-                    if (self.evt == 5 and self.flag ==False):
-                        cf.high_level_commander.go_to(-0.1, 0.1, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("back_right")
-                        self.flag = True
-                    if (self.evt == 6 and self.flag ==False):
-                        self.flag = True
-                        cf.high_level_commander.go_to(-0.1, -0.1, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("back_left")
-                        self.flag = True
-                    if (self.evt == 9 and self.flag ==False):
-                        cf.high_level_commander.go_to(0.1, 0.1, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("forward_right")
-                        self.flag = True
-                    if (self.evt == 10 and self.flag ==False):
-                        self.flag = True
-                        cf.high_level_commander.go_to(0.1, 0.0, 0.0, 0.0, duration_s=0.1, relative=True)
-                        print("forward_left")
-                    if(self.evt ==0 and self.flag == True):
-                        self.flag = False
-                    if (self.b3==1.0):
-                        cf.high_level_commander.go_to(0, 0, 0.1, 0.0, duration_s=0.1, relative=True)
-                        print("up")
-                    if (self.b2==1.0):
-                        cf.high_level_commander.go_to(0, 0, -0.1, 0.0, duration_s=0.1, relative=True)
-                        print("down")
-                    if (self.b1 ==1.0):
-                        self.stateMachine.land_action(cf)
-                        print(self.stateMachine.waypoints)
-                        break
-                    self.direct_control_queue.task_done()
+            try:
+                data = self.input_queue.get(timeout=WAKEUP_INTERVAL)
+            except queue.Empty:
+                self.monitor.count('idle wakeups')
+                continue
+            dequeued = time.monotonic_ns()
+            self.monitor.gauge('input queue depth', self.input_queue.qsize())
+            if isinstance(data, (bytes, bytearray)):
+                if not self.handleDirectControl(cf, data, dequeued):
+                    break
+            else:
+                self.handleGesture(cf, data, dequeued)
+            self.input_queue.task_done()
+
+    #gesture mode, data is [pred, buttons, frame stamp, decision stamp, address]
+    def handleGesture(self, cf, data, dequeued):
+        if len(data) > 3:
+            self.monitor.record_since('predictor->application', data[3], dequeued)
+        address = data[4] if len(data) > 4 else None
+        if (data[0][1] != 'none') and (data[0][0] == 'early'):
+            if self.lastgestures.get(address, 'undefined') != data[0][1]:
+                # observing gesture first time
+                lastgesture = self.lastgestures[address] = data[0][1]
+                if address is None:
+                    print("lastgesture: " + lastgesture + " state: " + self.stateMachine.state)
+                else:
+                    print("lastgesture: " + lastgesture + " device: " + address + " state: " + self.stateMachine.state)
+                if data[0][1] =='stillGesture':
+                    self.counterstill= self.counterstill +1
+                    if self.counterstill==3:
+                        self.counterstill =0
+                        self.stateMachine.all_retractions()
+                if data[0][1]=='start':
+                    self.stateMachine.start(cf)
+                    self.land = False
+                if data[0][1]=='startR':
+                    self.stateMachine.start_retraction()
+                if data[0][1]=='land':
+                    self.stateMachine.land(cf)
+                    print(self.stateMachine.waypoints)
+                    self.land = True
+                if data[0][1]=='landR':
+                    self.stateMachine.land_retraction()
+                if data[0][1]=='wp_back':
+                    self.stateMachine.wp_back(cf)
+                if data[0][1]=='wp_backR':
+                    self.stateMachine.wp_back_retraction()
+                if data[0][1]=='wp_del':
+                    self.stateMachine.wp_del()
+                if data[0][1]=='wp_next':
+                    self.stateMachine.wp_next(cf)
+                if data[0][1]=='wp_nextR':
+                    self.stateMachine.wp_next_retraction()
+                if data[0][1]=='wp_set':
+                    self.stateMachine.wp_set(self.position)
+                self.monitor.record_since('gesture dispatch', dequeued)
+                if len(data) > 2:
+                    self.monitor.record_since('ble->command', data[2])
+
+    #direct control mode, returns False if the flight was ended with button 1
+    def handleDirectControl(self, cf, data, dequeued):
+        self.unpackDirectControFormat(data)
+        if self.land:
+            cf.high_level_commander.takeoff(0.3, 0.6)
+            print("takeoff")
+            self.land =False
+        if(self.evt==2 and self.flag ==False):
+            cf.high_level_commander.go_to(0.0, 0.1, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("right")
+            self.flag = True
+        if (self.evt == 1 and self.flag ==False):
+            cf.high_level_commander.go_to(0.0, -0.1, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("left")
+            self.flag = True
+        if (self.evt == 4 and self.flag ==False):
+            cf.high_level_commander.go_to(-0.1, 0.0, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("back")
+            self.flag = True
+        if (self.evt == 8 and self.flag ==False):
+            cf.high_level_commander.go_to(0.1,0.0,0.0,0.0,duration_s=0.1,relative=True)
+            print("forward")
+            self.flag = True
+        if (self.evt == 5 and self.flag ==False):
+            cf.high_level_commander.go_to(-0.1, 0.1, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("back_right")
+            self.flag = True
+        if (self.evt == 6 and self.flag ==False):
+            self.flag = True
+            cf.high_level_commander.go_to(-0.1, -0.1, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("back_left")
+            self.flag = True
+        if (self.evt == 9 and self.flag ==False):
+            cf.high_level_commander.go_to(0.1, 0.1, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("forward_right")
+            self.flag = True
+        if (self.evt == 10 and self.flag ==False):
+            self.flag = True
+            cf.high_level_commander.go_to(0.1, 0.0, 0.0, 0.0, duration_s=0.1, relative=True)
+            print("forward_left")
+        if(self.evt ==0 and self.flag == True):
+            self.flag = False
+        if (self.b3==1.0):
+            cf.high_level_commander.go_to(0, 0, 0.1, 0.0, duration_s=0.1, relative=True)
+            print("up")
+        if (self.b2==1.0):
+            cf.high_level_commander.go_to(0, 0, -0.1, 0.0, duration_s=0.1, relative=True)
+            print("down")
+        if (self.b1 ==1.0):
+            self.stateMachine.land_action(cf)
+            print(self.stateMachine.waypoints)
+            return False
+        self.monitor.record_since('direct control dispatch', dequeued)
+        return True
 
     def position_callback(self,timestamp, data, logconf):
         x = data['kalman.stateX']
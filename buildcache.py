@@ -0,0 +1,134 @@
+#################################################################################
+# Build cache
+#
+# Manifest of the preprocessing pipeline. Every output file of a stage
+# (./data/preprocessed/<file>, ./data/merged/<file>) is recorded with the key
+# of its inputs and the hash of its content. The key is a hash over the
+# content of the input files, the parameters of the stage and the version of
+# the pipeline code (a hash of the source of the functions of the stage, see
+# code_version). A stage is skipped if the key did not change and the
+# output file still has the recorded content. An output folder (e.g. a
+# .dataset, see dataset.py) is hashed over the names and the content of its
+# files.
+#
+# The manifest is a JSON file:
+#
+#   {"preprocessed": {"land.csv": {"key": "...", "output": "..."}, ...},
+#    "merged": {"crazyFlyGestures.csv": {"key": "...", "output": "..."}},
+#    "dataset": {"crazyFlyGestures.dataset": {"key": "...", "output": "..."}}}
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import hashlib
+import inspect
+import json
+import os
+
+
+#################################################################################
+# hashing
+#
+
+def file_hash(path):
+    """
+    SHA-256 of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def path_hash(path):
+    """
+    SHA-256 of a file, or of the names and contents of the files in a
+    folder.
+    """
+    if not os.path.isdir(path):
+        return file_hash(path)
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        digest.update(json.dumps([name, path_hash(os.path.join(path, name))]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def code_version(*functions):
+    """
+    SHA-256 of the source code of the functions of a stage, every
+    change of the code gives a new version.
+    """
+    digest = hashlib.sha256()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def stage_key(input_hashes, parameters):
+    """
+    Key of a stage from the hashes of its inputs and its parameters.
+
+    Parameters
+    ----------
+    input_hashes : list of str
+        Content hashes of the input files, the order matters.
+    parameters : dict
+        JSON serializable parameters of the stage including the version
+        of the pipeline.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([input_hashes, parameters], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+#################################################################################
+# Manifest class
+#
+
+class Manifest:
+    """
+    Keys and output hashes of the stages of the pipeline.
+
+    Parameters
+    ----------
+    path : str
+        File name of the manifest, it is created by save().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def fresh(self, stage, name, key, output):
+        """
+        True if output was built from key and was not changed since.
+        """
+        entry = self.entries.get(stage, {}).get(name)
+        if entry is None or entry['key'] != key:
+            return False
+        if not os.path.exists(output):
+            return False
+        return path_hash(output) == entry['output']
+
+    def record(self, stage, name, key, output):
+        self.entries.setdefault(stage, {})[name] = {'key': key, 'output': path_hash(output)}
+
+    def output_hash(self, stage, name):
+        """
+        Recorded content hash of an output, None if it is unknown.
+        """
+        entry = self.entries.get(stage, {}).get(name)
+        return None if entry is None else entry['output']
+
+    def save(self):
+        #write and rename, an interrupted run keeps the old manifest
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
@@ -3,12 +3,9 @@
 
 from TwoWayComm import BTCommunication, LED_COLOR, LED_MODE, DIMENSION, USAGE, MODE
 import time
-from struct import unpack
+from framecodec import decode_2d, decode_3d
 
 
-TACTI_ACC_COMPRESSION = 819
-TACTI_GYRO_COMPRESSION = 32
-
 def myStreamCB(cHandle, data):
     """ callback for new fresh data
         on streaming characteristic
@@ -24,17 +21,11 @@ def myStreamCB(cHandle, data):
 def unpack2Dformat(data):
     global f
 
-    timestamp = unpack('H', data[0:2])[0]
-
-    accX = float(unpack('h', data[2:4])[0]) / TACTI_ACC_COMPRESSION
-    accY = float(unpack('h', data[4:6])[0]) / TACTI_ACC_COMPRESSION
+    timestamps, values, buttons = decode_2d(data, threshold=None)
 
-    gyroZ = float(unpack('h', data[6:8])[0]) / TACTI_GYRO_COMPRESSION
-    
-    b1 = float(unpack('b', data[14:15])[0])
-    b2 = float(unpack('b', data[15:16])[0])
-    b3 = float(unpack('b', data[16:17])[0])
-    b4 = float(unpack('b', data[17:18])[0])
+    timestamp = int(timestamps[0])
+    accX, accY, gyroZ = values[0].tolist()
+    b1, b2, b3, b4 = buttons[0].tolist()
     
     
     f.write("{0}, {1}, {2}, {3}, {4}\n".format(timestamp, accX, accY, gyroZ, b4))
@@ -54,20 +45,11 @@ def unpack3Dformat(data):
     """
     global f
     
-    timestamp = unpack('H', data[0:2])[0]
-    
-    accX = float(unpack('h', data[2:4])[0]) / TACTI_ACC_COMPRESSION
-    accY = float(unpack('h', data[4:6])[0]) / TACTI_ACC_COMPRESSION
-    accZ = float(unpack('h', data[6:8])[0]) / TACTI_ACC_COMPRESSION
-    
-    gyroX = float(unpack('h', data[8:10])[0]) / TACTI_GYRO_COMPRESSION
-    gyroY = float(unpack('h', data[10:12])[0]) / TACTI_GYRO_COMPRESSION
-    gyroZ = float(unpack('h', data[12:14])[0]) / TACTI_GYRO_COMPRESSION
-    
-    b1 = float(unpack('b', data[14:15])[0])
-    b2 = float(unpack('b', data[15:16])[0])
-    b3 = float(unpack('b', data[16:17])[0])
-    b4 = float(unpack('b', data[17:18])[0])
+    timestamps, values, buttons = decode_3d(data, threshold=None)
+
+    timestamp = int(timestamps[0])
+    accX, accY, accZ, gyroX, gyroY, gyroZ = values[0].tolist()
+    b1, b2, b3, b4 = buttons[0].tolist()
     
     
     f.write("{0}, {1}, {2}, {3}, {4}, {5}, {6}, {7}\n".format(timestamp, accX, accY, accZ, gyroX, gyroY, gyroZ, b4))
@@ -0,0 +1,176 @@
+#################################################################################
+# Binary dataset
+#
+# Preprocessed or merged training data as a folder <name>.dataset with
+#
+#   features.npy    float32 matrix, one row per gesture, one column per
+#                   feature (00_accX, 00_accY, ...)
+#   labels.npy      int16 vector, index of the category of each row
+#   schema.json     feature columns, categories and the number of rows
+#
+# The .npy files are loaded memory mapped, nothing is parsed and only the
+# pages that are used are read from disk.
+#
+# preprocessing.merge() writes the dataset of the merged .csv file as a
+# stage of the build cache (see buildcache.py). Convert other .csv files with
+#
+#   python dataset.py ./data/merged/crazyFlyGestures.csv
+#
+# which writes ./data/merged/crazyFlyGestures.dataset
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+DATASET_SUFFIX = '.dataset'
+SCHEMA_VERSION = 1
+
+FEATURES_FILE = 'features.npy'
+LABELS_FILE = 'labels.npy'
+SCHEMA_FILE = 'schema.json'
+
+
+#################################################################################
+# Dataset class
+#
+
+class Dataset:
+    """
+    Training data as feature matrix and label vector.
+
+    Attributes
+    ----------
+    features : ndarray of shape (rows, columns)
+        float32 features, a read only memory map for loaded datasets.
+    labels : ndarray of shape (rows,)
+        Index into categories for each row.
+    columns : list of str
+        Names of the feature columns.
+    categories : list of str
+        The categories of the gestures.
+    """
+    def __init__(self, features, labels, columns, categories):
+        self.features = features
+        self.labels = labels
+        self.columns = columns
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.labels)
+
+    def category_names(self):
+        """
+        The category of each row as an array of str.
+        """
+        return np.asarray(self.categories, dtype=object)[self.labels]
+
+    def to_dataframe(self):
+        """
+        DataFrame with the feature columns and the 'category' column
+        like the merged .csv files.
+        """
+        df = pd.DataFrame(np.asarray(self.features), columns=self.columns)
+        df['category'] = self.category_names()
+        return df
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Dataset of a preprocessed or merged DataFrame. Unnamed index
+        columns are removed.
+        """
+        df = df.drop(df.columns[df.columns.str.contains('unnamed', case=False)], axis=1)
+        columns = [c for c in df.columns if c != 'category']
+        labels = pd.Categorical(df['category'])
+        return cls(df[columns].to_numpy(dtype=np.float32), labels.codes.astype(np.int16),
+                   columns, [str(c) for c in labels.categories])
+
+
+#################################################################################
+# save and load
+#
+
+def save_dataset(path, dataset):
+    """
+    Write a dataset into the folder path (created if missing).
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, FEATURES_FILE), np.ascontiguousarray(dataset.features, dtype=np.float32))
+    np.save(os.path.join(path, LABELS_FILE), np.asarray(dataset.labels, dtype=np.int16))
+    schema = {'version': SCHEMA_VERSION,
+              'rows': len(dataset),
+              'columns': list(dataset.columns),
+              'categories': list(dataset.categories)}
+    with open(os.path.join(path, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=1)
+
+
+def load_dataset(path, mmap=True):
+    """
+    Load a dataset folder.
+
+    Parameters
+    ----------
+    path : str
+        The .dataset folder.
+    mmap : bool
+        Memory map the features and labels read only, otherwise they are
+        read into memory.
+
+    Returns
+    -------
+    Dataset
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    if schema['version'] != SCHEMA_VERSION:
+        raise ValueError('{} has schema version {}, expected {}'.format(path, schema['version'], SCHEMA_VERSION))
+
+    mode = 'r' if mmap else None
+    features = np.load(os.path.join(path, FEATURES_FILE), mmap_mode=mode)
+    labels = np.load(os.path.join(path, LABELS_FILE), mmap_mode=mode)
+    if features.shape != (schema['rows'], len(schema['columns'])) or len(labels) != schema['rows']:
+        raise ValueError('{} does not match its schema'.format(path))
+    return Dataset(features, labels, schema['columns'], schema['categories'])
+
+
+def convert(csv_file, output=None):
+    """
+    Convert a preprocessed or merged .csv file into a dataset.
+
+    Parameters
+    ----------
+    csv_file : str
+        The .csv file.
+    output : str or None
+        The dataset folder, None replaces .csv with .dataset.
+
+    Returns
+    -------
+    str
+        The dataset folder.
+    """
+    if output is None:
+        output = os.path.splitext(csv_file)[0] + DATASET_SUFFIX
+    df = pd.read_csv(csv_file, float_precision='legacy')
+    save_dataset(output, Dataset.from_dataframe(df))
+    return output
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert preprocessed or merged .csv files into binary datasets')
+    parser.add_argument('csv_files', nargs='+')
+    args = parser.parse_args()
+
+    for csv_file in args.csv_files:
+        print('{} -> {}'.format(csv_file, convert(csv_file)))
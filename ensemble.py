@@ -0,0 +1,239 @@
+#################################################################################
+# Fused one class classifier ensemble
+#
+# The gesture recognizer uses one MLPClassifier per gesture (one vs. rest).
+# Instead of calling predict_proba on every classifier, the weights of all
+# classifiers are stacked: the first layer of all networks is one wide matrix,
+# the following layers are stacked into an array of shape (classifiers,
+# inputs, outputs) and applied with one batched matmul, each classifier only
+# to its own part of the activations. A single forward pass then scores all
+# gestures at once. The stacked layers grow linearly with the number of
+# gestures, a block diagonal matrix of the same layer would be mostly zeros.
+# Classifiers with different hidden layer sizes get block diagonal matrices.
+#
+# Classifiers that can not be fused (e.g. the decision trees of
+# train_one_class_classifier_dct) are scored one after the other with
+# predict_proba by a ClassifierEnsemble, which has the same interface.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import numpy as np
+
+
+def logistic(x):
+    with np.errstate(over='ignore'):
+        return 1.0 / (1.0 + np.exp(-x))
+
+
+#hidden layer activations as used by sklearn.neural_network.MLPClassifier
+ACTIVATIONS = {
+    'identity': lambda x: x,
+    'logistic': logistic,
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0.0),
+}
+
+
+#################################################################################
+# FusedEnsemble class
+#
+
+class FusedEnsemble:
+    """
+    One forward pass for a list of binary MLPClassifiers.
+
+    Parameters
+    ----------
+    coefs : list of ndarray
+        Fused weights, one per layer. A 2D matrix is applied to all
+        activations, a 3D array of shape (classifiers, inputs, outputs)
+        holds the weights of every classifier for its own activations.
+    intercepts : list of ndarray
+        Fused bias vectors, one per layer.
+    invert : ndarray of bool
+        True for every classifier whose classes_ are [gesture, 'unknown'].
+        The network output is the probability of classes_[1], so for these
+        classifiers the gesture probability is 1 - output.
+    activation : str
+        Hidden layer activation, one of ACTIVATIONS.
+
+    Notes
+    -----
+    Use FusedEnsemble.from_classifiers() to build an ensemble from trained
+    models. The order of the scores is the order of the classifiers.
+    """
+    def __init__(self, coefs, intercepts, invert, activation='relu'):
+        self.coefs = coefs
+        self.intercepts = intercepts
+        self.invert = np.asarray(invert, dtype=bool)
+        self.activation = activation
+        self.hidden_activation = ACTIVATIONS[activation]
+        if len(coefs) > 0:
+            self.n_features = coefs[0].shape[0]
+            self.dtype = coefs[0].dtype
+        else:
+            self.n_features = 0
+            self.dtype = np.dtype(float)
+
+    @classmethod
+    def from_classifiers(cls, classifiers):
+        """
+        Stack the weights of trained binary MLPClassifiers.
+
+        Parameters
+        ----------
+        classifiers : list of MLPClassifier
+            One vs. rest classifiers with the classes [gesture, 'unknown']
+            in any order. All classifiers need the same number of layers,
+            input size and activation.
+
+        Returns
+        -------
+        FusedEnsemble
+        """
+        if len(classifiers) == 0:
+            return cls([], [], [])
+
+        if not all(can_fuse(clf) for clf in classifiers):
+            raise ValueError('only MLPClassifiers can be fused')
+        activation = classifiers[0].activation
+        n_layers = len(classifiers[0].coefs_)
+        for clf in classifiers:
+            if len(clf.classes_) != 2 or 'unknown' not in clf.classes_:
+                raise ValueError('only one class classifiers with an unknown class can be fused')
+            if clf.out_activation_ != 'logistic' or clf.activation != activation:
+                raise ValueError('all classifiers need the same activations')
+            if len(clf.coefs_) != n_layers or clf.coefs_[0].shape[0] != classifiers[0].coefs_[0].shape[0]:
+                raise ValueError('all classifiers need the same number of layers and inputs')
+
+        coefs = [np.hstack([clf.coefs_[0] for clf in classifiers])]
+        intercepts = [np.hstack([clf.intercepts_[0] for clf in classifiers])]
+        for layer in range(1, n_layers):
+            blocks = [clf.coefs_[layer] for clf in classifiers]
+            if all(block.shape == blocks[0].shape for block in blocks):
+                coefs.append(np.stack(blocks))
+            else:
+                coefs.append(block_diagonal(blocks))
+            intercepts.append(np.hstack([clf.intercepts_[layer] for clf in classifiers]))
+
+        invert = [clf.classes_[0] != 'unknown' for clf in classifiers]
+        return cls(coefs, intercepts, invert, activation)
+
+    def __len__(self):
+        return len(self.invert)
+
+    def scores(self, data):
+        """
+        Probabilities of the gesture classes.
+
+        Parameters
+        ----------
+        data : array_like of shape (n_samples, n_features)
+
+        Returns
+        -------
+        ndarray of shape (n_samples, n_classifiers)
+        """
+        x = np.asarray(data, dtype=self.dtype).reshape(-1, self.n_features)
+        last = len(self.coefs) - 1
+        for layer, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            if coef.ndim == 3:
+                x = stacked_matmul(x, coef)
+            else:
+                x = x @ coef
+            x += intercept
+            if layer != last:
+                x = self.hidden_activation(x)
+        output = logistic(x)
+        return np.where(self.invert, 1.0 - output, output)
+
+
+def can_fuse(classifier):
+    """
+    True if the classifier is a trained MLPClassifier.
+    """
+    return hasattr(classifier, 'coefs_') and hasattr(classifier, 'activation')
+
+
+#################################################################################
+# ClassifierEnsemble class
+#
+
+class ClassifierEnsemble:
+    """
+    predict_proba of every classifier, for one class classifiers that can
+    not be fused.
+
+    Parameters
+    ----------
+    classifiers : list
+        Trained one vs. rest classifiers with the classes [gesture,
+        'unknown'] in any order, e.g. DecisionTreeClassifiers.
+    """
+    def __init__(self, classifiers):
+        self.classifiers = list(classifiers)
+        #column of the gesture class in the output of predict_proba
+        self.columns = [int(np.where(clf.classes_ != 'unknown')[0][0]) for clf in self.classifiers]
+        self.dtype = np.dtype(float)
+        if len(self.classifiers) > 0:
+            first = self.classifiers[0]
+            self.n_features = getattr(first, 'n_features_in_', getattr(first, 'n_features_', 0))
+        else:
+            self.n_features = 0
+
+    def __len__(self):
+        return len(self.classifiers)
+
+    def scores(self, data):
+        """
+        Probabilities of the gesture classes.
+
+        Parameters
+        ----------
+        data : array_like of shape (n_samples, n_features)
+
+        Returns
+        -------
+        ndarray of shape (n_samples, n_classifiers)
+        """
+        x = np.asarray(data, dtype=self.dtype).reshape(-1, self.n_features)
+        return np.column_stack([clf.predict_proba(x)[:, column] for clf, column in zip(self.classifiers, self.columns)])
+
+
+def stacked_matmul(x, blocks):
+    """
+    Multiply the part of x of every classifier with its own weights.
+
+    Parameters
+    ----------
+    x : ndarray of shape (n_samples, classifiers * inputs)
+    blocks : ndarray of shape (classifiers, inputs, outputs)
+
+    Returns
+    -------
+    ndarray of shape (n_samples, classifiers * outputs)
+        The same as x @ block_diagonal(blocks).
+    """
+    n_samples = len(x)
+    classifiers, inputs, outputs = blocks.shape
+    parts = x.reshape(n_samples, classifiers, inputs).transpose(1, 0, 2)
+    return np.matmul(parts, blocks).transpose(1, 0, 2).reshape(n_samples, classifiers * outputs)
+
+
+def block_diagonal(blocks):
+    """
+    Place a list of 2D arrays on the diagonal of a zero matrix.
+    """
+    rows = sum(block.shape[0] for block in blocks)
+    cols = sum(block.shape[1] for block in blocks)
+    matrix = np.zeros((rows, cols), dtype=blocks[0].dtype)
+    r = c = 0
+    for block in blocks:
+        matrix[r:r + block.shape[0], c:c + block.shape[1]] = block
+        r += block.shape[0]
+        c += block.shape[1]
+    return matrix
@@ -0,0 +1,267 @@
+#################################################################################
+# Frame codec
+#
+# Describes the 20 byte dataframes of the Tactigon as numpy structured dtypes.
+# A single frame (bytes from the BLE callback) or a whole batch of frames
+# (e.g. a binary recording) is decoded in one call with np.frombuffer,
+# scaling and deadzoning are applied on whole columns.
+#
+# Application Mode 3D (mode == 1)
+#
+# -----------------------------------------------------------------------------------------------------
+# |  0  |  1  | 2 | 3 | 4 | 5 | 6 | 7 | 8 | 9 | 10 | 11 | 12 | 13 | 14 | 15 | 16 | 17 |   18   |  19  |
+# -----------------------------------------------------------------------------------------------------
+# | timestamp | accX  | accY  | accZ  | gyroX |  gyroY  |  gyroZ  | b1 | b2 | b3 | b4 | unused | mode |
+# -----------------------------------------------------------------------------------------------------
+#
+# Application Mode 2D (mode == 2)
+#
+# -----------------------------------------------------------------------------------------------------
+# |  0  |  1  | 2 | 3 | 4 | 5 | 6 | 7 | 8 | 9 | 10 | 11 | 12 | 13 | 14 | 15 | 16 | 17 |   18   |  19  |
+# -----------------------------------------------------------------------------------------------------
+# | timestamp | accX  | accY  | gyroZ |           unused          | b1 | b2 | b3 | b4 | unused | mode |
+# -----------------------------------------------------------------------------------------------------
+#
+# Direct Control Mode (mode == 3)
+#
+# ---------------------------------------------------------------------------------------------------------
+# |   0   | 1 | 2 | 3 | 4 | 5 | 6 | 7 | 8 | 9 | 10 | 11 | 12 |   13   | 14 | 15 | 16 | 17 |   18   |  19  |
+# ---------------------------------------------------------------------------------------------------------
+# | event |     roll      |     pitch     |        yaw       | unused | b1 | b2 | b3 | b4 | unused | mode |
+# ---------------------------------------------------------------------------------------------------------
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import numpy as np
+
+
+FRAME_SIZE = 20
+
+TACTI_ACC_COMPRESSION = 819
+TACTI_GYRO_COMPRESSION = 32
+
+#absolute acceleration and gyro values below the deadzone are set to zero
+DEADZONE = 0.5
+
+MODE_3D = 1
+MODE_2D = 2
+MODE_DIRECT_CONTROL = 3
+
+
+#################################################################################
+# frame layouts
+#
+# 'sensors', 'angles' and 'buttons' overlay the single fields, so a whole
+# block of a frame can be read with one column access
+#
+
+FRAME_3D = np.dtype({
+    'names': ['timestamp', 'accX', 'accY', 'accZ', 'gyroX', 'gyroY', 'gyroZ',
+              'b1', 'b2', 'b3', 'b4', 'mode', 'sensors', 'buttons'],
+    'formats': ['<u2', '<i2', '<i2', '<i2', '<i2', '<i2', '<i2',
+                'i1', 'i1', 'i1', 'i1', 'u1', ('<i2', (6,)), ('i1', (4,))],
+    'offsets': [0, 2, 4, 6, 8, 10, 12, 14, 15, 16, 17, 19, 2, 14],
+    'itemsize': FRAME_SIZE})
+
+FRAME_2D = np.dtype({
+    'names': ['timestamp', 'accX', 'accY', 'gyroZ',
+              'b1', 'b2', 'b3', 'b4', 'mode', 'sensors', 'buttons'],
+    'formats': ['<u2', '<i2', '<i2', '<i2',
+                'i1', 'i1', 'i1', 'i1', 'u1', ('<i2', (3,)), ('i1', (4,))],
+    'offsets': [0, 2, 4, 6, 14, 15, 16, 17, 19, 2, 14],
+    'itemsize': FRAME_SIZE})
+
+FRAME_DIRECT_CONTROL = np.dtype({
+    'names': ['event', 'roll', 'pitch', 'yaw',
+              'b1', 'b2', 'b3', 'b4', 'mode', 'angles', 'buttons'],
+    'formats': ['u1', '<f4', '<f4', '<f4',
+                'i1', 'i1', 'i1', 'i1', 'u1', ('<f4', (3,)), ('i1', (4,))],
+    'offsets': [0, 1, 5, 9, 14, 15, 16, 17, 19, 1, 14],
+    'itemsize': FRAME_SIZE})
+
+#divisors of the sensor columns
+SCALE_3D = np.array([TACTI_ACC_COMPRESSION] * 3 + [TACTI_GYRO_COMPRESSION] * 3, dtype=float)
+SCALE_2D = np.array([TACTI_ACC_COMPRESSION] * 2 + [TACTI_GYRO_COMPRESSION], dtype=float)
+
+
+#################################################################################
+# decoding
+#
+
+def frames(data, layout):
+    """
+    View one or more dataframes as a structured array.
+
+    Parameters
+    ----------
+    data : bytes, bytearray, memoryview or ndarray
+        One frame or several frames of FRAME_SIZE bytes each.
+    layout : numpy.dtype
+        FRAME_3D, FRAME_2D or FRAME_DIRECT_CONTROL
+
+    Returns
+    -------
+    ndarray
+        Structured array with one record per frame. No data is copied.
+    """
+    return np.frombuffer(data, dtype=layout)
+
+
+def decode_3d(data, threshold=DEADZONE):
+    """
+    Decode 3D application frames.
+
+    Parameters
+    ----------
+    data : bytes, bytearray, memoryview or ndarray
+        One frame or several frames of FRAME_SIZE bytes each.
+    threshold : float or None
+        Absolute values below or equal to threshold are set to zero.
+        None disables the deadzone.
+
+    Returns
+    -------
+    timestamps : ndarray of shape (n,)
+    values : ndarray of shape (n, 6)
+        accX, accY, accZ, gyroX, gyroY, gyroZ
+    buttons : ndarray of shape (n, 4)
+        b1, b2, b3, b4 as float
+    """
+    records = frames(data, FRAME_3D)
+    return records['timestamp'], _scale(records['sensors'], SCALE_3D, threshold), records['buttons'].astype(float)
+
+
+def decode_2d(data, threshold=DEADZONE):
+    """
+    Decode 2D application frames.
+
+    Parameters
+    ----------
+    data : bytes, bytearray, memoryview or ndarray
+        One frame or several frames of FRAME_SIZE bytes each.
+    threshold : float or None
+        Absolute values below or equal to threshold are set to zero.
+        None disables the deadzone.
+
+    Returns
+    -------
+    timestamps : ndarray of shape (n,)
+    values : ndarray of shape (n, 3)
+        accX, accY, gyroZ
+    buttons : ndarray of shape (n, 4)
+        b1, b2, b3, b4 as float
+    """
+    records = frames(data, FRAME_2D)
+    return records['timestamp'], _scale(records['sensors'], SCALE_2D, threshold), records['buttons'].astype(float)
+
+
+def frame_timestamp(data):
+    """
+    Timestamp of a single 3D or 2D application frame.
+
+    Parameters
+    ----------
+    data : bytes, bytearray or memoryview
+        One frame of FRAME_SIZE bytes.
+
+    Returns
+    -------
+    int
+        The 16 bit frame counter of the Tactigon.
+    """
+    return data[0] | data[1] << 8
+
+
+def decode_direct_control(data):
+    """
+    Decode direct control frames.
+
+    Parameters
+    ----------
+    data : bytes, bytearray, memoryview or ndarray
+        One frame or several frames of FRAME_SIZE bytes each.
+
+    Returns
+    -------
+    events : ndarray of shape (n,)
+    angles : ndarray of shape (n, 3)
+        roll, pitch, yaw
+    buttons : ndarray of shape (n, 4)
+        b1, b2, b3, b4 as float
+    """
+    records = frames(data, FRAME_DIRECT_CONTROL)
+    return records['event'], records['angles'].astype(float), records['buttons'].astype(float)
+
+
+def _scale(raw, scale, threshold):
+    values = raw / scale
+    if threshold is not None:
+        values[np.abs(values) <= threshold] = 0.0
+    return values
+
+
+#################################################################################
+# encoding
+#
+# Inverse of the decoding, used to turn recorded .csv sessions back into
+# frames. Values are scaled with the compression factors and rounded, so
+# values that were decoded from frames are encoded into the same bytes.
+#
+
+def encode_3d(timestamps, values, buttons=None, mode=MODE_3D):
+    """
+    Encode samples into 3D application frames.
+
+    Parameters
+    ----------
+    timestamps : array_like of shape (n,)
+    values : array_like of shape (n, 6)
+        accX, accY, accZ, gyroX, gyroY, gyroZ
+    buttons : array_like of shape (n, 4) or None
+        b1, b2, b3, b4, None sets all buttons to zero.
+    mode : int
+        Value of the mode byte.
+
+    Returns
+    -------
+    bytes
+        n frames of FRAME_SIZE bytes.
+    """
+    return _encode(FRAME_3D, SCALE_3D, timestamps, values, buttons, mode)
+
+
+def encode_2d(timestamps, values, buttons=None, mode=MODE_2D):
+    """
+    Encode samples into 2D application frames.
+
+    Parameters
+    ----------
+    timestamps : array_like of shape (n,)
+    values : array_like of shape (n, 3)
+        accX, accY, gyroZ
+    buttons : array_like of shape (n, 4) or None
+        b1, b2, b3, b4, None sets all buttons to zero.
+    mode : int
+        Value of the mode byte.
+
+    Returns
+    -------
+    bytes
+        n frames of FRAME_SIZE bytes.
+    """
+    return _encode(FRAME_2D, SCALE_2D, timestamps, values, buttons, mode)
+
+
+def _encode(layout, scale, timestamps, values, buttons, mode):
+    values = np.asarray(values, dtype=float)
+    records = np.zeros(len(values), dtype=layout)
+    records['timestamp'] = np.asarray(timestamps).astype(np.int64) & 0xffff
+    records['sensors'] = np.clip(np.round(values * scale), -32768, 32767)
+    if buttons is not None:
+        records['buttons'] = buttons
+    records['mode'] = mode
+    return records.tobytes()
@@ -0,0 +1,280 @@
+#################################################################################
+# Shared memory frame ring
+#
+# Single producer / single consumer ring buffer in multiprocessing.shared_memory
+# for the raw 20 byte frames of the BLE callback. The producer (BLE callback
+# thread in the main process) only writes the head index, the consumer
+# (Predictor process) only writes the tail index, so producer and consumer do
+# not share a lock. Frames are copied into a slot, nothing is pickled. Every slot also holds the
+# time.monotonic_ns() stamp of the put() call and an optional 8 byte tag
+# (e.g. the address of the device), the consumer finds stamp and tag of the
+# last frame in FrameRing.stamp and FrameRing.tag.
+#
+# Shared memory layout
+#
+# --------------------------------------------------------------------------------------------------
+# | head | tail | written | dropped | overruns | waiting | unused | stamps ... | tags ... | slots ... |
+# --------------------------------------------------------------------------------------------------
+#   8 byte unsigned counters, one 8 byte stamp and one 8 byte tag per slot
+#   starting at offset 64, slots of frame_size bytes after the tags
+#
+# A full ring drops the newest frame. Every dropped frame is counted, every
+# transition from a free ring into a full ring is counted as an overrun.
+#
+# The consumer blocks on a multiprocessing.Event if the ring is empty. The
+# producer only sets the event if the consumer announced that it is waiting,
+# the consumer never waits longer than WAKEUP_INTERVAL without checking the
+# ring again, which bounds the latency of a missed wake up. An idle consumer
+# therefore wakes up every WAKEUP_INTERVAL.
+#
+# What the ring does and does not guarantee:
+#
+#   - One producer and one consumer. put() must not be called from two
+#     threads at the same time, neither get(). PredictorPool holds a
+#     threading.Lock per ring around put(), because the notification threads
+#     of several devices share a worker. Every other user of a ring has to
+#     serialize its producers the same way.
+#   - put() is not lock-free: if the consumer is waiting, it sets the
+#     multiprocessing.Event, which takes the lock of the event and makes a
+#     system call.
+#   - The counters are aligned 8 byte stores into the shared memory (single
+#     stores on 64 bit CPUs), without atomic operations or memory barriers.
+#     The producer writes the slot before it advances head, the consumer
+#     reads head before the slot. That the consumer sees the slot once it
+#     sees the new head relies on the CPU keeping stores in order (x86 does)
+#     and on the interpreter work between the stores. It is not guaranteed
+#     by Python or on weakly ordered CPUs (e.g. ARM).
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+
+HEAD = 0
+TAIL = 1
+WRITTEN = 2
+DROPPED = 3
+OVERRUNS = 4
+WAITING = 5
+
+HEADER_SIZE = 64
+
+#longest time the consumer sleeps without looking at the ring
+WAKEUP_INTERVAL = 0.01
+
+
+#################################################################################
+# FrameRing class
+#
+
+class FrameRing:
+    """
+    Shared memory ring for fixed size frames.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of frames the ring can hold.
+    frame_size : int
+        Size of one frame in bytes.
+
+    Notes
+    -----
+    The ring offers the part of the JoinableQueue interface used by the
+    predictors (put, get, task_done, qsize, empty), so it can replace the
+    wrapper to predictor queue. Only one thread may put and only one
+    thread may get at a time, see the ordering notes above.
+    """
+    def __init__(self, capacity=1024, frame_size=20):
+        self.capacity = capacity
+        self.frame_size = frame_size
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity * (16 + frame_size))
+        self.owner = True
+        self.event = multiprocessing.Event()
+        self._attach()
+        for i in range(len(self.counters)):
+            self.counters[i] = 0
+
+    def _attach(self):
+        tags = HEADER_SIZE + self.capacity * 8
+        slots = tags + self.capacity * 8
+        self.counters = self.shm.buf[:HEADER_SIZE].cast('Q')
+        self.stamps = self.shm.buf[HEADER_SIZE:tags].cast('Q')
+        self.tags = self.shm.buf[tags:slots].cast('Q')
+        self.slots = self.shm.buf[slots:slots + self.capacity * self.frame_size]
+        self.full = False
+        self.stamp = None
+        self.tag = 0
+
+    #the shared memory is attached by name if the ring is sent to a
+    #process that is not forked
+    def __getstate__(self):
+        return {'name': self.shm.name, 'capacity': self.capacity,
+                'frame_size': self.frame_size, 'event': self.event}
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.frame_size = state['frame_size']
+        self.event = state['event']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.owner = False
+        self._attach()
+
+    def put(self, data, stamp=None, tag=0):
+        """
+        Copy a frame into the ring (producer side).
+
+        Parameters
+        ----------
+        data : bytes
+            The frame.
+        stamp : int or None
+            time.monotonic_ns() of the arrival of the frame, None takes
+            the current time.
+        tag : int
+            Unsigned 64 bit value stored with the frame.
+
+        Returns
+        -------
+        bool
+            False if the ring was full and the frame was dropped.
+        """
+        if len(data) != self.frame_size:
+            raise ValueError('frame size must be {} bytes'.format(self.frame_size))
+
+        counters = self.counters
+        head = counters[HEAD]
+        if head - counters[TAIL] >= self.capacity:
+            counters[DROPPED] += 1
+            if not self.full:
+                self.full = True
+                counters[OVERRUNS] += 1
+            return False
+
+        self.full = False
+        slot = head % self.capacity
+        self.stamps[slot] = time.monotonic_ns() if stamp is None else stamp
+        self.tags[slot] = tag
+        offset = slot * self.frame_size
+        self.slots[offset:offset + self.frame_size] = data
+        counters[HEAD] = head + 1
+        counters[WRITTEN] += 1
+
+        if counters[WAITING]:
+            self.event.set()
+        return True
+
+    def get(self, block=True, timeout=None):
+        """
+        Take the oldest frame out of the ring (consumer side).
+
+        Parameters
+        ----------
+        block : bool
+            Wait for a frame if the ring is empty.
+        timeout : float or None
+            Longest time to wait, None waits forever.
+
+        Returns
+        -------
+        bytes
+            The frame.
+
+        Raises
+        ------
+        queue.Empty
+            If no frame arrived in time.
+        """
+        counters = self.counters
+        deadline = None
+        while True:
+            tail = counters[TAIL]
+            if counters[HEAD] != tail:
+                slot = tail % self.capacity
+                self.stamp = self.stamps[slot]
+                self.tag = self.tags[slot]
+                offset = slot * self.frame_size
+                data = bytes(self.slots[offset:offset + self.frame_size])
+                counters[TAIL] = tail + 1
+                return data
+
+            if not block:
+                raise queue.Empty
+
+            wait = WAKEUP_INTERVAL
+            if timeout is not None:
+                if deadline is None:
+                    deadline = time.monotonic() + timeout
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    raise queue.Empty
+
+            #announce the wait and check the ring again, a frame that was
+            #written in between is picked up without sleeping
+            counters[WAITING] = 1
+            if counters[HEAD] == tail:
+                self.event.wait(wait)
+            self.event.clear()
+            counters[WAITING] = 0
+
+    def renew_event(self):
+        """
+        Replace the wake up event (producer side), e.g. before a new consumer
+        takes over from a consumer process that was killed while it held
+        the lock of the event.
+        """
+        self.event = multiprocessing.Event()
+        self.counters[WAITING] = 0
+
+    def task_done(self):
+        #frames are consumed by get(), nothing to acknowledge
+        pass
+
+    def qsize(self):
+        return self.counters[HEAD] - self.counters[TAIL]
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def stats(self):
+        """
+        Counters of the ring.
+
+        Returns
+        -------
+        dict
+            written, dropped and overruns since creation and the current depth.
+        """
+        return {'written': self.counters[WRITTEN],
+                'dropped': self.counters[DROPPED],
+                'overruns': self.counters[OVERRUNS],
+                'depth': self.qsize()}
+
+    def close(self):
+        """
+        Release the shared memory, the creating process also unlinks it.
+        """
+        self._release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            self.owner = False
+
+    #the views must be released before the shared memory is closed,
+    #otherwise SharedMemory.__del__ fails with exported pointers
+    def _release(self):
+        self.counters.release()
+        self.stamps.release()
+        self.tags.release()
+        self.slots.release()
+
+    def __del__(self):
+        if hasattr(self, 'slots'):
+            self._release()
@@ -0,0 +1,222 @@
+#################################################################################
+# Latency instrumentation
+#
+# Every process of the gesture recognizer keeps a LatencyMonitor with one
+# histogram per stage of the pipeline, a set of gauges (e.g. queue depths)
+# and a set of counters (e.g. skipped classifier calls).
+# Timestamps are taken with time.monotonic_ns(), which is the system wide
+# monotonic clock on Linux, so stamps taken in the BLE callback can be
+# compared with stamps taken in the Predictor or Application process.
+#
+# The report of a process is printed periodically (interval) or on demand
+# by sending SIGUSR1 to the process:
+#
+#   kill -USR1 <pid>
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import signal
+import threading
+import time
+
+
+#values below 2^SUB_BITS microseconds are counted exactly, above that every
+#power of two is split into 2^SUB_BITS buckets (about 3% resolution)
+SUB_BITS = 5
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_SHIFT = 40
+
+#percentiles shown in the report
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+#################################################################################
+# LatencyHistogram class
+#
+# HDR style histogram with log-linear buckets over microseconds
+#
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * ((MAX_SHIFT + 2) * SUB_BUCKETS)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        self.record_us(int(seconds * 1e6))
+
+    def record_us(self, value):
+        if value < 0:
+            value = 0
+        self.buckets[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Upper bound of the bucket that contains the given percentile in us.
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, int(round(percent / 100.0 * self.count)))
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bucket_value(index + 1) - 1, self.max)
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def summary(self):
+        """
+        Count, min, mean, percentiles and max in milliseconds.
+        """
+        summary = {'count': self.count,
+                   'min': (self.min or 0) / 1000.0,
+                   'mean': self.mean() / 1000.0,
+                   'max': self.max / 1000.0}
+        for percent in PERCENTILES:
+            summary['p{:g}'.format(percent)] = self.percentile(percent) / 1000.0
+        return summary
+
+    def reset(self):
+        self.__init__()
+
+
+def bucket_index(value):
+    shift = max(0, value.bit_length() - SUB_BITS - 1)
+    if shift > MAX_SHIFT:
+        return (MAX_SHIFT + 2) * SUB_BUCKETS - 1
+    return shift * SUB_BUCKETS + (value >> shift)
+
+
+def bucket_value(index):
+    #lowest value of a bucket
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return (index - shift * SUB_BUCKETS) << shift
+
+
+#################################################################################
+# LatencyMonitor class
+#
+# Per process collection of stage histograms and gauges
+#
+
+class LatencyMonitor:
+    def __init__(self, name, output=print):
+        self.name = name
+        self.output = output
+        self.stages = {}
+        self.gauges = {}
+        self.counters = {}
+        #reentrant, the SIGUSR1 handler may interrupt record_ns in the same thread
+        self.lock = threading.RLock()
+        self.timer = None
+
+    #lock and timer thread are not sent to spawned processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['timer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def record(self, stage, seconds):
+        self.record_ns(stage, int(seconds * 1e9))
+
+    def record_ns(self, stage, nanoseconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.record_us(nanoseconds // 1000)
+
+    def record_since(self, stage, stamp, now=None):
+        """
+        Record the time from a time.monotonic_ns() stamp until now.
+        Nothing is recorded if stamp is None.
+        """
+        if stamp is None:
+            return
+        if now is None:
+            now = time.monotonic_ns()
+        self.record_ns(stage, now - stamp)
+
+    def gauge(self, name, value):
+        """
+        Set a gauge, the report shows the last, the min and the max value.
+        """
+        with self.lock:
+            last, low, high = self.gauges.get(name, (value, value, value))
+            self.gauges[name] = (value, min(low, value), max(high, value))
+
+    def count(self, name, n=1):
+        """
+        Add n to a counter.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self.lock:
+            return {'stages': {stage: h.summary() for stage, h in self.stages.items()},
+                    'gauges': {name: {'last': g[0], 'min': g[1], 'max': g[2]} for name, g in self.gauges.items()},
+                    'counters': dict(self.counters)}
+
+    def report(self):
+        snapshot = self.snapshot()
+        lines = ['latency report {} (ms)'.format(self.name)]
+        for stage, s in snapshot['stages'].items():
+            lines.append('  {:<28} n={:<8} min={:.3f} mean={:.3f} p50={:.3f} p90={:.3f} p99={:.3f} p99.9={:.3f} max={:.3f}'.format(
+                stage, s['count'], s['min'], s['mean'], s['p50'], s['p90'], s['p99'], s['p99.9'], s['max']))
+        for name, g in snapshot['gauges'].items():
+            lines.append('  {:<28} last={} min={} max={}'.format(name, g['last'], g['min'], g['max']))
+        for name, n in snapshot['counters'].items():
+            lines.append('  {:<28} {}'.format(name, n))
+        return '\n'.join(lines)
+
+    def dump(self, *args):
+        self.output(self.report())
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.gauges = {}
+            self.counters = {}
+
+    def start(self, interval):
+        """
+        Dump the report every interval seconds from a daemon thread.
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                self.dump()
+        self.timer = threading.Thread(target=run, daemon=True)
+        self.timer.start()
+
+    def install_signal_handler(self, signum=signal.SIGUSR1):
+        """
+        Dump the report when the process receives signum.
+        Must be called from the main thread of the process.
+        """
+        signal.signal(signum, self.dump)
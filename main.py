@@ -7,9 +7,10 @@
 # In here the Bluetooth Low Energy (BLE) Communication to the Tactigon will be
 # initialized. The callback of the streaming Characteristic is implemented in
 # the myStreamCB() function and passed to the Tactigon-Wrapper.
-# Also the predictor process and the application process will be initialized
-# and started in here. The predictor and the application processes communicate
-# over queues which are created here.
+# Also the predictor processes and the application process will be initialized
+# and started in here. Every connected Tactigon gets its own predictor (window
+# and state machine) in a pool of predictor processes. The predictors and the
+# application process communicate over queues which are created here.
 # The trained models for the gesture recognizer must be loaded here and then
 # be passed to the predictor process.
 #
@@ -19,20 +20,15 @@
 # needed imports
 #
 
-import struct
-import binascii
-import pandas as pd
-import numpy as np
-import math
-import itertools
-from sklearn.neural_network import MLPClassifier
-from predictor import Data3D
-from predictor import Predictor
-#from FakePredictor import Predictor
+import atexit
+import functools
+from predictorpool import PredictorPool, PredictorWorker
+#the workers of the pool simulate the gestures with the keyboard
+#from FakePredictor import Predictor as PredictorWorker
 from multiprocessing import JoinableQueue
 from application import Application
-
-from joblib import load
+from modelbundle import load_bundle
+from supervisor import Supervisor
 
 from TwoWayComm import BTCommunication, LED_COLOR, LED_MODE, DIMENSION, USAGE, MODE, GNORM
 import time
@@ -44,72 +40,57 @@ TACTI_GYRO_COMPRESSION = 32
 #################################################################################
 # load trained models
 #
+# The early (20 timestamps) and validation (40 timestamps) models of a gesture
+# set are stored in a single memory mapped bundle. Rebuild the bundle after
+# training new .joblib models with
+#
+#   python modelbundle.py ./models/crazyFlyGestures ./models/crazyFlyGestures.bundle
+#       start startR land landR wp_back wp_backR wp_del wp_next wp_nextR wp_set stillGesture
+#
 
-#early predictors
-start_clf_20 = load('./models/crazyFlyGestures/start_nn_20.joblib')
-startR_clf_20 = load('./models/crazyFlyGestures/startR_nn_20.joblib')
-land_clf_20 = load('./models/crazyFlyGestures/land_nn_20.joblib')
-landR_clf_20 = load('./models/crazyFlyGestures/landR_nn_20.joblib')
-wp_back_clf_20 = load('./models/crazyFlyGestures/wp_back_nn_20.joblib')
-wp_backR_clf_20 = load('./models/crazyFlyGestures/wp_backR_nn_20.joblib')
-wp_del_clf_20 = load('./models/crazyFlyGestures/wp_del_nn_20.joblib')
-wp_next_clf_20 = load('./models/crazyFlyGestures/wp_next_nn_20.joblib')
-wp_nextR_clf_20 = load('./models/crazyFlyGestures/wp_nextR_nn_20.joblib')
-wp_set_clf_20 = load('./models/crazyFlyGestures/wp_set_nn_20.joblib')
-stillGesture_clf_20 = load('./models/crazyFlyGestures/stillGesture_nn_20.joblib')
-
-#moveDown_clf_20 = load('./models/crazyFlyGestures/moveDown_nn_20.joblib')
-#moveUp_clf_20 = load('./models/crazyFlyGestures/moveUp_nn_20.joblib')
-#pullUp_clf_20 = load('./models/crazyFlyGestures/pullUp_nn_20.joblib')
-#swingAndPointForward_clf_20 = load('./models/crazyFlyGestures/swingAndPointForward_nn_20.joblib')
-#rotateLeft_clf_20 = load('./models/crazyFlyGestures/rotateLeft_nn_20.joblib')
-#rotateRight_clf_20 = load('./models/crazyFlyGestures/rotateRight_nn_20.joblib')
-#stillGesture_clf_20 = load('./models/crazyFlyGestures/stillGesture_nn_20.joblib')
-
-#validation predictores
-start_clf_40 = load('./models/crazyFlyGestures/start_nn_40.joblib')
-startR_clf_40 = load('./models/crazyFlyGestures/startR_nn_40.joblib')
-land_clf_40 = load('./models/crazyFlyGestures/land_nn_40.joblib')
-landR_clf_40 = load('./models/crazyFlyGestures/landR_nn_40.joblib')
-wp_back_clf_40 = load('./models/crazyFlyGestures/wp_back_nn_40.joblib')
-wp_backR_clf_40 = load('./models/crazyFlyGestures/wp_backR_nn_40.joblib')
-wp_del_clf_40 = load('./models/crazyFlyGestures/wp_del_nn_40.joblib')
-wp_next_clf_40 = load('./models/crazyFlyGestures/wp_next_nn_40.joblib')
-wp_nextR_clf_40 = load('./models/crazyFlyGestures/wp_nextR_nn_40.joblib')
-wp_set_clf_40 = load('./models/crazyFlyGestures/wp_set_nn_40.joblib')
-stillGesture_clf_40 = load('./models/crazyFlyGestures/stillGesture_nn_40.joblib')
-
-#moveDown_clf_40 = load('./models/crazyFlyGestures/moveDown_nn_40.joblib')
-#moveUp_clf_40 = load('./models/crazyFlyGestures/moveUp_nn_40.joblib')
-#pullUp_clf_40 = load('./models/crazyFlyGestures/pullUp_nn_40.joblib')
-#swingAndPointForward_clf_40 = load('./models/crazyFlyGestures/swingAndPointForward_nn_40.joblib')
-#rotateLeft_clf_40 = load('./models/crazyFlyGestures/rotateLeft_nn_40.joblib')
-#rotateRight_clf_40 = load('./models/crazyFlyGestures/rotateRight_nn_40.joblib')
-#stillGesture_clf_40 = load('./models/crazyFlyGestures/stillGesture_nn_40.joblib')
+bundle = load_bundle('./models/crazyFlyGestures.bundle')
+#bundle = load_bundle('./models/linMoves.bundle')
 
 #list of predictors
-earlyPredictors = [start_clf_20, startR_clf_20, land_clf_20, landR_clf_20, wp_back_clf_20 , wp_backR_clf_20, wp_del_clf_20, wp_next_clf_20, wp_nextR_clf_20, wp_set_clf_20,stillGesture_clf_20]
-validationPredictors = [start_clf_40, startR_clf_40, land_clf_40, landR_clf_40, wp_back_clf_40 , wp_backR_clf_40, wp_del_clf_40, wp_next_clf_40, wp_nextR_clf_40, wp_set_clf_40,stillGesture_clf_40]
-
-#earlyPredictors = [moveDown_clf_20, moveUp_clf_20, pullUp_clf_20, swingAndPointForward_clf_20, rotateLeft_clf_20, rotateRight_clf_20, stillGesture_clf_20]
-#validationPredictors = [moveDown_clf_40, moveUp_clf_40, pullUp_clf_40, swingAndPointForward_clf_40, rotateLeft_clf_40, rotateRight_clf_40, stillGesture_clf_40]
+earlyPredictors = bundle.early
+validationPredictors = bundle.validation
 
 #class_names of the gestures
-#these must be in the same order as the predictors
-#class_names = ['movPosX', 'movPosY', 'movPosZ', 'movNegX', 'movNegY', 'movNegZ', 'stillGesture']
-
-class_names = ['start', 'startR', 'land', 'landR', 'wp_back', 'wp_backR','wp_del','wp_next','wp_nextR', 'wp_set','stillGesture']
+#these are in the same order as the predictors
+class_names = bundle.class_names
 
 
 #################################################################################
 # create communication queues
 #
 
-wrapper_to_predictor_queue = JoinableQueue()
+#raw frames from the BLE callback go through a shared memory ring
+#per predictor process, nothing is pickled on the 20ms path
+#gesture events and direct control frames share the queue to the application
 predictor_to_application_queue = JoinableQueue()
-direct_control_queue = JoinableQueue()
 
-mode_switch_flag = False
+#devices whose mode switch button is held, address -> bool
+mode_switch_flags = {}
+
+#seconds between latency reports of the predictor and the application,
+#None prints the reports only on SIGUSR1 (kill -USR1 <pid>)
+latency_report_interval = None
+
+#number of predictor processes, the devices are spread over them
+predictor_workers = 1
+
+#windows with a motion energy (sum of squared values) up to this floor skip
+#the classifiers and are predicted as idle, 0.0 only skips all zero windows
+#every value outside of the deadzone adds at least 0.25, check other floors
+#with python replay.py <session> --energy-floor <floor>
+idle_energy_floor = 0.0
+
+#windows that repeat exactly are answered from a LRU cache of this size
+prediction_cache_size = 1024
+
+#up to this many frames lost in a row are interpolated into the prediction
+#window, 0 leaves gaps, the lost frames are shown in the latency report
+interpolate_frame_gaps = 0
 
 
 #################################################################################
@@ -143,25 +124,24 @@ mode_switch_flag = False
 # ---------------------------------------------------------------------------------------------------------
 #
 
-def myStreamCB(cHandle, data):
+def myStreamCB(addr, cHandle, data):
     """ callback for new fresh data
-        on streaming characteristic
+        on streaming characteristic of the device addr
     """
-    global mode_switch_flag
-
     mode, switch = check_mode_switch(data)
-    if not mode_switch_flag:
+    if not mode_switch_flags.get(addr, False):
         if switch == 1:
-            mode_switch_flag = True
+            mode_switch_flags[addr] = True
+            #only the device whose button was pressed switches its mode
             if mode == 1:
-                btComm.setMode(MODE.DIRECT_CONTROL)
+                btComm.setMode(MODE.DIRECT_CONTROL, addr)
             elif mode == 3:
-                btComm.setMode(MODE.APPLICATION)
+                btComm.setMode(MODE.APPLICATION, addr)
     else:
         if switch == 0:
-            mode_switch_flag = False
+            mode_switch_flags[addr] = False
 
-    wrapper_to_predictor_queue.put(data)
+    pool.put(addr, data)
 
 
 def check_mode_switch(data):
@@ -185,8 +165,12 @@ version = btComm.getVersion()
 print("comm version: {}".format(version))
 
 
+#create the predictor processes, they are started after the inits
+pool = PredictorPool(predictor_workers, predictor_to_application_queue, predictor_to_application_queue, earlyPredictors, validationPredictors, class_names, latency_interval=latency_report_interval, energy_floor=idle_energy_floor, cache_size=prediction_cache_size, interpolate_gaps=interpolate_frame_gaps, worker=PredictorWorker)
+atexit.register(pool.close)
+
 #set Call Back for data stream from TSkin
-btComm.setStreamCallBack(myStreamCB)
+btComm.setDeviceStreamCallBack(myStreamCB)
 
 
 #connect to TACTI
@@ -204,18 +188,32 @@ btComm.setGNorm(GNORM.NORM)
 btComm.setLed(LED_MODE.FAST_BLINK, LED_COLOR.RED)
 btComm.startSendingData()
 
-#create and start processes for the predictor and the application
-pred = Predictor(wrapper_to_predictor_queue, predictor_to_application_queue, direct_control_queue, earlyPredictors, validationPredictors, class_names)
-pred.start()
-app = Application(predictor_to_application_queue, direct_control_queue)
-app.start()
+#start processes for the predictors and the application
+def start_application():
+    app = Application(predictor_to_application_queue, latency_interval=latency_report_interval)
+    app.start()
+    return app
+
+pool.start()
+app = start_application()
 
 #main loop
-done = False
-while not done:
-    
-    #automatically reconnect in case of connection lost
-    #In case of reconnection, previous settings (mode, dimension, ...) 
-    #are automatically re-applied
-    #btComm.stayConnected()
-    pass
\ No newline at end of file
+#sleeps until a process ends or SIGINT/SIGTERM arrives, ended processes are
+#restarted. The connection is checked in the background, in case of
+#connection lost the supervisor reconnects automatically and the previous
+#settings (mode, dimension, ...) are re-applied
+supervisor = Supervisor(btComm)
+for index, worker in enumerate(pool.workers):
+    supervisor.watch('predictor worker {}'.format(index), worker, functools.partial(pool.restart, index))
+supervisor.watch('application', app, start_application)
+
+#the command is only queued for the notification thread, which is a daemon
+#and ends with the process, so wait until it was written
+#every connected TACTI stops streaming before the processes end
+def stop_streaming():
+    btComm.stopSendingData()
+    if not btComm.flushCommands(timeout=2):
+        print('stop streaming was not sent to every TACTI')
+
+supervisor.on_shutdown(stop_streaming)
+supervisor.run()
@@ -0,0 +1,232 @@
+#################################################################################
+# Model bundle
+#
+# Stores the fused early and validation ensembles of one gesture set in a
+# single file. The file is memory mapped read only, the weight matrices are
+# used directly from the mapping. Loading does not unpickle any estimator and
+# several predictor processes share the same weight pages.
+#
+# File layout
+#
+# ---------------------------------------------------------------------------
+# | magic (8) | header length (4, uint32) | JSON header | padding | arrays |
+# ---------------------------------------------------------------------------
+#
+# The JSON header holds the class names, the metadata of the gesture set and
+# offset, shape and dtype of every array. Arrays are float32 and aligned to
+# 64 bytes. The hidden layers are stored stacked per classifier (see
+# ensemble.py), so the size of a bundle grows linearly with the number of
+# gestures. Bundles with block diagonal layers load as well.
+#
+# Convert the .joblib models of a gesture set with
+#
+#   python modelbundle.py ./models/crazyFlyGestures ./models/crazyFlyGestures.bundle
+#       start startR land landR wp_back wp_backR wp_del wp_next wp_nextR wp_set stillGesture
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import json
+import mmap
+import struct
+import numpy as np
+from ensemble import FusedEnsemble
+
+
+MAGIC = b'GSTBNDL1'
+ALIGNMENT = 64
+DTYPE = '<f4'
+
+CHANNELS_3D = ['accX', 'accY', 'accZ', 'gyroX', 'gyroY', 'gyroZ']
+CHANNELS_2D = ['accX', 'accY', 'gyroZ']
+
+
+#################################################################################
+# ModelBundle class
+#
+
+class ModelBundle:
+    """
+    A loaded gesture set.
+
+    Attributes
+    ----------
+    class_names : list of str
+        The gestures in the order of the ensemble scores.
+    early : FusedEnsemble
+        Ensemble of the early predictors.
+    validation : FusedEnsemble
+        Ensemble of the validation predictors.
+    metadata : dict
+        Timeframes, channel layout and everything else stored in the header.
+    """
+    def __init__(self, class_names, early, validation, metadata):
+        self.class_names = class_names
+        self.early = early
+        self.validation = validation
+        self.metadata = metadata
+
+
+#################################################################################
+# save and load
+#
+
+def save_bundle(path, class_names, early, validation, metadata):
+    """
+    Write a gesture set into a single bundle file.
+
+    Parameters
+    ----------
+    path : str
+        Output file name.
+    class_names : list of str
+        The gestures in the order of the classifiers.
+    early : FusedEnsemble
+        Ensemble of the early predictors.
+    validation : FusedEnsemble
+        Ensemble of the validation predictors.
+    metadata : dict
+        Additional JSON serializable information, e.g. timeframes and channels.
+    """
+    arrays = []
+    stages = {}
+    for stage, ensemble in (('early', early), ('validation', validation)):
+        layers = []
+        for coef, intercept in zip(ensemble.coefs, ensemble.intercepts):
+            layers.append({'coef': len(arrays), 'intercept': len(arrays) + 1})
+            arrays.append(np.ascontiguousarray(coef, dtype=DTYPE))
+            arrays.append(np.ascontiguousarray(intercept, dtype=DTYPE))
+        stages[stage] = {'activation': ensemble.activation,
+                         'invert': ensemble.invert.tolist(),
+                         'layers': layers}
+
+    #array offsets are relative to the start of the data section,
+    #which is the first aligned offset after the header
+    entries = []
+    offset = 0
+    for array in arrays:
+        entries.append({'offset': offset, 'shape': array.shape, 'dtype': DTYPE})
+        offset = _align(offset + array.nbytes)
+
+    header = {'class_names': list(class_names),
+              'metadata': metadata,
+              'stages': stages,
+              'arrays': entries}
+    encoded = json.dumps(header).encode('utf-8')
+    start = _align(len(MAGIC) + 4 + len(encoded))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(encoded)))
+        f.write(encoded)
+        for entry, array in zip(entries, arrays):
+            f.write(b'\0' * (start + entry['offset'] - f.tell()))
+            f.write(array.tobytes())
+
+
+def load_bundle(path):
+    """
+    Memory map a bundle file.
+
+    Parameters
+    ----------
+    path : str
+        File name of the bundle.
+
+    Returns
+    -------
+    ModelBundle
+        The weight arrays of the ensembles are read only views of the mapping.
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a model bundle'.format(path))
+    length = struct.unpack('<I', buffer[len(MAGIC):len(MAGIC) + 4])[0]
+    header = json.loads(buffer[len(MAGIC) + 4:len(MAGIC) + 4 + length].decode('utf-8'))
+    start = _align(len(MAGIC) + 4 + length)
+
+    arrays = []
+    for entry in header['arrays']:
+        count = int(np.prod(entry['shape']))
+        array = np.frombuffer(buffer, dtype=entry['dtype'], count=count, offset=start + entry['offset'])
+        arrays.append(array.reshape(entry['shape']))
+
+    ensembles = {}
+    for stage, description in header['stages'].items():
+        coefs = [arrays[layer['coef']] for layer in description['layers']]
+        intercepts = [arrays[layer['intercept']] for layer in description['layers']]
+        ensembles[stage] = FusedEnsemble(coefs, intercepts, description['invert'], description['activation'])
+
+    return ModelBundle(header['class_names'], ensembles['early'], ensembles['validation'], header['metadata'])
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+#################################################################################
+# convert .joblib models
+#
+
+def convert(model_dir, output_file, class_names, kind='nn', early_timeframe=20, validation_timeframe=40, channels=CHANNELS_3D):
+    """
+    Convert the .joblib models of a gesture set into a bundle.
+
+    Parameters
+    ----------
+    model_dir : str
+        Folder with the models named <class name>_<kind>_<timeframe>.joblib
+    output_file : str
+        File name of the bundle.
+    class_names : list of str
+        The gestures of the set. The order is kept in the bundle.
+    kind : str
+        Model kind in the file names. Only 'nn' models can be fused.
+    early_timeframe : int
+        Timeframe of the early predictors.
+    validation_timeframe : int
+        Timeframe of the validation predictors.
+    channels : list of str
+        Channel layout of one sample, CHANNELS_3D or CHANNELS_2D.
+
+    Returns
+    -------
+    ModelBundle
+        The converted bundle loaded from output_file.
+    """
+    from joblib import load
+
+    def load_all(timeframe):
+        return [load('{}/{}_{}_{}.joblib'.format(model_dir, name, kind, timeframe)) for name in class_names]
+
+    early = FusedEnsemble.from_classifiers(load_all(early_timeframe))
+    validation = FusedEnsemble.from_classifiers(load_all(validation_timeframe))
+
+    metadata = {'early_timeframe': early_timeframe,
+                'validation_timeframe': validation_timeframe,
+                'channels': list(channels),
+                'kind': kind}
+    save_bundle(output_file, class_names, early, validation, metadata)
+    return load_bundle(output_file)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert .joblib gesture models into a model bundle')
+    parser.add_argument('model_dir')
+    parser.add_argument('output_file')
+    parser.add_argument('class_names', nargs='+')
+    parser.add_argument('--kind', default='nn')
+    parser.add_argument('--early', type=int, default=20)
+    parser.add_argument('--validation', type=int, default=40)
+    parser.add_argument('--2d', dest='dimension_2d', action='store_true')
+    args = parser.parse_args()
+
+    convert(args.model_dir, args.output_file, args.class_names, args.kind, args.early, args.validation,
+            CHANNELS_2D if args.dimension_2d else CHANNELS_3D)
@@ -13,8 +13,12 @@
 #
 
 import numpy as np
-import binascii, sys, json, logging
-from struct import unpack
+import binascii, sys, json, logging, time
+from collections import OrderedDict
+from framecodec import DEADZONE, decode_2d, decode_3d, frame_timestamp
+from ensemble import ClassifierEnsemble, FusedEnsemble, can_fuse
+from latency import LatencyMonitor
+from streamhealth import StreamHealth
 from multiprocessing import Process, JoinableQueue
 import enum
 
@@ -22,9 +26,39 @@ import enum
 #################################################################################
 # Predictor class
 #
+# Output of the predictor to the application:
+#   [pred, buttons, frame stamp, decision stamp, address]
+# The stamps are time.monotonic_ns() values of the arrival of the frame in the
+# BLE callback (None if the input queue has no stamps) and of the decision of
+# the state_machine. address is the BLE address of the device the predictor
+# belongs to (None for a single device, see predictorpool.py).
+#
+# The latency report (kill -USR1 <pid>, or every latency_interval seconds)
+# shows the stages 'ble->predictor' and 'state_machine', the depth of the
+# input ring and the counters of the motion energy gate.
+#
+# Motion energy gate: a window whose energy (sum of the squared sample values
+# after the deadzone) is not above energy_floor is idle. The classifiers are
+# skipped for idle windows, they get the prediction of an all zero window
+# (stillGesture for the shipped gesture sets). The default floor 0.0 only
+# gates windows that are all zero, which does not change any prediction.
+#
+# Prediction cache: the windows that pass the gate are looked up in a LRU
+# cache keyed by the ensemble and the bytes of the window, a window that was
+# already classified skips the ensemble. cache_size = 0 disables the cache.
+#
+# Stream health: the timestamps of the application frames are accounted in a
+# StreamHealth (see streamhealth.py), the report shows the lost, duplicate and
+# late frames and the jitter of the frame intervals of the device. Up to
+# interpolate_gaps lost frames in a row are filled into the window by linear
+# interpolation between the samples around the gap, so the classifiers see
+# the gesture at its recorded speed. The default 0 leaves gaps in the window.
+# Duplicate and late frames are only accounted, they are not written into the
+# window and do not advance the state_machine.
+#
 
 class Predictor(Process):
-    def __init__(self, data_input_queue, gesture_output_queue, direct_control_queue, earlyPredictors_3D, validationPredictors_3D, class_names_3D, earlyPredictors_2D = [], validationPredictors_2D = [], class_names_2D = []):
+    def __init__(self, data_input_queue, gesture_output_queue, direct_control_queue, earlyPredictors_3D, validationPredictors_3D, class_names_3D, earlyPredictors_2D = [], validationPredictors_2D = [], class_names_2D = [], latency_interval = None, address = None, energy_floor = 0.0, cache_size = 1024, interpolate_gaps = 0):
         super(Predictor, self).__init__()
         self.data_3d = Data3D()
         self.data_2d = Data2D()
@@ -32,11 +66,11 @@ class Predictor(Process):
         self.gesture_output_queue = gesture_output_queue
         self.direct_control_queue = direct_control_queue
         self.state = STATE.EARLY_PREDICTION
-        self.earlyClf_3d = earlyPredictors_3D
-        self.validationClf_3d = validationPredictors_3D
+        self.earlyClf_3d = fuse(earlyPredictors_3D)
+        self.validationClf_3d = fuse(validationPredictors_3D)
         self.class_names_3d = class_names_3D
-        self.earlyClf_2d = earlyPredictors_2D
-        self.validationClf_2d = validationPredictors_2D
+        self.earlyClf_2d = fuse(earlyPredictors_2D)
+        self.validationClf_2d = fuse(validationPredictors_2D)
         self.class_names_2d = class_names_2D
         self.predictionvalue = 'none'
         self.pred_20_timer = 0
@@ -46,57 +80,126 @@ class Predictor(Process):
         self.pred = 'none'
         self.previous_gesture = 'none'
         self.is3d = True
+        self.monitor = LatencyMonitor('predictor')
+        self.latency_interval = latency_interval
+        self.address = address
+        self.energy_floor = energy_floor
+        self.idle_predictions = {}
+        self.skipped_predictions = 0
+        self.evaluated_predictions = 0
+        self.cache = PredictionCache(cache_size) if cache_size > 0 else None
+        self.health = StreamHealth(self.monitor, address)
+        self.interpolate_gaps = interpolate_gaps
 
 
     def run(self):
+        self.monitor.install_signal_handler()
+        if self.latency_interval:
+            self.monitor.start(self.latency_interval)
         while True:
             data = self.data_input_queue.get()
-            mode = self.data_3d.check_mode(data)
-            if mode == 1:
-                if not self.is3d:
-                    self.is3d = True
-                self.data_3d.write(data)
-                self.state_machine()
-                self.gesture_output_queue.put([self.pred, self.data_3d.buttons])
-            elif mode == 2:
-                if len(self.earlyClf_2d) == 0:
-                    #error this needs another predictor
-                    print('Dimension change from 3D to 2D not allowed during runtime')
-                    print('Application Mode 2D needs another predictor')
-                    break
-                else:
-                    self.is3d = False
-                    self.data_2d.write(data)
-                    self.state_machine()
-                    self.gesture_output_queue.put([self.pred, self.data_2d.buttons])
-            elif mode == 3:
-                self.direct_control_queue.put(data)
+            self.monitor.gauge('input queue depth', self.data_input_queue.qsize())
+            if not self.process(data, getattr(self.data_input_queue, 'stamp', None)):
+                break
             self.data_input_queue.task_done()
 
-    #predicts a gesture
-    def prediction(self, data, predictors):
-        i = 0
-        imax = 0
-        max_value = 0
-
-        for predictor in predictors:
-            index = np.where(predictor.classes_ == 'unknown')[0]
-            if index == 0:
-                pred = predictor.predict_proba(data)[0][1]
+    #handles a single frame, the result is put into the output queues
+    #returns False if the predictor can not handle the frame
+    def process(self, data, stamp=None):
+        received = time.monotonic_ns()
+        self.monitor.record_since('ble->predictor', stamp, received)
+        mode = self.data_3d.check_mode(data)
+        if mode == 1:
+            if not self.is3d:
+                self.is3d = True
+            missing = self.missing_frames(data, received if stamp is None else stamp)
+            if missing < 0:
+                return True
+            self.data_3d.write(data, missing)
+            self.state_machine()
+            decided = time.monotonic_ns()
+            self.monitor.record_ns('state_machine', decided - received)
+            self.gesture_output_queue.put([self.pred, self.data_3d.buttons, stamp, decided, self.address])
+        elif mode == 2:
+            if len(self.earlyClf_2d) == 0:
+                #error this needs another predictor
+                print('Dimension change from 3D to 2D not allowed during runtime')
+                print('Application Mode 2D needs another predictor')
+                return False
             else:
-                pred = predictor.predict_proba(data)[0][0]
+                self.is3d = False
+                missing = self.missing_frames(data, received if stamp is None else stamp)
+                if missing < 0:
+                    return True
+                self.data_2d.write(data, missing)
+                self.state_machine()
+                decided = time.monotonic_ns()
+                self.monitor.record_ns('state_machine', decided - received)
+                self.gesture_output_queue.put([self.pred, self.data_2d.buttons, stamp, decided, self.address])
+        elif mode == 3:
+            #direct control frames carry no timestamp
+            self.health.resync()
+            self.direct_control_queue.put(data)
+        return True
+
+    #accounts the frame in the stream health, returns the number of lost
+    #frames right before it that are interpolated into the window, -1 for
+    #a duplicate or late frame
+    def missing_frames(self, data, arrival):
+        gap = self.health.update(frame_timestamp(data), arrival)
+        if gap < 0:
+            self.monitor.count('skipped frames')
+            return -1
+        if 0 < gap <= self.interpolate_gaps:
+            self.monitor.count('interpolated frames', gap)
+            return gap
+        return 0
+
+    #predicts a gesture from the first samples of the window of data
+    #idle windows skip the classifiers (motion energy gate)
+    def predict_window(self, data, samples, predictors):
+        if data.ring.idle(self.energy_floor):
+            self.skipped_predictions += 1
+            self.monitor.count('skipped predictions')
+            return self.idle_prediction(predictors)
+        self.evaluated_predictions += 1
+        self.monitor.count('evaluated predictions')
+        return self.prediction([data.read()[0:samples * data.ring.width]], predictors)
+
+    #prediction of an all zero window, computed once per ensemble
+    def idle_prediction(self, predictors):
+        pred = self.idle_predictions.get(id(predictors))
+        if pred is None:
+            pred = self.idle_predictions[id(predictors)] = self.prediction([np.zeros(predictors.n_features)], predictors)
+        return pred
 
-            if pred > max_value:
-                max_value = pred
-                imax = i
-            
-            i += 1
+    #predicts a gesture
+    #all one class classifiers are scored in one forward pass,
+    #the gesture with the highest probability wins
+    def prediction(self, data, predictors):
+        key = None
+        if self.cache is not None:
+            key = (id(predictors), np.asarray(data, dtype=float).tobytes())
+            pred = self.cache.get(key)
+            if pred is not None:
+                self.monitor.count('prediction cache hits')
+                return [pred]
+            self.monitor.count('prediction cache misses')
+
+        scores = predictors.scores(data)[0]
+        imax = int(np.argmax(scores))
+        max_value = scores[imax]
 
         if max_value < 0.7:
-            return ['unknown']
-        if not self.is3d:
-            return [self.class_names_2d[imax]]
-        return [self.class_names_3d[imax]]
+            pred = 'unknown'
+        elif not self.is3d:
+            pred = self.class_names_2d[imax]
+        else:
+            pred = self.class_names_3d[imax]
+
+        if key is not None:
+            self.cache.put(key, pred)
+        return [pred]
 
     
     def state_machine(self):
@@ -105,9 +208,9 @@ class Predictor(Process):
             if self.predictionvalue == 'none' or self.predictionvalue == 'unknown' or self.predictionvalue == 'stillGesture':
                 if self.pred_20_timer >= 5:
                     if self.is3d:
-                        pred = self.prediction([self.data_3d.read()[0:120]], self.earlyClf_3d)
+                        pred = self.predict_window(self.data_3d, 20, self.earlyClf_3d)
                     else:
-                        pred = self.prediction([self.data_2d.read()[0:60]], self.earlyClf_2d)
+                        pred = self.predict_window(self.data_2d, 20, self.earlyClf_2d)
                     self.predictionvalue = pred[0]
                     self.pred = ['early', pred[0]]
 
@@ -127,9 +230,9 @@ class Predictor(Process):
             if self.predictionvalue != 'none' and self.predictionvalue != 'unknown' and self.predictionvalue != 'stillGesture':
                 if self.pred_40_timer >= 10:
                     if self.is3d:
-                        pred = self.prediction([self.data_3d.read()[0:240]], self.validationClf_3d)
+                        pred = self.predict_window(self.data_3d, 40, self.validationClf_3d)
                     else:
-                        pred = self.prediction([self.data_2d.read()[0:120]], self.validationClf_2d)
+                        pred = self.predict_window(self.data_2d, 40, self.validationClf_2d)
                     if pred[0] == self.predictionvalue:
                         print('gesture validated: ', pred[0])
                         #uncomment to detect retractions
@@ -170,9 +273,9 @@ class Predictor(Process):
             self.pred = 'none'
             if self.pred_end_timer >= 5:
                 if self.is3d:
-                    pred = self.prediction([self.data_3d.read()[0:120]], self.earlyClf_3d)
+                    pred = self.predict_window(self.data_3d, 20, self.earlyClf_3d)
                 else:
-                    pred = self.prediction([self.data_2d.read()[0:60]], self.earlyClf_2d)
+                    pred = self.predict_window(self.data_2d, 20, self.earlyClf_2d)
                 if pred[0] == 'stillGesture':
                     print('end of gesture detected')
                     self.pred = ['end', 'none']
@@ -226,190 +329,230 @@ class Predictor(Process):
 
 
 
+#################################################################################
+# Helper function fuse
+#
+# Accepts a list of trained one class classifiers or an already fused
+# ensemble and returns a FusedEnsemble, lists of other classifiers than
+# MLPClassifiers (e.g. decision trees) are scored by a ClassifierEnsemble
+#
+
+def fuse(predictors):
+    if isinstance(predictors, (FusedEnsemble, ClassifierEnsemble)):
+        return predictors
+    if all(can_fuse(clf) for clf in predictors):
+        return FusedEnsemble.from_classifiers(predictors)
+    return ClassifierEnsemble(predictors)
+
+
+#################################################################################
+# Helper class PredictionCache
+#
+# Bounded LRU cache of predicted gestures. The key holds the complete bytes
+# of the window, so equal hashes of different windows never return a wrong
+# prediction.
+#
+
+class PredictionCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        pred = self.entries.get(key)
+        if pred is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return pred
+
+    def put(self, key, pred):
+        self.entries[key] = pred
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'hit rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+#################################################################################
+# Helper class RingBuffer
+#
+# Preallocated circular buffer for the sliding windows of Data3D and Data2D.
+# Every sample is written twice, at its slot and at slot + capacity, so the
+# window always is a contiguous view of the buffer and no array has to be
+# allocated or shifted when a new sample arrives.
+# Slots outside of the window are kept at zero, so read() returns the samples
+# of the window in chronological order followed by zeros, exactly like the
+# former shifting numpy arrays.
+# The motion energy of the window (sum of the squared values) and the number
+# of non zero values are updated with every written and dropped sample.
+#
+
+class RingBuffer:
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.size = width * capacity
+        self.buffer = np.zeros(2 * self.size, dtype=float)
+        self.start = 0
+        self.count = 0
+        self.energy = 0.0
+        self.active = 0
+
+    def read(self):
+        offset = self.start * self.width
+        return self.buffer[offset:offset + self.size]
+
+    #appends one sample, the oldest samples are dropped if the window
+    #already holds limit samples
+    def write(self, sample, limit):
+        while self.count >= limit:
+            self.drop()
+        self.put((self.start + self.count) % self.capacity, sample)
+        self.count += 1
+        self.energy += float(np.dot(sample, sample))
+        self.active += int(np.count_nonzero(sample))
+
+    def drop(self):
+        offset = self.start * self.width
+        sample = self.buffer[offset:offset + self.width]
+        self.energy -= float(np.dot(sample, sample))
+        self.active -= int(np.count_nonzero(sample))
+        #no rounding errors pile up over idle periods
+        if self.active == 0:
+            self.energy = 0.0
+        self.put(self.start, 0.0)
+        self.start = (self.start + 1) % self.capacity
+        self.count -= 1
+
+    #True if the motion energy of the window is not above floor,
+    #a window without any non zero value is always idle
+    def idle(self, floor):
+        return self.active == 0 or self.energy <= floor
+
+    def put(self, slot, sample):
+        offset = slot * self.width
+        self.buffer[offset:offset + self.width] = sample
+        offset += self.size
+        self.buffer[offset:offset + self.width] = sample
+
+    def clear(self):
+        self.buffer.fill(0.0)
+        self.start = 0
+        self.count = 0
+        self.energy = 0.0
+        self.active = 0
+
+
+#################################################################################
+# Helper function interpolate
+#
+# The missing samples between the samples last and sample on a straight line,
+# with the deadzone of the decoded samples
+#
+
+def interpolate(last, sample, missing):
+    if last is None or missing <= 0:
+        return ()
+    steps = np.arange(1, missing + 1) / (missing + 1.0)
+    samples = last + np.outer(steps, sample - last)
+    samples[np.abs(samples) <= DEADZONE] = 0.0
+    return samples
+
+
 #################################################################################
 # Helper class Data3D
 #
-# This class stores the incoming 3D data in a numpy array
+# This class stores the incoming 3D data in a ring buffer
 # 3D consists of accX, accY, accZ, gyroX, gyroY, gyroZ
+# The early prediction uses the last 20 samples, the validation uses
+# the last 40 samples
 #
 
 class Data3D:
     def __init__(self):
-        self.dataframe = np.zeros(240, dtype=float)
-        self.index = 0
-        self.TACTI_ACC_COMPRESSION = 819
-        self.TACTI_GYRO_COMPRESSION = 32
+        self.ring = RingBuffer(6, 40)
         self.buttons = []
         self.early = True
+        self.last = None
     
     def read(self):
-        return self.dataframe
+        return self.ring.read()
 
     def check_mode(self, data):
         mode = data[19]
         return mode
     
-    def write(self, data):
-        timestamp = unpack('H', data[0:2])[0]
-        
-        accX = float(unpack('h', data[2:4])[0]) / self.TACTI_ACC_COMPRESSION
-        accY = float(unpack('h', data[4:6])[0]) / self.TACTI_ACC_COMPRESSION
-        accZ = float(unpack('h', data[6:8])[0]) / self.TACTI_ACC_COMPRESSION
-        
-        gyroX = float(unpack('h', data[8:10])[0]) / self.TACTI_GYRO_COMPRESSION
-        gyroY = float(unpack('h', data[10:12])[0]) / self.TACTI_GYRO_COMPRESSION
-        gyroZ = float(unpack('h', data[12:14])[0]) / self.TACTI_GYRO_COMPRESSION
-        
-        b1 = float(unpack('b', data[14:15])[0])
-        b2 = float(unpack('b', data[15:16])[0])
-        b3 = float(unpack('b', data[16:17])[0])
-        b4 = float(unpack('b', data[17:18])[0])
-
-        self.buttons = [b1, b2, b3, b4]
-
-        if abs(accX) <= 0.5:
-            accX = 0.0
-        if abs(accY) <= 0.5:
-            accY = 0.0
-        if abs(accZ) <= 0.5:
-            accZ = 0.0
-        if abs(gyroX) <= 0.5:
-            gyroX = 0.0
-        if abs(gyroY) <= 0.5:
-            gyroY = 0.0
-        if abs(gyroZ) <= 0.5:
-            gyroZ = 0.0
-
-        if self.early:
-            if self.index >= 120:
-                e = np.empty_like(self.dataframe)
-                #e[self.index - 6:self.index] = np.nan
-                #e[:self.index - 6] = self.dataframe[-self.index + 6:self.index]
-                e[:self.index - 6] = self.dataframe[6:120]
-                self.dataframe = e
-                self.dataframe[self.index - 6] = accX
-                self.dataframe[self.index - 5] = accY
-                self.dataframe[self.index - 4] = accZ
-                self.dataframe[self.index - 3] = gyroX
-                self.dataframe[self.index - 2] = gyroY
-                self.dataframe[self.index - 1] = gyroZ
-
-            else:
-                self.dataframe[self.index] = accX
-                self.dataframe[self.index + 1] = accY
-                self.dataframe[self.index + 2] = accZ
-                self.dataframe[self.index + 3] = gyroX
-                self.dataframe[self.index + 4] = gyroY
-                self.dataframe[self.index + 5] = gyroZ
-                self.index += 6
-
-        if not self.early:
-            if self.index >= 240:
-                e = np.empty_like(self.dataframe)
-                #e[self.index - 6:] = np.nan
-                e[:self.index - 6] = self.dataframe[-self.index + 6:]
-                self.dataframe = e
-                self.dataframe[self.index - 6] = accX
-                self.dataframe[self.index - 5] = accY
-                self.dataframe[self.index - 4] = accZ
-                self.dataframe[self.index - 3] = gyroX
-                self.dataframe[self.index - 2] = gyroY
-                self.dataframe[self.index - 1] = gyroZ
-
-            else:
-                self.dataframe[self.index] = accX
-                self.dataframe[self.index + 1] = accY
-                self.dataframe[self.index + 2] = accZ
-                self.dataframe[self.index + 3] = gyroX
-                self.dataframe[self.index + 4] = gyroY
-                self.dataframe[self.index + 5] = gyroZ
-                self.index += 6
+    #missing lost frames before data are interpolated into the window
+    def write(self, data, missing = 0):
+        timestamp, values, buttons = decode_3d(data)
+
+        self.buttons = buttons[0].tolist()
+
+        limit = 20 if self.early else 40
+        for sample in interpolate(self.last, values[0], missing):
+            self.ring.write(sample, limit)
+        self.ring.write(values[0], limit)
+        self.last = values[0]
+        return timestamp[0]
     
     def clear(self):
-        self.dataframe = np.zeros(240, dtype=float)
-        self.index = 0
+        self.ring.clear()
         self.early = True
+        self.last = None
 
 
 #################################################################################
 # Helper class Data2D
 #
-# This class stores the incoming 3D data in a numpy array
+# This class stores the incoming 2D data in a ring buffer
 # 2D consists of accX, accY, gyroZ
 #
 
 class Data2D:
     def __init__(self):
-        self.dataframe = np.zeros(120, dtype=float)
-        self.index = 0
-        self.TACTI_ACC_COMPRESSION = 819
-        self.TACTI_GYRO_COMPRESSION = 32
+        self.ring = RingBuffer(3, 40)
         self.buttons = []
         self.early = True
+        self.last = None
     
     def read(self):
-        return self.dataframe
+        return self.ring.read()
 
     def check_mode(self, data):
         mode = data[19]
         return mode
     
-    def write(self, data):
-        timestamp = unpack('H', data[0:2])[0]
-        
-        accX = float(unpack('h', data[2:4])[0]) / self.TACTI_ACC_COMPRESSION
-        accY = float(unpack('h', data[4:6])[0]) / self.TACTI_ACC_COMPRESSION
-
-        gyroZ = float(unpack('h', data[6:8])[0]) / self.TACTI_GYRO_COMPRESSION
-        
-        b1 = float(unpack('b', data[14:15])[0])
-        b2 = float(unpack('b', data[15:16])[0])
-        b3 = float(unpack('b', data[16:17])[0])
-        b4 = float(unpack('b', data[17:18])[0])
-
-        self.buttons = [b1, b2, b3, b4]
-
-        if abs(accX) <= 0.5:
-            accX = 0.0
-        if abs(accY) <= 0.5:
-            accY = 0.0
-        if abs(gyroZ) <= 0.5:
-            gyroZ = 0.0
-
-        if self.early:
-            if self.index >= 60:
-                e = np.empty_like(self.dataframe)
-                e[:self.index - 3] = self.dataframe[-self.index + 3:]
-                e[:self.index - 3] = self.dataframe[3:60]
-                self.dataframe = e
-                self.dataframe[self.index - 3] = accX
-                self.dataframe[self.index - 2] = accY
-                self.dataframe[self.index - 1] = gyroZ
-
-            else:
-                self.dataframe[self.index] = accX
-                self.dataframe[self.index + 1] = accY
-                self.dataframe[self.index + 2] = gyroZ
-                self.index += 3
-
-        if not self.early:
-            if self.index >= 120:
-                e = np.empty_like(self.dataframe)
-                e[:self.index - 3] = self.dataframe[-self.index + 3:]
-                self.dataframe = e
-                self.dataframe[self.index - 3] = accX
-                self.dataframe[self.index - 2] = accY
-                self.dataframe[self.index - 1] = gyroZ
-
-            else:
-                self.dataframe[self.index] = accX
-                self.dataframe[self.index + 1] = accY
-                self.dataframe[self.index + 2] = gyroZ
-                self.index += 3
+    #missing lost frames before data are interpolated into the window
+    def write(self, data, missing = 0):
+        timestamp, values, buttons = decode_2d(data)
+
+        self.buttons = buttons[0].tolist()
+
+        limit = 20 if self.early else 40
+        for sample in interpolate(self.last, values[0], missing):
+            self.ring.write(sample, limit)
+        self.ring.write(values[0], limit)
+        self.last = values[0]
+        return timestamp[0]
     
     def clear(self):
-        self.dataframe = np.zeros(120, dtype=float)
-        self.index = 0
+        self.ring.clear()
+        self.last = None
 
 
 #enum for state_machine
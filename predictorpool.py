@@ -0,0 +1,254 @@
+#################################################################################
+# Predictor pool
+#
+# Runs the gesture recognition of several Tactigons at once. The frames of
+# every device are routed to one of the PredictorWorker processes, each
+# worker has its own FrameRing. A worker keeps one Predictor (sliding window
+# and state_machine) per device address and runs it with Predictor.process(),
+# all predictors of a worker share the same fused ensembles and the same
+# prediction cache.
+#
+# Devices are assigned round robin in the order they send their first frame
+# and stay on their worker, so the frames of a device are always handled in
+# order by the same Predictor.
+#
+# The BLE address travels as 8 byte tag with the frame through the ring, the
+# gesture events of the predictors carry the address (see predictor.py).
+#
+# Usage (main.py):
+#
+#   pool = PredictorPool(2, predictor_to_application_queue, predictor_to_application_queue,
+#                        earlyPredictors, validationPredictors, class_names)
+#   btComm.setDeviceStreamCallBack(lambda addr, cHandle, data: pool.put(addr, data))
+#   pool.start()
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import threading
+from multiprocessing import Process
+from framering import FrameRing
+from latency import LatencyMonitor
+from predictor import Predictor, PredictionCache, fuse
+
+
+#################################################################################
+# address tags
+#
+# 'aa:bb:cc:dd:ee:ff' <-> 0xaabbccddeeff
+#
+
+def address_to_tag(addr):
+    return int(addr.replace(':', ''), 16)
+
+
+def tag_to_address(tag):
+    digits = '{:012x}'.format(tag)
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+#################################################################################
+# PredictorWorker class
+#
+# One process of the pool. The latency report of a worker covers the frames
+# of all its devices.
+#
+
+class PredictorWorker(Process):
+    def __init__(self, data_input_queue, gesture_output_queue, direct_control_queue, earlyPredictors_3D, validationPredictors_3D, class_names_3D, earlyPredictors_2D = [], validationPredictors_2D = [], class_names_2D = [], latency_interval = None, name = 'predictor worker', energy_floor = 0.0, cache_size = 1024, interpolate_gaps = 0):
+        super(PredictorWorker, self).__init__()
+        self.data_input_queue = data_input_queue
+        self.gesture_output_queue = gesture_output_queue
+        self.direct_control_queue = direct_control_queue
+        self.earlyClf_3d = fuse(earlyPredictors_3D)
+        self.validationClf_3d = fuse(validationPredictors_3D)
+        self.class_names_3d = class_names_3D
+        self.earlyClf_2d = fuse(earlyPredictors_2D)
+        self.validationClf_2d = fuse(validationPredictors_2D)
+        self.class_names_2d = class_names_2D
+        self.predictors = {}
+        #devices whose frames the predictor could not handle
+        self.stopped = set()
+        self.monitor = LatencyMonitor(name)
+        self.latency_interval = latency_interval
+        self.energy_floor = energy_floor
+        self.cache = PredictionCache(cache_size) if cache_size > 0 else None
+        self.interpolate_gaps = interpolate_gaps
+
+
+    def run(self):
+        self.monitor.install_signal_handler()
+        if self.latency_interval:
+            self.monitor.start(self.latency_interval)
+        while True:
+            data = self.data_input_queue.get()
+            self.monitor.gauge('input queue depth', self.data_input_queue.qsize())
+            self.process(data, tag_to_address(self.data_input_queue.tag), self.data_input_queue.stamp)
+
+    #handles a single frame of the device addr
+    def process(self, data, addr, stamp=None):
+        if addr in self.stopped:
+            return False
+        predictor = self.predictors.get(addr)
+        if predictor is None:
+            predictor = self.predictors[addr] = self.create_predictor(addr)
+            self.monitor.gauge('devices', len(self.predictors))
+        if not predictor.process(data, stamp):
+            print('predictor for {} stopped'.format(addr))
+            self.stopped.add(addr)
+            return False
+        return True
+
+    #the predictor is never started as process, it shares the ensembles,
+    #the prediction cache and the latency monitor of the worker, the stream
+    #health of every device is reported by the worker
+    def create_predictor(self, addr):
+        predictor = Predictor(None, self.gesture_output_queue, self.direct_control_queue,
+                              self.earlyClf_3d, self.validationClf_3d, self.class_names_3d,
+                              self.earlyClf_2d, self.validationClf_2d, self.class_names_2d,
+                              address=addr, energy_floor=self.energy_floor, interpolate_gaps=self.interpolate_gaps)
+        predictor.monitor = self.monitor
+        predictor.health.monitor = self.monitor
+        predictor.cache = self.cache
+        return predictor
+
+
+#################################################################################
+# PredictorPool class
+#
+
+class PredictorPool:
+    """
+    Pool of predictor worker processes for several devices.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes, e.g. the number of free cores.
+    gesture_output_queue, direct_control_queue : JoinableQueue
+        Output queues shared by all workers.
+    earlyPredictors_3D, validationPredictors_3D, class_names_3D,
+    earlyPredictors_2D, validationPredictors_2D, class_names_2D :
+        The models of the gesture set, see Predictor.
+    capacity : int
+        Frames in the ring of every worker.
+    latency_interval : float or None
+        Seconds between the latency reports of the workers.
+    energy_floor : float
+        Motion energy gate of the predictors, see Predictor.
+    cache_size : int
+        Entries of the prediction cache of every worker, 0 disables it.
+    interpolate_gaps : int
+        Longest run of lost frames the predictors interpolate, see Predictor.
+    worker : callable
+        Creates the worker processes, called like PredictorWorker. E.g. the
+        Predictor of FakePredictor.py, which simulates the gestures.
+
+    Notes
+    -----
+    put() may be called from the notification threads of several devices,
+    a lock per ring keeps the producer side of every ring single threaded.
+    """
+    def __init__(self, workers, gesture_output_queue, direct_control_queue, earlyPredictors_3D, validationPredictors_3D, class_names_3D, earlyPredictors_2D = [], validationPredictors_2D = [], class_names_2D = [], capacity = 1024, latency_interval = None, energy_floor = 0.0, cache_size = 1024, interpolate_gaps = 0, worker = PredictorWorker):
+        earlyPredictors_3D = fuse(earlyPredictors_3D)
+        validationPredictors_3D = fuse(validationPredictors_3D)
+        earlyPredictors_2D = fuse(earlyPredictors_2D)
+        validationPredictors_2D = fuse(validationPredictors_2D)
+
+        self.rings = [FrameRing(capacity) for i in range(workers)]
+        self.locks = [threading.Lock() for i in range(workers)]
+        self.worker_args = (gesture_output_queue, direct_control_queue,
+                            earlyPredictors_3D, validationPredictors_3D, class_names_3D,
+                            earlyPredictors_2D, validationPredictors_2D, class_names_2D, latency_interval)
+        self.energy_floor = energy_floor
+        self.cache_size = cache_size
+        self.interpolate_gaps = interpolate_gaps
+        self.worker = worker
+        self.workers = [self.create_worker(i) for i in range(workers)]
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def create_worker(self, index):
+        return self.worker(self.rings[index], *self.worker_args, name='predictor worker {}'.format(index),
+                               energy_floor=self.energy_floor, cache_size=self.cache_size,
+                               interpolate_gaps=self.interpolate_gaps)
+
+    def route(self, addr):
+        """
+        Index of the worker that handles the device addr.
+        """
+        index = self.routes.get(addr)
+        if index is None:
+            with self.lock:
+                index = self.routes.get(addr)
+                if index is None:
+                    index = self.routes[addr] = len(self.routes) % len(self.workers)
+        return index
+
+    def put(self, addr, data, stamp=None):
+        """
+        Send a frame of the device addr to its worker.
+
+        Returns
+        -------
+        bool
+            False if the ring of the worker was full and the frame was dropped.
+        """
+        index = self.route(addr)
+        with self.locks[index]:
+            return self.rings[index].put(data, stamp, address_to_tag(addr))
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def terminate(self):
+        for worker in self.workers:
+            worker.terminate()
+
+    def join(self, timeout=None):
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def is_alive(self):
+        return all(worker.is_alive() for worker in self.workers)
+
+    def restart(self, index):
+        """
+        Replace the worker index by a new started worker on the same ring,
+        e.g. after it died. The devices of the worker start with empty
+        windows.
+
+        Returns
+        -------
+        PredictorWorker
+            The new worker.
+        """
+        old = self.workers[index]
+        if old.is_alive():
+            old.terminate()
+        old.join()
+        #the old worker may have died inside the event of the ring
+        with self.locks[index]:
+            self.rings[index].renew_event()
+            self.workers[index] = self.create_worker(index)
+        self.workers[index].start()
+        return self.workers[index]
+
+    def stats(self):
+        """
+        Ring counters of every worker and the assigned devices.
+        """
+        stats = []
+        for index, ring in enumerate(self.rings):
+            entry = ring.stats()
+            entry['devices'] = sorted(addr for addr, i in self.routes.items() if i == index)
+            stats.append(entry)
+        return stats
+
+    def close(self):
+        for ring in self.rings:
+            ring.close()
@@ -17,6 +17,9 @@ import pandas as pd
 import numpy as np
 import math
 import itertools
+import time
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.neural_network import MLPClassifier
 from sklearn.metrics import confusion_matrix
@@ -24,14 +27,26 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from sklearn.utils.multiclass import unique_labels
 import matplotlib.pyplot as plt
-from joblib import dump
+from joblib import Parallel, delayed, dump
+from modelbundle import CHANNELS_3D, CHANNELS_2D
+from buildcache import Manifest, code_version, file_hash, stage_key
+from dataset import DATASET_SUFFIX, Dataset, convert, load_dataset, save_dataset
+from report import EvaluationReport, show_or_save
+
+
+#fixed number of timestamps for each gesture
+#only the first WINDOW_LENGTH timestamps of each gesture are used
+WINDOW_LENGTH = 80
+
+#manifest of the build cache, see buildcache.py
+MANIFEST = './data/manifest.json'
 
 
 #################################################################################
 # preprocessing
 #
 
-def preprocessing(raw_training_data, categories, threshold = 0.5, dimension_3D = True):
+def preprocessing(raw_training_data, categories, threshold = 0.5, dimension_3D = True, workers = 1, manifest = MANIFEST):
     """
     Preprocess a list of .csv files
 
@@ -45,6 +60,15 @@ def preprocessing(raw_training_data, categories, threshold = 0.5, dimension_3D =
         sets absolute acceleration and gyro values below threshold to zero.
         This helps the neural networks to achieve a higher accuracy
         in gesture recognition.
+    dimension_3D : bool
+        True for 3D recordings, False for 2D recordings.
+    workers : int
+        number of processes that preprocess files at the same time.
+        None uses one process per CPU core.
+    manifest : str or None
+        manifest of the build cache. Files whose raw data, category and
+        parameters did not change since the last run are not preprocessed
+        again. None preprocesses all files.
     
     Returns
     -------
@@ -55,139 +79,225 @@ def preprocessing(raw_training_data, categories, threshold = 0.5, dimension_3D =
     -----
     the class names of the categories list must be in the same order
     as the file names in the raw_training_data list
+    With workers != 1 on Windows the calling script must guard its code
+    with if __name__ == '__main__', the worker processes import it again.
     """
-    #read data from .csv file into dataFrame
+    started = time.perf_counter()
+    cache = Manifest(manifest) if manifest else None
+    parameters = {'threshold': threshold, 'dimension_3D': dimension_3D,
+                  'window_length': WINDOW_LENGTH,
+                  'version': code_version(preprocess_file, segment_runs, flatten_runs, runs_to_dataframe)}
+
+    jobs = []
+    keys = {}
+    unchanged = []
     for file, cat in zip(raw_training_data, categories):
-        raw_training_df = pd.read_csv('./data/raw/' + file)
-
-        #remove leading whitespaces from column names
-        raw_training_df.columns = raw_training_df.columns.str.replace(" ", "")
-
-        #add 'run' column to dataFrame
-        raw_training_df['run'] = 1
-
-        change = False
-        changePrev = False
-        run = 0
-
-        #divide data into runs, each run is a single gesture
-        for i, row in raw_training_df.iterrows():
-            if raw_training_df.at[i, 'button'] == 0:
-                change = False
-            else:
-                change = True
-
-            if change != changePrev and raw_training_df.at[i, 'button'] == 1:
-                run += 1
-            
-            if raw_training_df.at[i, 'button'] == 1:
-                raw_training_df.at[i, 'run'] = run
-            else:
-                raw_training_df.at[i, 'run'] = 0
-
-            changePrev = change
-
-        #remove rows that don't belong to gestures
-        raw_training_df = raw_training_df[raw_training_df.run != 0]
-
-        count = 0
-        run = 1
-
-        #normalize timestamp, each run starts at timestamp 1
-        for i, row in raw_training_df.iterrows():
-            if run != raw_training_df.at[i, 'run']:
-                count = 0
-            
-            run = raw_training_df.at[i, 'run']
-
-            count += 1
-            raw_training_df.at[i, 'timestamp'] = count
-
-
-        #fixed number of timestamps for each gesture
-        #only the first 80 timestamps of each gesture are used
-        raw_training_df = raw_training_df[raw_training_df.timestamp <= 80]
-
-
-        #set values below threshold to zero
-        if dimension_3D:
-            for i, row in raw_training_df.iterrows():
-                if abs(raw_training_df.at[i, 'accX']) <= threshold:
-                    raw_training_df.at[i, 'accX'] = 0.0
-                if abs(raw_training_df.at[i, 'accY']) <= threshold:
-                    raw_training_df.at[i, 'accY'] = 0.0
-                if abs(raw_training_df.at[i, 'accZ']) <= threshold:
-                    raw_training_df.at[i, 'accZ'] = 0.0
-                if abs(raw_training_df.at[i, 'gyroX']) <= threshold:
-                    raw_training_df.at[i, 'gyroX'] = 0.0
-                if abs(raw_training_df.at[i, 'gyroY']) <= threshold:
-                    raw_training_df.at[i, 'gyroY'] = 0.0
-                if abs(raw_training_df.at[i, 'gyroZ']) <= threshold:
-                    raw_training_df.at[i, 'gyroZ'] = 0.0
-
-        if not dimension_3D:
-            for i, row in raw_training_df.iterrows():
-                if abs(raw_training_df.at[i, 'accX']) <= threshold:
-                    raw_training_df.at[i, 'accX'] = 0.0
-                if abs(raw_training_df.at[i, 'accY']) <= threshold:
-                    raw_training_df.at[i, 'accY'] = 0.0
-                if abs(raw_training_df.at[i, 'gyroZ']) <= threshold:
-                    raw_training_df.at[i, 'gyroZ'] = 0.0
-
-
-        #create dataFrame for processed data
-        processed_df = pd.DataFrame()
-
-        #transpose raw data into one row for each gesture
-        run = 1
-        runs = raw_training_df['run'].max()
-
-        while run <= runs:
-            trans_df = pd.DataFrame()
-            run_group_df = pd.DataFrame()
-
-            #take only the data of one run (gesture)
-            for i, row in raw_training_df.iterrows():
-                if raw_training_df.at[i, 'run'] == run:
-                    run_group_df = run_group_df.append(row)
-
-
-            #remove colums 'button', 'run' and 'timestamp'
-            run_group_df = run_group_df.drop(columns=['button', 'run', 'timestamp'])
-
-            #transpose each column of a single run and rename the new comlumns
-            for j, column in run_group_df.iteritems():
-                transposed_df = pd.DataFrame()
-                transposed_df[column.name] = column
-                transposed_df = transposed_df.transpose()
-                transposed_df.columns = np.arange(transposed_df.shape[1])
-                transposed_df = transposed_df.rename(columns=lambda x: '0' + str(x) if x < 10 else x)
-                transposed_df = transposed_df.add_suffix('_' + column.name)
-                trans_df = pd.concat([trans_df, transposed_df], axis=0, sort=True)
-            
-            trans_df = trans_df.fillna(method = 'bfill')
-            trans_df = trans_df.dropna()
-
-            processed_df = processed_df.append(trans_df)
-            run += 1
-
-
-        #add class column 'category' to data
-        processed_df = processed_df.assign(category=cat)
-
-
-        #write processed dataFrame to .csv file
-        processed_df.to_csv('./data/preprocessed/' + file)
+        if cache is not None:
+            key = stage_key([file_hash('./data/raw/' + file)], dict(parameters, category=cat))
+            if cache.fresh('preprocessed', file, key, './data/preprocessed/' + file):
+                unchanged.append(file)
+                continue
+            keys[file] = key
+        jobs.append((file, cat, threshold, dimension_3D))
+
+    if workers == 1 or len(jobs) <= 1:
+        reports = [preprocess_file(*job) for job in jobs]
+    else:
+        #results come back in the order of raw_training_data
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(preprocess_file, *zip(*jobs)))
+
+    if cache is not None:
+        for file, key in keys.items():
+            cache.record('preprocessed', file, key, './data/preprocessed/' + file)
+        cache.save()
+
+    elapsed = time.perf_counter() - started
+    rows = 0
+    gestures = 0
+    for file in unchanged:
+        print('{}: unchanged'.format(file))
+    for file, file_rows, file_gestures, seconds in reports:
+        print('{}: {} rows, {} gestures in {:.3f}s ({:.0f} rows/s)'.format(file, file_rows, file_gestures, seconds, _rate(file_rows, seconds)))
+        rows += file_rows
+        gestures += file_gestures
+    print('{} files ({} unchanged): {} rows, {} gestures in {:.3f}s ({:.0f} rows/s)'.format(len(reports) + len(unchanged), len(unchanged), rows, gestures, elapsed, _rate(rows, elapsed)))
 
     return raw_training_data
 
 
+def preprocess_file(file, cat, threshold = 0.5, dimension_3D = True):
+    """
+    Preprocess a single .csv file from ./data/raw into ./data/preprocessed
+
+    Parameters
+    ----------
+    file : str
+        file name of the recording
+    cat : str
+        class name of the gesture
+    threshold : float
+        sets absolute acceleration and gyro values below threshold to zero.
+    dimension_3D : bool
+        True for 3D recordings, False for 2D recordings.
+
+    Returns
+    -------
+    tuple
+        file name, number of raw rows, number of gestures and the seconds
+        needed to preprocess the file.
+    """
+    started = time.perf_counter()
+
+    #read data from .csv file into dataFrame
+    #the legacy float parser keeps the output identical to the existing
+    #preprocessed files
+    raw_training_df = pd.read_csv('./data/raw/' + file, float_precision='legacy')
+
+    #remove leading whitespaces from column names
+    raw_training_df.columns = raw_training_df.columns.str.replace(" ", "")
+    rows = len(raw_training_df)
+
+    #divide data into runs, normalize the timestamps and set values
+    #below threshold to zero
+    raw_training_df = segment_runs(raw_training_df, threshold, dimension_3D)
+
+    #transpose raw data into one row for each gesture
+    runs, channels = flatten_runs(raw_training_df)
+    processed_df = runs_to_dataframe(runs, channels)
+
+    #add class column 'category' to data
+    processed_df = processed_df.assign(category=cat)
+
+    #write processed dataFrame to .csv file
+    processed_df.to_csv('./data/preprocessed/' + file)
+
+    return file, rows, len(processed_df), time.perf_counter() - started
+
+
+def _rate(rows, seconds):
+    return rows / seconds if seconds > 0 else float('inf')
+
+
+
+
+#################################################################################
+# segmentation
+#
+
+def segment_runs(raw_training_df, threshold = 0.5, dimension_3D = True):
+    """
+    Divide a raw recording into runs, each run is a single gesture.
+
+    Parameters
+    ----------
+    raw_training_df : DataFrame
+        A raw recording with the columns timestamp, the channels and button.
+    threshold : float
+        sets absolute acceleration and gyro values below threshold to zero.
+    dimension_3D : bool
+        True for the 3D channels, False for the 2D channels.
+
+    Returns
+    -------
+    DataFrame
+        The rows of the runs with an additional 'run' column. The timestamps
+        are normalized, each run starts at timestamp 1. Only the first
+        WINDOW_LENGTH timestamps of each run are kept.
+
+    Notes
+    -----
+    A run starts at every row where button is 1 and the button was released
+    (0) in the previous row. All rows with button 1 belong to the last run
+    that started, rows with another button value are removed.
+    """
+    button = raw_training_df['button']
+    pressed = button != 0
+
+    #rising edges of the button start a new run
+    started = (button == 1) & (pressed != pressed.shift(1, fill_value=False))
+    run = started.cumsum().where(button == 1, 0)
+
+    #remove rows that don't belong to gestures
+    df = raw_training_df.assign(run=run)
+    df = df[df.run != 0]
+
+    #normalize timestamp, each run starts at timestamp 1
+    df = df.assign(timestamp=df.groupby('run').cumcount() + 1)
+
+    #fixed number of timestamps for each gesture
+    df = df[df.timestamp <= WINDOW_LENGTH].copy()
+
+    #set values below threshold to zero
+    channels = CHANNELS_3D if dimension_3D else CHANNELS_2D
+    values = df[channels]
+    df[channels] = values.mask(values.abs() <= threshold, 0.0)
+
+    return df
+
+
+
+#################################################################################
+# flattening
+#
+
+def flatten_runs(segmented_df):
+    """
+    Arrange the samples of the runs in one array.
+
+    Parameters
+    ----------
+    segmented_df : DataFrame
+        Output of segment_runs().
+
+    Returns
+    -------
+    ndarray of shape (runs, WINDOW_LENGTH, channels)
+        The samples of each run in the order of the run numbers.
+        Runs with less than WINDOW_LENGTH samples are padded with NaN.
+    list of str
+        The channels in the order of the last axis, sorted by name.
+    """
+    channels = sorted(c for c in segmented_df.columns if c not in ('button', 'run', 'timestamp'))
+    numbers, run = np.unique(segmented_df['run'].to_numpy(), return_inverse=True)
+
+    data = np.full((len(numbers), WINDOW_LENGTH, len(channels)), np.nan)
+    sample = segmented_df['timestamp'].to_numpy(dtype=int) - 1
+    data[run, sample] = segmented_df[channels].to_numpy(dtype=float)
+
+    return data, channels
+
+
+def runs_to_dataframe(runs, channels):
+    """
+    One row for each run with the columns 00_<channel> ... 79_<channel>.
+
+    Parameters
+    ----------
+    runs : ndarray of shape (runs, WINDOW_LENGTH, channels)
+        Output of flatten_runs().
+    channels : list of str
+        The channels of the last axis of runs.
+
+    Returns
+    -------
+    DataFrame
+        The columns end with the longest run, missing samples of shorter
+        runs are NaN. Each row is labeled with the first channel.
+    """
+    filled = ~np.isnan(runs).all(axis=(0, 2))
+    length = int(np.nonzero(filled)[0].max()) + 1 if filled.any() else 0
+
+    columns = ['{:02d}_{}'.format(i, channel) for i in range(length) for channel in channels]
+    values = runs[:, :length].reshape(len(runs), length * len(channels))
+    return pd.DataFrame(values, index=[channels[0]] * len(runs), columns=columns)
+
 
 #################################################################################
 # merge preprocessed data
 #
 
-def merge(preprocessed_training_data, output_file):
+def merge(preprocessed_training_data, output_file, workers = None, manifest = MANIFEST, dataset = True):
     """
     Merge multiple files with gestures into one file.
 
@@ -197,6 +307,16 @@ def merge(preprocessed_training_data, output_file):
         A list of file names.
     output_file : str
         File name to save the merged input data.
+    workers : int
+        number of threads that read files at the same time.
+        None lets ThreadPoolExecutor choose.
+    manifest : str or None
+        manifest of the build cache. If the preprocessed files did not
+        change since the last merge, the merged file is only loaded.
+        None always merges.
+    dataset : bool
+        also write the merged data as binary dataset (see dataset.py),
+        it is rebuilt only if the merged file changed.
 
     Returns
     -------
@@ -205,17 +325,31 @@ def merge(preprocessed_training_data, output_file):
 
     Notes
     -----
-    The merged data will be saved in folder ./data/merged/output_file
+    The merged data will be saved in folder ./data/merged/output_file,
+    the dataset in ./data/merged/<output_file without .csv>.dataset
     """
 
-    dataframes = []
-    all_data_df = pd.DataFrame(index=[], columns=[])
+    output = './data/merged/' + output_file
+    cache = Manifest(manifest) if manifest else None
+    if cache is not None:
+        key = stage_key([file_hash('./data/preprocessed/' + file) for file in preprocessed_training_data],
+                        {'files': list(preprocessed_training_data), 'version': code_version(merge)})
+        if cache.fresh('merged', output_file, key, output):
+            print('{}: unchanged'.format(output_file))
+            if dataset:
+                merged_dataset(output, cache)
+            return pd.read_csv(output, index_col=0, float_precision='legacy')
+
+    def read(file):
+        return pd.read_csv('./data/preprocessed/' + file, float_precision='legacy')
 
-    for file in preprocessed_training_data:
-        dataframes.append(pd.read_csv('./data/preprocessed/' + file))
+    #the files are read by a thread pool, the parser releases the GIL
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        dataframes = list(executor.map(read, preprocessed_training_data))
 
-    for df in dataframes:
-        all_data_df = all_data_df.append(df)
+    #the columns are sorted like DataFrame.append sorted them,
+    #'category' is the last column
+    all_data_df = pd.concat(dataframes, sort=True)
 
     #remove unnamed column
     all_data_df = all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
@@ -224,108 +358,275 @@ def merge(preprocessed_training_data, output_file):
     all_data_df = all_data_df.fillna(value=0)
 
     #write merged data to .csv file
-    all_data_df.to_csv('./data/merged/' + output_file)
+    all_data_df.to_csv(output)
+
+    if cache is not None:
+        cache.record('merged', output_file, key, output)
+        cache.save()
+
+    if dataset:
+        merged_dataset(output, cache)
 
     return all_data_df
 
 
+#converts the merged .csv file output into a .dataset folder next to it,
+#skipped if the manifest cache has a dataset of the same .csv file
+def merged_dataset(output, cache):
+    path = os.path.splitext(output)[0] + DATASET_SUFFIX
+    name = os.path.basename(path)
+    key = None
+    if cache is not None:
+        key = stage_key([file_hash(output)], {'version': code_version(convert, save_dataset, Dataset.from_dataframe)})
+        if cache.fresh('dataset', name, key, path):
+            return path
+
+    convert(output, path)
+    print('{} -> {}'.format(output, path))
+
+    if cache is not None:
+        cache.record('dataset', name, key, path)
+        cache.save()
+    return path
+
+
 
 #################################################################################
-# train one class classifier neural networks
+# load training data
 #
 
-def train_one_class_classifier_nn(merged_training_data, categories, timeframe):
+def load_training_data(merged_training_data):
     """
-    Train one class classifier neural networks for each category.
+    Load training data into a DataFrame.
 
     Parameters
     ----------
-    merged_training_data : DataFrame or str
-        A DataFrame with samples of at least on gesture or
-        a str with a file name '.csv'.
-    categories : list of str
-        A list with the categories of the gestures in the
-        DataFrame or file.
-    timeframe : int
-        A timeframe for which the classifier should be trained.
-        (20ms * timeframe=20) = 0.4s 
-        
-    Notes
-    -----
-    This uses the complete data to train the models. No split
-    into training and twst data is done.
-    Each trained model will be named after it's corresponding
-    gesture concatenated with the timeframe. The trained models
-    will be saved in a folder named models.
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset' in ./data/merged
+
+    Returns
+    -------
+    DataFrame
+        The feature columns and the 'category' column without the
+        unnamed index column of the .csv files.
     """
+    if isinstance(merged_training_data, Dataset):
+        return merged_training_data.to_dataframe()
 
     if isinstance(merged_training_data, str):
-        #load data into dataFrame
+        if merged_training_data.endswith(DATASET_SUFFIX):
+            return load_dataset('./data/merged/' + merged_training_data).to_dataframe()
         all_data_df = pd.read_csv('./data/merged/' + merged_training_data)
     else:
         all_data_df = merged_training_data
-    
-    
+
     #remove unnamed column
-    all_data_df = all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
+    return all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
 
 
-    #filter data to use only a fixed timeframe
-    #for 0.4s from timestamp 0 to 19 (20 values * 20ms = 0.4s)
-    last_timestamp = timeframe
-    list_columns = []
-    for i, column in all_data_df.iteritems():
-        if column.name != "category":
-            a = int(column.name[:2])
-        
-            if a >= last_timestamp:
-                list_columns.append(column.name)
+#################################################################################
+# one-vs-rest training engine
+#
+# The feature matrix is built once, every category gets a binary label
+# vector (category or 'unknown') and all classifiers are fitted in parallel
+# by joblib. The feature matrix is sent to the worker processes as a memory
+# map, not once per category.
+#
 
-    all_data_df = all_data_df.drop(list_columns, axis=1)
+def training_matrix(merged_training_data):
+    """
+    Feature matrix with all timestamps and the category of each row.
 
-    dataframes = []
+    Parameters
+    ----------
+    merged_training_data : DataFrame, Dataset or str
+        see load_training_data()
 
-    for cat in categories:
-        df = all_data_df.copy()
-        df.loc[df['category'] != cat, 'category'] = 'unknown'
-        dataframes.append(df)
-    
-    classifiers = []
+    Returns
+    -------
+    X : ndarray of shape (rows, timestamps * channels)
+        The columns are ordered by timestamp and channel (00_accX, 00_accY,
+        ..., 01_accX, ...), the first timeframe * channels columns hold the
+        timestamps 0 to timeframe - 1, see timeframe_matrix().
+    categories : ndarray of shape (rows,)
+    channels : list of str
+    """
+    if isinstance(merged_training_data, str) and merged_training_data.endswith(DATASET_SUFFIX):
+        merged_training_data = load_dataset('./data/merged/' + merged_training_data)
 
-    for df in dataframes:
-        X = df.iloc[:, all_data_df.columns != 'category']
-        Y = df.iloc[:, all_data_df.columns == 'category']
+    if isinstance(merged_training_data, Dataset):
+        columns = list(merged_training_data.columns)
+        features = merged_training_data.features
+        categories = merged_training_data.category_names()
+    else:
+        all_data_df = load_training_data(merged_training_data)
+        columns = [column for column in all_data_df.columns if column != 'category']
+        features = all_data_df[columns].to_numpy(dtype=float)
+        categories = all_data_df['category'].to_numpy(dtype=object)
+
+    #column names are <timestamp>_<channel>, merge() sorts them by name
+    channels = sorted(column[3:] for column in columns if int(column[:2]) == 0)
+    timestamps = max(int(column[:2]) for column in columns) + 1
+    position = {column: i for i, column in enumerate(columns)}
+    order = []
+    for t in range(timestamps):
+        for channel in channels:
+            name = '{:02d}_{}'.format(t, channel)
+            if name not in position:
+                raise ValueError('training data has no column {}'.format(name))
+            order.append(position[name])
+
+    #the files written by merge() are already in this order
+    if order != list(range(len(columns))):
+        features = np.asarray(features)[:, order]
+    return features, categories, channels
+
+
+def timeframe_matrix(X, channels, timeframe):
+    """
+    The columns of the timestamps 0 to timeframe - 1 of a training_matrix()
+    as a view.
+    """
+    return X[:, :timeframe * len(channels)]
 
-        clf = MLPClassifier(solver='adam', alpha=1e-3, hidden_layer_sizes=(20, 20, 20), random_state=1, max_iter=200)
-        clf.fit(X, np.ravel(Y))
 
-        classifiers.append(clf)
+def create_classifier(kind, **parameters):
+    """
+    Untrained one class classifier, kind is 'nn' or 'dct'.
+    parameters replace the default settings of the classifier,
+    e.g. hidden_layer_sizes=(40, 40) or alpha=1e-4 (see sweep.py).
+    """
+    if kind == 'nn':
+        defaults = dict(solver='adam', alpha=1e-3, hidden_layer_sizes=(20, 20, 20), random_state=1, max_iter=200)
+        return MLPClassifier(**dict(defaults, **parameters))
+    if kind == 'dct':
+        defaults = dict(min_samples_split=20, random_state=99)
+        return DecisionTreeClassifier(**dict(defaults, **parameters))
+    raise ValueError("kind must be 'nn' or 'dct', not {!r}".format(kind))
+
+
+def one_vs_rest_labels(categories, cat):
+    """
+    Label vector of the one class classifier of cat.
+    """
+    return np.where(categories == cat, cat, 'unknown').astype(object)
+
+
+def train_one_vs_rest(merged_training_data, categories, timeframes, kind = 'nn', evaluate = False, test_data_size = 0.2, n_jobs = -1, report_dir = None):
+    """
+    Train one class classifiers for each category.
+
+    Parameters
+    ----------
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset'.
+    categories : list of str
+        A list with the categories of the gestures in the
+        DataFrame or file.
+    timeframes : int or list of int
+        The timeframes for which the classifiers should be trained.
+        (20ms * timeframe=20) = 0.4s. All timeframes are trained
+        from a single load of the data, e.g. [20, 40].
+    kind : str
+        'nn' for neural networks, 'dct' for decision trees.
+    evaluate : bool
+        False trains with the complete data and saves the models as
+        ./models/<category>_<kind>_<timeframe>.joblib
+        True splits the data into training and test data and prints the
+        confusion matrix of each model, the models are not saved.
+    test_data_size : float
+        the percentage size of the test data for evaluate = True.
+    n_jobs : int
+        number of processes that train classifiers at the same time,
+        -1 uses all CPU cores.
+    report_dir : str or None
+        Save the confusion matrices as PNG and the results and times of
+        every model as JSON into this directory instead of showing the
+        plots, see report.py.
+
+    Returns
+    -------
+    list or dict
+        The trained classifiers in the order of categories, for a list of
+        timeframes a dict with the list of classifiers of each timeframe.
+    """
+    single = np.isscalar(timeframes)
+    if single:
+        timeframes = [timeframes]
 
+    X, y, channels = training_matrix(merged_training_data)
 
-    for clf, cat in zip(classifiers, categories):
-        dump(clf, './models/' + cat + '_nn_' + str(timeframe) + '.joblib')
+    #every job gets the complete matrix and slices its timeframe,
+    #so joblib sends the matrix to the workers only once
+    jobs = [(timeframe, cat) for timeframe in timeframes for cat in categories]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_one_vs_rest)(X, y, timeframe * len(channels), cat, kind, evaluate, test_data_size) for timeframe, cat in jobs)
+
+    report = None if report_dir is None else EvaluationReport(report_dir)
+
+    classifiers = {timeframe: [] for timeframe in timeframes}
+    for (timeframe, cat), (clf, Y_test, y_pred, fit_seconds, predict_seconds) in zip(jobs, results):
+        name = cat + '_' + kind + '_' + str(timeframe)
+        entry = {'category': cat, 'kind': kind, 'timeframe': timeframe,
+                 'fit_seconds': fit_seconds, 'predict_seconds': predict_seconds}
+        if evaluate:
+            print('{} {} timeframe {}'.format(cat, kind, timeframe))
+            entry.update(print_confusion_matrix(Y_test, y_pred, [cat, 'unknown'], report, name))
+        else:
+            dump(clf, './models/' + name + '.joblib')
+        if report is not None:
+            report.add('confusion_matrices' if evaluate else 'training', name, entry)
+        classifiers[timeframe].append(clf)
+
+    if report is not None:
+        report.write()
+
+    if single:
+        return classifiers[timeframes[0]]
+    return classifiers
+
+
+def _fit_one_vs_rest(X, y, width, cat, kind, evaluate, test_data_size):
+    X = X[:, :width]
+    Y = one_vs_rest_labels(y, cat)
+    clf = create_classifier(kind)
+
+    if not evaluate:
+        start = time.perf_counter()
+        clf.fit(X, Y)
+        return clf, None, None, time.perf_counter() - start, None
+
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=test_data_size, stratify=y)
+    start = time.perf_counter()
+    clf.fit(X_train, Y_train)
+    fitted = time.perf_counter()
+    y_pred = clf.predict(X_test)
+    return clf, Y_test, y_pred, fitted - start, time.perf_counter() - fitted
 
 
 
 #################################################################################
-# train one class calssifier decision trees
+# train one class classifier neural networks
 #
 
-def train_one_class_classifier_dct(merged_training_data, categories, timeframe):
+def train_one_class_classifier_nn(merged_training_data, categories, timeframe):
     """
-    Train one class classifier decision trees for each category.
+    Train one class classifier neural networks for each category.
 
     Parameters
     ----------
-    merged_training_data : DataFrame or str
-        A DataFrame with samples of at least on gesture or
-        a str with a file name '.csv'.
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset'.
     categories : list of str
         A list with the categories of the gestures in the
         DataFrame or file.
-    timeframe : int
+    timeframe : int or list of int
         A timeframe for which the classifier should be trained.
         (20ms * timeframe=20) = 0.4s 
+        A list trains all timeframes from a single load of the data.
         
     Notes
     -----
@@ -335,78 +636,68 @@ def train_one_class_classifier_dct(merged_training_data, categories, timeframe):
     gesture concatenated with the timeframe. The trained models
     will be saved in a folder named models.
     """
+    train_one_vs_rest(merged_training_data, categories, timeframe, kind='nn')
 
-    if isinstance(merged_training_data, str):
-        #load data into dataFrame
-        all_data_df = pd.read_csv('./data/merged/' + merged_training_data)
-    else:
-        all_data_df = merged_training_data
-    
-    
-    #remove unnamed column
-    all_data_df = all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
-
-
-    #filter data to use only a fixed timeframe
-    #for 0.4s from timestamp 0 to 19 (20 values * 20ms = 0.4s)
-    last_timestamp = timeframe
-    list_columns = []
-    for i, column in all_data_df.iteritems():
-        if column.name != "category":
-            a = int(column.name[:2])
-        
-            if a >= last_timestamp:
-                list_columns.append(column.name)
-
-    all_data_df = all_data_df.drop(list_columns, axis=1)
-
-    dataframes = []
-
-    for cat in categories:
-        df = all_data_df.copy()
-        df.loc[df['category'] != cat, 'category'] = 'unknown'
-        dataframes.append(df)
-    
-    classifiers = []
-
-    for df in dataframes:
-        X = df.iloc[:, all_data_df.columns != 'category']
-        Y = df.iloc[:, all_data_df.columns == 'category']
-
-        clf = DecisionTreeClassifier(min_samples_split=20, random_state=99)
-        clf.fit(X, np.ravel(Y))
-
-        classifiers.append(clf)
 
+#################################################################################
+# train one class calssifier decision trees
+#
 
-    for clf, cat in zip(classifiers, categories):
-        dump(clf, './models/' + cat + '_dct_' + str(timeframe) + '.joblib')
+def train_one_class_classifier_dct(merged_training_data, categories, timeframe):
+    """
+    Train one class classifier decision trees for each category.
 
+    Parameters
+    ----------
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset'.
+    categories : list of str
+        A list with the categories of the gestures in the
+        DataFrame or file.
+    timeframe : int or list of int
+        A timeframe for which the classifier should be trained.
+        (20ms * timeframe=20) = 0.4s 
+        A list trains all timeframes from a single load of the data.
+        
+    Notes
+    -----
+    This uses the complete data to train the models. No split
+    into training and twst data is done.
+    Each trained model will be named after it's corresponding
+    gesture concatenated with the timeframe. The trained models
+    will be saved in a folder named models.
+    """
+    train_one_vs_rest(merged_training_data, categories, timeframe, kind='dct')
 
 
 #################################################################################
 # evaluate one class classifier neural networks
 #
 
-def train_one_class_classifier_nn_evaluation(merged_training_data, categories, timeframe, test_data_size = 0.2):
+def train_one_class_classifier_nn_evaluation(merged_training_data, categories, timeframe, test_data_size = 0.2, report_dir = None):
     """
     Train one class classifier neural networks for each category and
     print the confusion matrix of each trained model.
 
     Parameters
     ----------
-    merged_training_data : DataFrame or str
-        A DataFrame with samples of at least on gesture or
-        a str with a file name '.csv'.
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset'.
     categories : list of str
         A list with the categories of the gestures in the
         DataFrame or file.
-    timeframe : int
+    timeframe : int or list of int
         A timeframe for which the classifier should be trained.
         (20ms * timeframe=20) = 0.4s
+        A list evaluates all timeframes from a single load of the data.
     test_data_size : float
         the percentage size of the test data after the split
         into training and test data. default = 0.2
+    report_dir : str or None
+        Save the confusion matrices and the results into this
+        directory instead of showing the plots, see report.py.
         
     Notes
     -----
@@ -414,78 +705,36 @@ def train_one_class_classifier_nn_evaluation(merged_training_data, categories, t
     The models will not be saved. This function is only for
     evaluation purposes.
     """
-    if isinstance(merged_training_data, str):
-        #load data into dataFrame
-        all_data_df = pd.read_csv('./data/merged/' + merged_training_data)
-    else:
-        all_data_df = merged_training_data
-    
-    
-    #remove unnamed column
-    all_data_df = all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
-
-
-    #filter data to use only a fixed timeframe
-    #for 0.4s from timestamp 0 to 19 (20 values * 20ms = 0.4s)
-    last_timestamp = timeframe
-    list_columns = []
-    for i, column in all_data_df.iteritems():
-        if column.name != "category":
-            a = int(column.name[:2])
-        
-            if a >= last_timestamp:
-                list_columns.append(column.name)
-
-    all_data_df = all_data_df.drop(list_columns, axis=1)
-
-    dataframes = []
-
-    for cat in categories:
-        df = all_data_df.copy()
-        df.loc[df['category'] != cat, 'category'] = 'unknown'
-        dataframes.append(df)
-    
-    classifiers = []
-
-    for df in dataframes:
-        X = df.iloc[:, all_data_df.columns != 'category']
-        Y = df.iloc[:, all_data_df.columns == 'category']
-
-        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=test_data_size, stratify=all_data_df['category'])
-
-        clf = MLPClassifier(solver='adam', alpha=1e-3, hidden_layer_sizes=(20, 20, 20), random_state=1, max_iter=200)
-        clf.fit(X_train, np.ravel(Y_train))
-
-        y_pred = clf.predict(X_test)
-
-        cats = [df['category'].unique()[np.where(df['category'].unique() != 'unknown')[0]][0], 'unknown']
-        print_confusion_matrix(Y_test, y_pred, cats)
-        classifiers.append(clf)
+    train_one_vs_rest(merged_training_data, categories, timeframe, kind='nn', evaluate=True, test_data_size=test_data_size, report_dir=report_dir)
 
 
 #################################################################################
 # evaluate one class classifier decision trees
 #
 
-def train_one_class_classifier_dct_evaluation(merged_training_data, categories, timeframe, test_data_size = 0.2):
+def train_one_class_classifier_dct_evaluation(merged_training_data, categories, timeframe, test_data_size = 0.2, report_dir = None):
     """
     Train one class classifier decision trees for each category and
     print the confusion matrix of each trained model.
 
     Parameters
     ----------
-    merged_training_data : DataFrame or str
-        A DataFrame with samples of at least on gesture or
-        a str with a file name '.csv'.
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset'.
     categories : list of str
         A list with the categories of the gestures in the
         DataFrame or file.
-    timeframe : int
+    timeframe : int or list of int
         A timeframe for which the classifier should be trained.
         (20ms * timeframe=20) = 0.4s
+        A list evaluates all timeframes from a single load of the data.
     test_data_size : float
         the percentage size of the test data after the split
         into training and test data. default = 0.2
+    report_dir : str or None
+        Save the confusion matrices and the results into this
+        directory instead of showing the plots, see report.py.
         
     Notes
     -----
@@ -493,73 +742,43 @@ def train_one_class_classifier_dct_evaluation(merged_training_data, categories,
     The models will not be saved. This function is only for
     evaluation purposes.
     """
-    if isinstance(merged_training_data, str):
-        #load data into dataFrame
-        all_data_df = pd.read_csv('./data/merged/' + merged_training_data)
-    else:
-        all_data_df = merged_training_data
-    
-    
-    #remove unnamed column
-    all_data_df = all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
-
-
-    #filter data to use only a fixed timeframe
-    #for 0.4s from timestamp 0 to 19 (20 values * 20ms = 0.4s)
-    last_timestamp = timeframe
-    list_columns = []
-    for i, column in all_data_df.iteritems():
-        if column.name != "category":
-            a = int(column.name[:2])
-        
-            if a >= last_timestamp:
-                list_columns.append(column.name)
-
-    all_data_df = all_data_df.drop(list_columns, axis=1)
-
-    dataframes = []
-
-    for cat in categories:
-        df = all_data_df.copy()
-        df.loc[df['category'] != cat, 'category'] = 'unknown'
-        dataframes.append(df)
-    
-    classifiers = []
-
-    for df in dataframes:
-        X = df.iloc[:, all_data_df.columns != 'category']
-        Y = df.iloc[:, all_data_df.columns == 'category']
-
-        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=test_data_size, stratify=all_data_df['category'])
-
-        clf = DecisionTreeClassifier(min_samples_split=20, random_state=99)
-        clf.fit(X_train, np.ravel(Y_train))
-
-        y_pred = clf.predict(X_test)
-
-        cats = [df['category'].unique()[np.where(df['category'].unique() != 'unknown')[0]][0], 'unknown']
-        print_confusion_matrix(Y_test, y_pred, cats)
-        classifiers.append(clf)
+    train_one_vs_rest(merged_training_data, categories, timeframe, kind='dct', evaluate=True, test_data_size=test_data_size, report_dir=report_dir)
 
 
 #################################################################################
 # Helper function to print confusion matrix
 #
 
-def print_confusion_matrix(true_categories, predicted_categories, categories):
+def print_confusion_matrix(true_categories, predicted_categories, categories, report = None, name = 'confusion_matrix'):
     """
     Helper function to print a confusion matrix
-        
+
+    Parameters
+    ----------
+    true_categories, predicted_categories : array_like
+        The true and the predicted categories of the test data.
+    categories : list of str
+        The categories in the order of the rows and columns.
+    report : EvaluationReport or None
+        Save the plot as <name>.png into the report instead of showing it.
+    name : str
+        Name of the plot in the report.
+
+    Returns
+    -------
+    dict
+        labels, confusion matrix, accuracy and the file name of the plot.
+
     Notes
     -----
     This funtion is used inside the decision tree and neural network
     evaluation functions.
     """
-    cnf_matrix = confusion_matrix(true_categories, predicted_categories)
+    cnf_matrix = confusion_matrix(true_categories, predicted_categories, labels=categories)
     np.set_printoptions(precision=2)
 
     classes = categories
-    plt.figure()
+    figure = plt.figure()
     plt.imshow(cnf_matrix, interpolation='nearest', cmap=plt.cm.Blues)
     plt.title('Confusion matrix')
     plt.colorbar()
@@ -578,14 +797,17 @@ def print_confusion_matrix(true_categories, predicted_categories, categories):
     plt.ylabel('True label')
     plt.xlabel('Predicted label')
     plt.annotate('accuracy ' + str(accuracy), xy=(0.5, 0), xytext=(0, 10), xycoords=('axes fraction', 'figure fraction'), textcoords='offset points', size=14, ha='center', va='bottom')
-    plt.show()
+    plot = show_or_save(figure, report, name)
+
+    return {'labels': list(classes), 'confusion_matrix': cnf_matrix.tolist(),
+            'accuracy': float(accuracy), 'plot': plot}
 
 
 #################################################################################
 # Test neural networks for overfitting
 #
 
-def accuracy_over_epochs_nn(merged_training_data, categories, timeframe, test_data_size = 0.2, training_epochs = 200):
+def accuracy_over_epochs_nn(merged_training_data, categories, timeframe, test_data_size = 0.2, training_epochs = 200, report_dir = None, score_interval = 1, train_score_size = None, patience = None, n_jobs = -1):
     """
     Train one class classifier neural networks for each category and
     print the accuracy of training and test data and the loss over
@@ -593,9 +815,9 @@ def accuracy_over_epochs_nn(merged_training_data, categories, timeframe, test_da
 
     Parameters
     ----------
-    merged_training_data : DataFrame or str
-        A DataFrame with samples of at least on gesture or
-        a str with a file name '.csv'.
+    merged_training_data : DataFrame, Dataset or str
+        A DataFrame or Dataset with samples of at least on gesture or
+        a str with a file name '.csv' or '.dataset'.
     categories : list of str
         A list with the categories of the gestures in the
         DataFrame or file.
@@ -607,73 +829,120 @@ def accuracy_over_epochs_nn(merged_training_data, categories, timeframe, test_da
         into training and test data. default = 0.2
     training_epochs : int
         max number of training epochs for the neural network
+    report_dir : str or None
+        Save the plots as PNG and the curves and times of every model
+        as JSON into this directory instead of showing the plots,
+        see report.py.
+    score_interval : int
+        The accuracies are computed every score_interval epochs and
+        after the last epoch. default = 1
+    train_score_size : int, float or None
+        Number (int) or share (float) of the training data the training
+        accuracy is computed on, a fixed random subset for all epochs.
+        None uses the complete training data.
+    patience : int or None
+        Stop the training of a network if the test accuracy did not
+        improve in patience scorings. None trains all epochs.
+    n_jobs : int
+        number of processes that train networks at the same time,
+        -1 uses all CPU cores.
+
+    Returns
+    -------
+    list
+        The trained classifiers in the order of categories.
+
     Notes
     -----
     This splits the training data into training and test data.
     The models will not be saved. This function is only for
     evaluation purposes.
     """
-    if isinstance(merged_training_data, str):
-        #load data into dataFrame
-        all_data_df = pd.read_csv('./data/merged/' + merged_training_data)
-    else:
-        all_data_df = merged_training_data
-    
-    
-    #remove unnamed column
-    all_data_df = all_data_df.drop(all_data_df.columns[all_data_df.columns.str.contains('unnamed',case = False)],axis = 1)
+    X, y, channels = training_matrix(merged_training_data)
+    width = timeframe * len(channels)
 
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_accuracy_over_epochs)(X, y, width, cat, test_data_size, training_epochs, score_interval, train_score_size, patience)
+        for cat in categories)
 
-    #filter data to use only a fixed timeframe
-    #for 0.4s from timestamp 0 to 19 (20 values * 20ms = 0.4s)
-    last_timestamp = timeframe
-    list_columns = []
-    for i, column in all_data_df.iteritems():
-        if column.name != "category":
-            a = int(column.name[:2])
-        
-            if a >= last_timestamp:
-                list_columns.append(column.name)
+    report = None if report_dir is None else EvaluationReport(report_dir)
+    classifiers = []
+
+    for cat, result in zip(categories, results):
+        clf = result['classifier']
+        name = cat + '_nn_' + str(timeframe)
+        if result['epochs'] < training_epochs:
+            print('{}: test accuracy did not improve, stopped after {} epochs'.format(name, result['epochs']))
 
-    all_data_df = all_data_df.drop(list_columns, axis=1)
+        figure = plt.figure()
+        plt.plot(result['scored'], result['train'], color='green', alpha=0.8, label='train')
+        plt.plot(result['scored'], result['test'], color='magenta', alpha=0.8, label='test')
+        plt.plot(clf.loss_curve_, color='blue', alpha=0.8, label='loss')
+        plt.title(result['classes'][0] + ' Accuracy over epochs', fontsize=14)
+        plt.xlabel('epochs')
+        plt.legend(loc='center right')
+        plot = show_or_save(figure, report, name + '_epochs')
 
-    dataframes = []
+        if report is not None:
+            report.add('accuracy_over_epochs', name,
+                       {'category': cat, 'timeframe': timeframe, 'epochs': result['epochs'], 'seconds': result['seconds'],
+                        'scored': result['scored'], 'train': result['train'], 'test': result['test'],
+                        'loss': clf.loss_curve_, 'plot': plot})
 
-    for cat in categories:
-        df = all_data_df.copy()
-        df.loc[df['category'] != cat, 'category'] = 'unknown'
-        dataframes.append(df)
-    
-    classifiers = []
+        classifiers.append(clf)
 
-    for df in dataframes:
-        X = df.iloc[:, all_data_df.columns != 'category']
-        Y = df.iloc[:, all_data_df.columns == 'category']
+    if report is not None:
+        report.write()
 
-        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=test_data_size, stratify=all_data_df['category'])
+    return classifiers
 
-        clf = MLPClassifier(solver='adam', alpha=1e-3, hidden_layer_sizes=(20, 20, 20), random_state=1, max_iter=200)
 
-        scores_train = []
-        scores_test = []
+def _accuracy_over_epochs(X, y, width, cat, test_data_size, training_epochs, score_interval, train_score_size, patience):
+    X = X[:, :width]
+    Y = one_vs_rest_labels(y, cat)
 
-        epoch = 0
-        classes = unique_labels(Y_train)
-        
-        while epoch < training_epochs:
-            clf.partial_fit(X_train, np.ravel(Y_train), classes=classes)
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=test_data_size, stratify=y)
 
-            scores_train.append(clf.score(X_train, Y_train))
-            scores_test.append(clf.score(X_test, Y_test))
+    #the training accuracy of a subset approximates the accuracy of all
+    #training data, the same rows are scored after every epoch
+    X_score, Y_score = X_train, Y_train
+    if train_score_size is not None:
+        n = train_score_size if isinstance(train_score_size, int) else int(round(train_score_size * len(Y_train)))
+        if n < len(Y_train):
+            rows = np.random.RandomState(0).choice(len(Y_train), n, replace=False)
+            X_score, Y_score = X_train[rows], Y_train[rows]
 
-            epoch += 1
-        
-        plt.plot(scores_train, color='green', alpha=0.8, label='train')
-        plt.plot(scores_test, color='magenta', alpha=0.8, label='test')
-        plt.plot(clf.loss_curve_, color='blue', alpha=0.8, label='loss')
-        plt.title(classes [0] + ' Accuracy over epochs', fontsize=14)
-        plt.xlabel('epochs')
-        plt.legend(loc='center right')
-        plt.show()
+    clf = create_classifier('nn')
 
-        classifiers.append(clf)
+    scored = []
+    scores_train = []
+    scores_test = []
+    best = -1.0
+    unchanged = 0
+
+    epoch = 0
+    classes = unique_labels(Y_train)
+    start = time.perf_counter()
+
+    while epoch < training_epochs:
+        clf.partial_fit(X_train, np.ravel(Y_train), classes=classes)
+        epoch += 1
+
+        if epoch % score_interval != 0 and epoch != training_epochs:
+            continue
+
+        scored.append(epoch)
+        scores_train.append(clf.score(X_score, Y_score))
+        scores_test.append(clf.score(X_test, Y_test))
+
+        #plateau of the test curve
+        if scores_test[-1] > best:
+            best = scores_test[-1]
+            unchanged = 0
+        else:
+            unchanged += 1
+            if patience is not None and unchanged >= patience:
+                break
+
+    return {'classifier': clf, 'classes': classes, 'epochs': epoch, 'seconds': time.perf_counter() - start,
+            'scored': scored, 'train': scores_train, 'test': scores_test}
@@ -0,0 +1,231 @@
+#################################################################################
+# Offline replay
+#
+# Feeds recorded sessions through the Predictor without a Tactigon.
+# A session is either a .csv recording of collectData.py (data/raw/*.csv)
+# or a binary capture, which is a plain sequence of 20 byte frames.
+# The frames run through Data3D/Data2D and the state_machine of the
+# Predictor either at wall clock pace (one frame every 20ms) or as fast as
+# possible.
+#
+# Usage:
+#
+#   python replay.py ./data/raw/land.csv
+#   python replay.py ./data/raw/land.csv --realtime
+#   python replay.py ./data/raw/land.csv --save ./land.bin
+#   python replay.py ./capture.bin --interpolate-gaps 2
+#
+# The timestamps of the frames are accounted in the stream health of the
+# predictor, the replay shows the frames a session lost on the way.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import contextlib
+import io
+import os
+import queue
+import time
+import pandas as pd
+from framecodec import FRAME_SIZE, encode_2d, encode_3d
+from modelbundle import load_bundle
+from predictor import Predictor
+
+
+#time between two frames of the Tactigon
+FRAME_INTERVAL = 0.02
+
+
+#################################################################################
+# load and save sessions
+#
+
+def load_frames(path):
+    """
+    Load a recorded session as frames.
+
+    Parameters
+    ----------
+    path : str
+        A .csv file with the columns timestamp, accX, accY, (accZ, gyroX,
+        gyroY,) gyroZ, button or a binary capture.
+
+    Returns
+    -------
+    bytes
+        The frames of the session. The button column of a .csv file is
+        placed in button 4 (b4), like collectData.py records it.
+    """
+    if path.endswith('.csv'):
+        df = pd.read_csv(path)
+        df.columns = df.columns.str.replace(' ', '')
+        buttons = pd.DataFrame(0.0, index=df.index, columns=['b1', 'b2', 'b3', 'b4'])
+        buttons['b4'] = df['button']
+        if 'accZ' in df.columns:
+            return encode_3d(df['timestamp'], df[['accX', 'accY', 'accZ', 'gyroX', 'gyroY', 'gyroZ']], buttons)
+        return encode_2d(df['timestamp'], df[['accX', 'accY', 'gyroZ']], buttons)
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) % FRAME_SIZE != 0:
+        raise ValueError('{} is not a capture of {} byte frames'.format(path, FRAME_SIZE))
+    return data
+
+
+def save_frames(path, frames):
+    """
+    Write frames into a binary capture.
+    """
+    with open(path, 'wb') as f:
+        f.write(frames)
+
+
+#################################################################################
+# ReplayResult class
+#
+
+class ReplayResult:
+    """
+    Outcome of a replay.
+
+    Attributes
+    ----------
+    events : list of (int, list)
+        Frame index and event of the state_machine, e.g. ['early', 'land'],
+        ['vali', 'land'], ['false', 'land'] or ['end', 'none'].
+    frames : int
+        Number of frames fed into the predictor.
+    seconds : float
+        Wall clock time of the replay.
+    """
+    def __init__(self, events, frames, seconds):
+        self.events = events
+        self.frames = frames
+        self.seconds = seconds
+
+    def frames_per_second(self):
+        if self.seconds == 0:
+            return 0.0
+        return self.frames / self.seconds
+
+    def gestures(self):
+        """
+        Events without the early predictions of unknown and stillGesture.
+        """
+        return [(i, e) for i, e in self.events if e[0] != 'early' or e[1] not in ('unknown', 'stillGesture')]
+
+    def counts(self):
+        counts = {}
+        for i, event in self.events:
+            counts[event[0]] = counts.get(event[0], 0) + 1
+        return counts
+
+
+#################################################################################
+# replay
+#
+
+def create_predictor(bundle, energy_floor=0.0, cache_size=1024, interpolate_gaps=0):
+    """
+    Predictor for a replay, the output queues are plain queue.Queue objects.
+    A bundle with 2D channels is used for the 2D frames.
+    """
+    if len(bundle.metadata.get('channels', [])) == 3:
+        return Predictor(None, queue.Queue(), queue.Queue(), [], [], [],
+                         bundle.early, bundle.validation, bundle.class_names, energy_floor=energy_floor, cache_size=cache_size,
+                         interpolate_gaps=interpolate_gaps)
+    return Predictor(None, queue.Queue(), queue.Queue(), bundle.early, bundle.validation, bundle.class_names,
+                     energy_floor=energy_floor, cache_size=cache_size, interpolate_gaps=interpolate_gaps)
+
+
+def replay(frames, predictor, realtime=False, speed=1.0, verbose=False):
+    """
+    Feed frames through a predictor.
+
+    Parameters
+    ----------
+    frames : bytes
+        Sequence of 20 byte frames.
+    predictor : Predictor
+        A predictor that is not started as process, see create_predictor().
+    realtime : bool
+        Feed one frame every FRAME_INTERVAL / speed seconds, otherwise
+        as fast as possible.
+    speed : float
+        Speed up factor for realtime replays.
+    verbose : bool
+        Show the prints of the predictor.
+
+    Returns
+    -------
+    ReplayResult
+    """
+    events = []
+    n = len(frames) // FRAME_SIZE
+    count = 0
+    output = predictor.gesture_output_queue
+
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+
+        start = time.monotonic()
+        for i in range(n):
+            if realtime:
+                delay = start + i * FRAME_INTERVAL / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if not predictor.process(frames[i * FRAME_SIZE:(i + 1) * FRAME_SIZE]):
+                break
+            count += 1
+
+            while not output.empty():
+                pred = output.get()[0]
+                if pred != 'none':
+                    events.append((i, pred))
+        seconds = time.monotonic() - start
+
+    return ReplayResult(events, count, seconds)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay recorded sessions through the gesture recognizer')
+    parser.add_argument('sessions', nargs='+', help='.csv recordings or binary captures')
+    parser.add_argument('--bundle', default='./models/crazyFlyGestures.bundle')
+    parser.add_argument('--realtime', action='store_true', help='replay at wall clock pace')
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--energy-floor', type=float, default=0.0, help='motion energy gate of the predictor')
+    parser.add_argument('--cache-size', type=int, default=1024, help='entries of the prediction cache, 0 disables it')
+    parser.add_argument('--interpolate-gaps', type=int, default=0, help='longest run of lost frames interpolated into the window')
+    parser.add_argument('--save', help='write the frames of a single session into a binary capture')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    bundle = load_bundle(args.bundle)
+
+    for session in args.sessions:
+        frames = load_frames(session)
+        if args.save:
+            save_frames(args.save, frames)
+
+        predictor = create_predictor(bundle, args.energy_floor, args.cache_size, args.interpolate_gaps)
+        result = replay(frames, predictor, args.realtime, args.speed, args.verbose)
+
+        print('{}: {} frames in {:.3f}s, {:.0f} frames/s'.format(os.path.basename(session), result.frames,
+                                                              result.seconds, result.frames_per_second()))
+        print('  events: {}'.format(result.counts()))
+        print('  classifier calls: {} evaluated, {} skipped'.format(predictor.evaluated_predictions,
+                                                                   predictor.skipped_predictions))
+        if predictor.cache is not None:
+            print('  prediction cache: {}'.format(predictor.cache.stats()))
+        health = predictor.health.stats()
+        print('  stream: {} lost, {} duplicate, {} late frames, {} resets, gaps {}'.format(
+            health['lost'], health['duplicates'], health['late'], health['resets'], health['gaps']))
+        for i, event in result.gestures():
+            print('  {:>7} {:<6} {}'.format(i, event[0], event[1]))
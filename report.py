@@ -0,0 +1,101 @@
+#################################################################################
+# Evaluation report
+#
+# Headless output of the evaluation functions in preprocessing.py. Instead of
+# showing every plot with plt.show(), the figures are saved as PNG files into
+# a report directory and closed, the numbers behind them (confusion matrices,
+# accuracy curves, fit and predict times of every model) are collected in
+# report.json in the same directory:
+#
+#   {"confusion_matrices": {"land_nn_20": {...}, ...},
+#    "accuracy_over_epochs": {"land_nn_20": {...}, ...}}
+#
+# Entries are keyed like the model files (<category>_<kind>_<timeframe>),
+# several evaluations can write into the same directory, an entry of the same
+# name is replaced.
+#
+# Without a display matplotlib uses the Agg backend, so the evaluation runs
+# unattended, e.g.
+#
+#   pre.train_one_class_classifier_nn_evaluation('crazyFlyGestures.csv', categories, [20, 40], report_dir='./reports/nn')
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import json
+import os
+import matplotlib.pyplot as plt
+
+
+REPORT_FILE = 'report.json'
+
+
+#################################################################################
+# EvaluationReport class
+#
+
+class EvaluationReport:
+    """
+    PNG figures and JSON results of an evaluation.
+
+    Parameters
+    ----------
+    report_dir : str
+        The report directory, it is created if missing. An existing
+        report.json is loaded and extended.
+    """
+    def __init__(self, report_dir):
+        self.report_dir = report_dir
+        self.path = os.path.join(report_dir, REPORT_FILE)
+        self.entries = {}
+        os.makedirs(report_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def save_figure(self, figure, name):
+        """
+        Save a figure as <name>.png and close it.
+
+        Returns
+        -------
+        str
+            File name of the PNG relative to the report directory.
+        """
+        file_name = name + '.png'
+        figure.savefig(os.path.join(self.report_dir, file_name), bbox_inches='tight')
+        plt.close(figure)
+        return file_name
+
+    def add(self, section, name, entry):
+        """
+        Add or replace the entry name of a section, entry is a JSON
+        serializable dict.
+        """
+        self.entries.setdefault(section, {})[name] = entry
+
+    def write(self):
+        #write and rename, an interrupted evaluation keeps the old report
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+        print('report written to {}'.format(self.report_dir))
+
+
+def show_or_save(figure, report, name):
+    """
+    Show the figure if there is no report, otherwise save it into the report.
+
+    Returns
+    -------
+    str or None
+        File name of the saved PNG.
+    """
+    if report is None:
+        plt.show()
+        return None
+    return report.save_figure(figure, name)
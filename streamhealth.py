@@ -0,0 +1,213 @@
+#################################################################################
+# Stream health
+#
+# Accounts frame loss and jitter of the data stream of a Tactigon from the
+# 16 bit timestamp of the application frames (bytes 0-1, see framecodec.py).
+# The Tactigon counts the timestamp up by one for every frame (one frame
+# every 20ms), resetTimeStamp() of BTCommunication sets it back to 1.
+#
+# For every frame the distance to the previous timestamp (modulo 2^16) is
+#
+#   1                   the next frame
+#   2 ... 2^15 - 1      distance - 1 frames were lost on the way, a frame
+#                       whose timestamp is below the previous one wrapped
+#                       around
+#   0                   a duplicate of the previous frame
+#   otherwise           a frame from the past: a late frame if it is at most
+#                       RESET_DISTANCE frames behind, otherwise (or if the
+#                       next frame follows it) the timestamp was reset and
+#                       the accounting starts over
+#
+# The arrival times (time.monotonic_ns() of the BLE callback) of two frames
+# in order are compared with the time the Tactigon needed to send them
+# (distance * 20ms). The difference is the jitter of the stream, it shows
+# whether BLE delivers the frames in bursts.
+#
+# The histograms and counters are kept in a LatencyMonitor (the monitor of
+# the predictor), the names carry the device address:
+#
+#   frame interval <addr>   time between two frames in order
+#   frame jitter <addr>     |frame interval - distance * 20ms|
+#   lost frames <addr>, duplicate frames <addr>, late frames <addr>,
+#   timestamp wraparounds <addr>, timestamp resets <addr>
+#   frame loss % <addr>     gauge, updated once per second of frames
+#
+# stats() returns the counters, the rates and the gap lengths of a stream.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import time
+from latency import LatencyMonitor
+
+
+TIMESTAMP_MODULUS = 1 << 16
+
+#time between two frames of the Tactigon
+FRAME_INTERVAL_NS = 20000000
+
+#frames further in the past than this (20 seconds) are a timestamp reset
+RESET_DISTANCE = 1000
+
+#frames between two updates of the frame loss gauge
+GAUGE_INTERVAL = 50
+
+
+#################################################################################
+# StreamHealth class
+#
+
+class StreamHealth:
+    """
+    Frame loss and jitter of the stream of one device.
+
+    Parameters
+    ----------
+    monitor : LatencyMonitor or None
+        Receives the histograms and counters, None creates an own monitor.
+    device : str or None
+        Address of the device, appended to the names in the monitor.
+    frame_interval_ns : int
+        Time between two frames of the device.
+    """
+    def __init__(self, monitor = None, device = None, frame_interval_ns = FRAME_INTERVAL_NS):
+        self.monitor = monitor if monitor is not None else LatencyMonitor('stream health')
+        self.device = device
+        self.suffix = '' if device is None else ' ' + device
+        self.frame_interval_ns = frame_interval_ns
+        self.reset()
+
+    def reset(self):
+        self.last_timestamp = None
+        self.last_arrival = None
+        self.late_timestamp = None
+        self.first_arrival = None
+        self.latest_arrival = None
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.late = 0
+        self.wraparounds = 0
+        self.resets = 0
+        #gap length -> number of gaps
+        self.gaps = {}
+
+    def resync(self):
+        """
+        Forget the previous frame, e.g. while the device sends direct
+        control frames without timestamp. The next frame is not compared
+        with the frames before.
+        """
+        self.last_timestamp = None
+        self.last_arrival = None
+        self.late_timestamp = None
+
+    def update(self, timestamp, arrival = None):
+        """
+        Account a frame.
+
+        Parameters
+        ----------
+        timestamp : int
+            The timestamp of the frame.
+        arrival : int or None
+            time.monotonic_ns() of the arrival of the frame, None takes now.
+
+        Returns
+        -------
+        int
+            Number of frames lost right before this frame, -1 for a
+            duplicate or late frame.
+        """
+        if arrival is None:
+            arrival = time.monotonic_ns()
+        if self.first_arrival is None:
+            self.first_arrival = arrival
+        self.latest_arrival = arrival
+        self.received += 1
+        if self.received % GAUGE_INTERVAL == 0:
+            self.monitor.gauge('frame loss %' + self.suffix, round(100.0 * self.loss_rate(), 2))
+
+        if self.last_timestamp is None:
+            self.last_timestamp = timestamp
+            self.last_arrival = arrival
+            return 0
+
+        distance = (timestamp - self.last_timestamp) % TIMESTAMP_MODULUS
+        if distance == 0:
+            self.duplicates += 1
+            self.monitor.count('duplicate frames' + self.suffix)
+            return -1
+        if distance >= TIMESTAMP_MODULUS // 2:
+            late = self.late_timestamp
+            self.late_timestamp = timestamp
+            if TIMESTAMP_MODULUS - distance <= RESET_DISTANCE:
+                if late is None or (timestamp - late) % TIMESTAMP_MODULUS != 1:
+                    self.late += 1
+                    self.monitor.count('late frames' + self.suffix)
+                    return -1
+                #two frames in order behind the stream, the previous one
+                #was not late but the first frame after a reset
+                self.late -= 1
+                self.monitor.count('late frames' + self.suffix, -1)
+            self.late_timestamp = None
+            self.resets += 1
+            self.monitor.count('timestamp resets' + self.suffix)
+            self.last_timestamp = timestamp
+            self.last_arrival = arrival
+            return 0
+
+        self.late_timestamp = None
+        if timestamp < self.last_timestamp:
+            self.wraparounds += 1
+            self.monitor.count('timestamp wraparounds' + self.suffix)
+        gap = distance - 1
+        if gap > 0:
+            self.lost += gap
+            self.gaps[gap] = self.gaps.get(gap, 0) + 1
+            self.monitor.count('lost frames' + self.suffix, gap)
+
+        interval = arrival - self.last_arrival
+        self.monitor.record_ns('frame interval' + self.suffix, interval)
+        self.monitor.record_ns('frame jitter' + self.suffix, abs(interval - distance * self.frame_interval_ns))
+        self.last_timestamp = timestamp
+        self.last_arrival = arrival
+        return gap
+
+    def loss_rate(self):
+        """
+        Lost frames per frame the device sent.
+        """
+        sent = self.received - self.duplicates - self.late + self.lost
+        if sent <= 0:
+            return 0.0
+        return self.lost / sent
+
+    def stats(self):
+        """
+        Counters, rates and gap lengths of the stream.
+
+        Returns
+        -------
+        dict
+            received, lost, duplicates, late, wraparounds, resets,
+            'loss rate' (lost frames per sent frame), 'duplicate rate' (per
+            received frame), 'frames/s' (received frames per second of
+            arrival time) and gaps (gap length -> number of gaps).
+        """
+        seconds = 0.0
+        if self.first_arrival is not None:
+            seconds = (self.latest_arrival - self.first_arrival) / 1e9
+        return {'received': self.received,
+                'lost': self.lost,
+                'duplicates': self.duplicates,
+                'late': self.late,
+                'wraparounds': self.wraparounds,
+                'resets': self.resets,
+                'loss rate': self.loss_rate(),
+                'duplicate rate': self.duplicates / self.received if self.received else 0.0,
+                'frames/s': (self.received - 1) / seconds if seconds > 0 else 0.0,
+                'gaps': dict(sorted(self.gaps.items()))}
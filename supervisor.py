@@ -0,0 +1,217 @@
+#################################################################################
+# Supervisor
+#
+# Main loop of main.py after all processes are started. The supervisor sleeps
+# until something happens instead of spinning, so the BLE notification
+# threads of bluepy (which run the stream callback in the main process) get
+# the CPU and the GIL whenever a frame arrives.
+#
+# Events the supervisor wakes up for:
+#
+#   process ended    multiprocessing.connection.wait() on the sentinels of the
+#                    watched processes (predictor workers, application). A
+#                    process with a restart function is replaced, at most
+#                    max_restarts times, otherwise the supervisor shuts down.
+#   SIGINT, SIGTERM  the signal handler writes into a pipe that is part of
+#                    the wait, the supervisor shuts down immediately.
+#
+# A background thread reconnects the TACTI with BTCommunication.reconnect()
+# as soon as a notification thread reports a connection loss (and checks the
+# connection every reconnect_interval seconds). Every TACTI that was connected
+# before is reconnected, also while other TACTI are still connected. reconnect() connects directly
+# to the known addresses and only scans if they can not be reached, the
+# settings (mode, dimension, ...) are re-applied to a reconnected device. A
+# TACTI that is still lost after RECONNECT_CYCLES reconnects (TwoWayComm.py)
+# is forgotten, it is only connected again if a scan finds it.
+#
+# Shutdown terminates and joins the watched processes and runs the shutdown
+# functions (e.g. stop the data stream) in the order they were added. The
+# signal handlers from before run() are restored afterwards, processes started
+# later can be terminated as usual.
+#
+# Usage (main.py):
+#
+#   supervisor = Supervisor(btComm)
+#   supervisor.watch('application', app, start_application)
+#   supervisor.on_shutdown(stop_streaming)
+#   supervisor.run()
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import logging
+import signal
+import threading
+import time
+from multiprocessing import Pipe
+from multiprocessing.connection import wait
+
+
+#seconds between two checks of the BLE connection
+RECONNECT_INTERVAL = 5.0
+
+#seconds a process gets to end after terminate()
+JOIN_TIMEOUT = 2.0
+
+SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+#################################################################################
+# Supervisor class
+#
+
+class Supervisor:
+    """
+    Watches the processes of the gesture recognizer and the BLE connection.
+
+    Parameters
+    ----------
+    btComm : BTCommunication or None
+        The connection to reconnect in the background, None does not
+        reconnect.
+    reconnect_interval : float
+        Seconds between two checks of the connection.
+    max_restarts : int
+        How often every process may be restarted before the supervisor
+        shuts down.
+    """
+    def __init__(self, btComm = None, reconnect_interval = RECONNECT_INTERVAL, max_restarts = 3):
+        self.btComm = btComm
+        self.reconnect_interval = reconnect_interval
+        self.max_restarts = max_restarts
+        self.processes = {}
+        self.restarts = {}
+        self.shutdown_functions = []
+        self.stopping = threading.Event()
+        self.handlers = {}
+        self.wakeup_reader, self.wakeup_writer = Pipe(duplex=False)
+
+    def watch(self, name, process, restart = None):
+        """
+        Watch a started process.
+
+        Parameters
+        ----------
+        name : str
+            Name of the process in the messages.
+        process : Process
+            The started process.
+        restart : callable or None
+            Returns a new started process that replaces process if it
+            ends, None shuts down if the process ends.
+        """
+        self.processes[name] = (process, restart)
+        self.restarts[name] = 0
+
+    def on_shutdown(self, function):
+        """
+        Call function (without arguments) after the processes are stopped.
+        """
+        self.shutdown_functions.append(function)
+
+    def stop(self, signum = None, frame = None):
+        """
+        Wake up run() and let it shut down, usable as signal handler.
+        """
+        if not self.stopping.is_set():
+            self.stopping.set()
+            self.wakeup_writer.send_bytes(b'\0')
+
+    def run(self):
+        """
+        Supervise until a signal arrives, stop() is called or a process
+        can not be restarted. Must be called from the main thread.
+        """
+        self.handlers = {signum: signal.signal(signum, self.stop) for signum in SIGNALS}
+
+        if self.btComm is not None:
+            reconnect = threading.Thread(target=self.reconnect, name='reconnect')
+            reconnect.daemon = True
+            reconnect.start()
+
+        try:
+            while not self.stopping.is_set():
+                sentinels = {process.sentinel: name for name, (process, restart) in self.processes.items()}
+                ready = wait(list(sentinels) + [self.wakeup_reader])
+                for handle in ready:
+                    if handle in sentinels and not self.stopping.is_set():
+                        self.process_ended(sentinels[handle])
+        finally:
+            try:
+                self.shutdown()
+            finally:
+                for signum, handler in self.handlers.items():
+                    signal.signal(signum, handler)
+
+    def process_ended(self, name):
+        process, restart = self.processes[name]
+        process.join()
+        print('supervisor: {} ended with exit code {}'.format(name, process.exitcode))
+        if restart is None or self.restarts[name] >= self.max_restarts:
+            print('supervisor: {} is not restarted, shutting down'.format(name))
+            self.stop()
+            return
+        self.restarts[name] += 1
+        print('supervisor: restarting {} ({} of {})'.format(name, self.restarts[name], self.max_restarts))
+        #the new process must not inherit the handlers of the supervisor
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+        try:
+            self.processes[name] = (restart(), restart)
+        finally:
+            for signum in SIGNALS:
+                signal.signal(signum, self.stop)
+
+    def reconnect(self):
+        #a reconnect may scan for a few seconds, it runs in this thread so
+        #the supervisor stays responsive
+        connected = True
+        while not self.stopping.is_set():
+            #a notification thread sets connectionLost when it loses its
+            #device, the interval only covers connects that never came up
+            self.btComm.connectionLost.wait(self.reconnect_interval)
+            self.btComm.connectionLost.clear()
+            if self.stopping.is_set():
+                return
+            try:
+                #with several TACTI one of them may be lost while the
+                #others are still connected
+                lostAddresses = self.btComm.lostAddresses()
+                if self.btComm.isConnected() and not lostAddresses:
+                    if not connected:
+                        print('supervisor: TACTI reconnected')
+                    connected = True
+                    continue
+                if connected:
+                    if lostAddresses:
+                        print('supervisor: TACTI {} lost, reconnecting'.format(', '.join(lostAddresses)))
+                    else:
+                        print('supervisor: no TACTI connected, reconnecting')
+                    lost = time.monotonic()
+                connected = False
+                if self.btComm.reconnect():
+                    print('supervisor: TACTI reconnected after {:.2f}s'.format(time.monotonic() - lost))
+                    connected = True
+            except Exception as e:
+                logging.debug("Reconnect failed %s", e)
+
+    def shutdown(self):
+        print('supervisor: shutting down')
+        self.stopping.set()
+        for name, (process, restart) in self.processes.items():
+            if process.is_alive():
+                process.terminate()
+        for name, (process, restart) in self.processes.items():
+            process.join(JOIN_TIMEOUT)
+            if process.is_alive():
+                print('supervisor: {} did not end, killing it'.format(name))
+                process.kill()
+                process.join()
+        for function in self.shutdown_functions:
+            try:
+                function()
+            except Exception as e:
+                print('supervisor: shutdown function failed: {}'.format(e))
@@ -0,0 +1,301 @@
+#################################################################################
+# Hyperparameter sweep
+#
+# Trains the one class neural networks of a gesture set for every combination
+# of a grid over the hidden layers, the regularisation (alpha) and the
+# timeframe and records for every configuration
+#
+#   accuracy         of the fused ensemble on the test data, decided like
+#                    Predictor.prediction() (best score, below 0.7 unknown)
+#   ovr accuracy     mean and worst accuracy of the single one class networks
+#   latency          scoring time of a single window with the fused float32
+#                    ensemble, as the predictor runs it from a model bundle
+#
+# All configurations use the same stratified split of the data. The split is
+# cached in ./data/splits/ keyed by the labels and the split parameters, so
+# repeated sweeps compare on the same test data. All fits run in one joblib
+# call, the latencies are measured afterwards one configuration after another
+# so the fits do not disturb the timing.
+#
+# The result is a table (.csv) with one row per configuration, choose() picks
+# the most accurate configuration within a latency budget.
+#
+# Usage:
+#
+#   python sweep.py crazyFlyGestures.csv --hidden 20,20,20 40,40 --alpha 1e-4 1e-3 --timeframes 20 40
+#   python sweep.py crazyFlyGestures.csv --budget 50
+#   python sweep.py --table ./models/sweep.csv --budget 50
+#
+# --table chooses from a saved table without training again.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import hashlib
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.model_selection import train_test_split
+from buildcache import stage_key
+from ensemble import FusedEnsemble
+from latency import LatencyHistogram
+from preprocessing import create_classifier, one_vs_rest_labels, training_matrix
+
+
+SPLIT_DIR = './data/splits'
+OUTPUT_FILE = './models/sweep.csv'
+
+#score below which the predictor decides unknown, see Predictor.prediction()
+UNKNOWN_THRESHOLD = 0.7
+
+#default grid, the first entries are the settings of create_classifier('nn')
+HIDDEN_LAYER_SIZES = [(20, 20, 20), (10, 10), (20, 20), (40, 40)]
+ALPHAS = [1e-3, 1e-4, 1e-2]
+TIMEFRAMES = [20, 40]
+
+
+#################################################################################
+# grid and split
+#
+
+def parameter_grid(hidden_layer_sizes=HIDDEN_LAYER_SIZES, alphas=ALPHAS, timeframes=TIMEFRAMES):
+    """
+    All combinations of the grid as list of dicts with the keys
+    hidden_layer_sizes, alpha and timeframe.
+    """
+    return [{'hidden_layer_sizes': tuple(hidden), 'alpha': alpha, 'timeframe': timeframe}
+            for hidden, alpha, timeframe in itertools.product(hidden_layer_sizes, alphas, timeframes)]
+
+
+def stratified_split(categories, test_size=0.2, random_state=1, split_dir=SPLIT_DIR):
+    """
+    Stratified train and test rows of a dataset.
+
+    Parameters
+    ----------
+    categories : ndarray of shape (rows,)
+        The category of every row.
+    test_size : float
+        Share of the test data.
+    random_state : int
+        Seed of the split.
+    split_dir : str or None
+        Folder of the cached splits, None does not cache.
+
+    Returns
+    -------
+    train, test : ndarray of int
+        Row indices.
+    """
+    labels = hashlib.sha256('\n'.join(str(c) for c in categories).encode('utf-8')).hexdigest()
+    key = stage_key([labels], {'test_size': test_size, 'random_state': random_state})
+    path = None if split_dir is None else os.path.join(split_dir, key[:16] + '.npz')
+
+    if path is not None and os.path.exists(path):
+        with np.load(path) as split:
+            return split['train'], split['test']
+
+    rows = np.arange(len(categories))
+    train, test = train_test_split(rows, test_size=test_size, random_state=random_state, stratify=categories)
+    if path is not None:
+        os.makedirs(split_dir, exist_ok=True)
+        np.savez(path, train=train, test=test)
+    return train, test
+
+
+#################################################################################
+# evaluation
+#
+
+def ensemble_accuracy(ensemble, class_names, X, categories):
+    """
+    Share of the rows the fused ensemble decides correctly.
+    """
+    scores = ensemble.scores(X)
+    best = np.argmax(scores, axis=1)
+    decided = np.asarray(class_names, dtype=object)[best]
+    decided[scores[np.arange(len(best)), best] < UNKNOWN_THRESHOLD] = 'unknown'
+    return float(np.mean(decided == categories))
+
+
+def window_latency(ensemble, X, windows=1000):
+    """
+    Histogram of the time to score single windows (rows of X) in us.
+    """
+    histogram = LatencyHistogram()
+    for i in range(windows):
+        window = X[i % len(X)]
+        start = time.perf_counter_ns()
+        ensemble.scores(window)
+        histogram.record_us((time.perf_counter_ns() - start) // 1000)
+    return histogram
+
+
+def float32_ensemble(classifiers):
+    """
+    Fused ensemble with float32 weights like a loaded model bundle.
+    """
+    ensemble = FusedEnsemble.from_classifiers(classifiers)
+    return FusedEnsemble([c.astype(np.float32) for c in ensemble.coefs],
+                         [i.astype(np.float32) for i in ensemble.intercepts],
+                         ensemble.invert, ensemble.activation)
+
+
+def _fit(X, y, width, cat, hidden_layer_sizes, alpha):
+    clf = create_classifier('nn', hidden_layer_sizes=hidden_layer_sizes, alpha=alpha)
+    start = time.perf_counter()
+    clf.fit(X[:, :width], one_vs_rest_labels(y, cat))
+    return clf, time.perf_counter() - start
+
+
+#################################################################################
+# sweep
+#
+
+def sweep(merged_training_data, grid=None, categories=None, test_size=0.2, random_state=1, n_jobs=-1, latency_windows=1000, split_dir=SPLIT_DIR):
+    """
+    Train and measure every configuration of a grid.
+
+    Parameters
+    ----------
+    merged_training_data : DataFrame, Dataset or str
+        see preprocessing.load_training_data()
+    grid : list of dict or None
+        Configurations, see parameter_grid(). None uses the default grid.
+    categories : list of str or None
+        The gestures, None takes all categories of the data.
+    test_size : float
+        Share of the test data.
+    random_state : int
+        Seed of the split.
+    n_jobs : int
+        Number of processes that train networks at the same time,
+        -1 uses all CPU cores.
+    latency_windows : int
+        Number of single windows scored for the latency of a configuration.
+    split_dir : str or None
+        Folder of the cached splits, None does not cache.
+
+    Returns
+    -------
+    DataFrame
+        One row per configuration, sorted by the median latency.
+    """
+    if grid is None:
+        grid = parameter_grid()
+
+    X, y, channels = training_matrix(merged_training_data)
+    if categories is None:
+        categories = sorted(set(y))
+    train, test = stratified_split(y, test_size, random_state, split_dir)
+    X_train, y_train = np.asarray(X[train]), y[train]
+    X_test, y_test = np.asarray(X[test]), y[test]
+
+    jobs = [(config, cat) for config in grid for cat in categories]
+    print('sweep: {} configurations, {} networks, {} training and {} test rows'.format(len(grid), len(jobs), len(train), len(test)))
+    start = time.perf_counter()
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit)(X_train, y_train, config['timeframe'] * len(channels), cat,
+                      config['hidden_layer_sizes'], config['alpha'])
+        for config, cat in jobs)
+    print('sweep: trained in {:.1f}s'.format(time.perf_counter() - start))
+
+    rows = []
+    for i, config in enumerate(grid):
+        fitted = results[i * len(categories):(i + 1) * len(categories)]
+        classifiers = [clf for clf, seconds in fitted]
+        width = config['timeframe'] * len(channels)
+        test_data = X_test[:, :width]
+
+        ovr = [clf.score(test_data, one_vs_rest_labels(y_test, cat)) for clf, cat in zip(classifiers, categories)]
+        ensemble = float32_ensemble(classifiers)
+        latency = window_latency(ensemble, test_data, latency_windows)
+
+        rows.append({'hidden_layer_sizes': '-'.join(str(n) for n in config['hidden_layer_sizes']),
+                     'alpha': config['alpha'],
+                     'timeframe': config['timeframe'],
+                     'features': width,
+                     'parameters': sum(coef.size + intercept.size for clf in classifiers for coef, intercept in zip(clf.coefs_, clf.intercepts_)),
+                     'accuracy': ensemble_accuracy(ensemble, categories, test_data, y_test),
+                     'ovr_accuracy_mean': float(np.mean(ovr)),
+                     'ovr_accuracy_min': float(np.min(ovr)),
+                     'fit_seconds': sum(seconds for clf, seconds in fitted),
+                     'latency_mean_us': latency.mean(),
+                     'latency_p50_us': latency.percentile(50.0),
+                     'latency_p99_us': latency.percentile(99.0)})
+        print('{hidden_layer_sizes:>10} alpha {alpha:<7g} timeframe {timeframe:<3} accuracy {accuracy:.3f} '
+              'latency p50 {latency_p50_us}us p99 {latency_p99_us}us'.format(**rows[-1]))
+
+    return pd.DataFrame(rows).sort_values(['latency_p50_us', 'accuracy'], ascending=[True, False]).reset_index(drop=True)
+
+
+def choose(table, budget_us, percentile='latency_p99_us'):
+    """
+    The most accurate configuration whose latency is within the budget.
+
+    Parameters
+    ----------
+    table : DataFrame
+        Result of sweep() or the saved .csv table.
+    budget_us : float
+        Latency budget of a single window in microseconds.
+    percentile : str
+        Latency column that has to meet the budget.
+
+    Returns
+    -------
+    Series or None
+        The row of the configuration, None if no configuration is fast enough.
+    """
+    candidates = table[table[percentile] <= budget_us]
+    if len(candidates) == 0:
+        return None
+    return candidates.sort_values(['accuracy', percentile], ascending=[False, True]).iloc[0]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Sweep the network architecture, alpha and timeframe of a gesture set')
+    parser.add_argument('data', nargs='?', default=None, help='merged .csv or .dataset in ./data/merged/')
+    parser.add_argument('--hidden', nargs='+', default=None, help='hidden layer sizes, e.g. 20,20,20 40,40')
+    parser.add_argument('--alpha', nargs='+', type=float, default=ALPHAS)
+    parser.add_argument('--timeframes', nargs='+', type=int, default=TIMEFRAMES)
+    parser.add_argument('--categories', nargs='+', default=None)
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--random-state', type=int, default=1)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--windows', type=int, default=1000, help='windows scored for the latency')
+    parser.add_argument('--budget', type=float, default=None, help='latency budget of a window in us')
+    parser.add_argument('--output', default=OUTPUT_FILE)
+    parser.add_argument('--table', default=None, help='saved sweep table (.csv) to choose from instead of sweeping')
+    args = parser.parse_args()
+
+    if args.table is not None:
+        table = pd.read_csv(args.table)
+        print('sweep: {} configurations read from {}'.format(len(table), args.table))
+    elif args.data is None:
+        parser.error('either data or --table is required')
+    else:
+        hidden = HIDDEN_LAYER_SIZES
+        if args.hidden is not None:
+            hidden = [tuple(int(n) for n in h.split(',')) for h in args.hidden]
+
+        table = sweep(args.data, parameter_grid(hidden, args.alpha, args.timeframes), args.categories,
+                      args.test_size, args.random_state, args.n_jobs, args.windows)
+        table.to_csv(args.output, index=False)
+        print('sweep: table written to {}'.format(args.output))
+
+    if args.budget is not None:
+        best = choose(table, args.budget)
+        if best is None:
+            print('no configuration within {:g}us'.format(args.budget))
+        else:
+            print('best within {:g}us:'.format(args.budget))
+            print(best.to_string())
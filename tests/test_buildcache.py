@@ -0,0 +1,106 @@
+#################################################################################
+# Build cache tests
+#
+# Freshness of the outputs recorded in the manifest: an output stays fresh
+# until the content of an input, a parameter or the code version of the
+# stage changes, or the output itself is changed.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+from buildcache import Manifest, code_version, file_hash, path_hash, stage_key
+
+
+def stage_v1(data):
+    return data
+
+
+def stage_v2(data):
+    return data * 2
+
+
+def build(tmp_path, source, version):
+    output = tmp_path / 'output.csv'
+    output.write_text('built from ' + source.read_text())
+    key = stage_key([file_hash(str(source))], {'threshold': 0.5, 'version': version})
+    return key, str(output)
+
+
+def test_output_is_fresh_until_an_input_changes(tmp_path):
+    source = tmp_path / 'land.csv'
+    source.write_text('1,2,3\n')
+    manifest = Manifest(str(tmp_path / 'manifest.json'))
+    key, output = build(tmp_path, source, code_version(stage_v1))
+    manifest.record('preprocessed', 'land.csv', key, output)
+
+    assert manifest.fresh('preprocessed', 'land.csv', key, output)
+    assert not manifest.fresh('preprocessed', 'start.csv', key, output)
+
+    #a changed source gives a new key
+    source.write_text('1,2,4\n')
+    changed = stage_key([file_hash(str(source))], {'threshold': 0.5, 'version': code_version(stage_v1)})
+    assert changed != key
+    assert not manifest.fresh('preprocessed', 'land.csv', changed, output)
+
+
+def test_changed_code_version_or_parameters_are_not_fresh(tmp_path):
+    source = tmp_path / 'land.csv'
+    source.write_text('1,2,3\n')
+    manifest = Manifest(str(tmp_path / 'manifest.json'))
+    key, output = build(tmp_path, source, code_version(stage_v1))
+    manifest.record('preprocessed', 'land.csv', key, output)
+
+    assert code_version(stage_v1) != code_version(stage_v2)
+    new_code = stage_key([file_hash(str(source))], {'threshold': 0.5, 'version': code_version(stage_v2)})
+    new_threshold = stage_key([file_hash(str(source))], {'threshold': 0.6, 'version': code_version(stage_v1)})
+    assert not manifest.fresh('preprocessed', 'land.csv', new_code, output)
+    assert not manifest.fresh('preprocessed', 'land.csv', new_threshold, output)
+
+
+def test_changed_or_missing_output_is_not_fresh(tmp_path):
+    source = tmp_path / 'land.csv'
+    source.write_text('1,2,3\n')
+    manifest = Manifest(str(tmp_path / 'manifest.json'))
+    key, output = build(tmp_path, source, code_version(stage_v1))
+    manifest.record('preprocessed', 'land.csv', key, output)
+
+    with open(output, 'a') as f:
+        f.write('edited\n')
+    assert not manifest.fresh('preprocessed', 'land.csv', key, output)
+
+    (tmp_path / 'output.csv').unlink()
+    assert not manifest.fresh('preprocessed', 'land.csv', key, output)
+
+
+def test_saved_manifest_is_loaded(tmp_path):
+    source = tmp_path / 'land.csv'
+    source.write_text('1,2,3\n')
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path)
+    key, output = build(tmp_path, source, code_version(stage_v1))
+    manifest.record('preprocessed', 'land.csv', key, output)
+    manifest.save()
+
+    loaded = Manifest(path)
+    assert loaded.entries == manifest.entries
+    assert loaded.fresh('preprocessed', 'land.csv', key, output)
+    assert loaded.output_hash('preprocessed', 'land.csv') == file_hash(output)
+    assert loaded.output_hash('merged', 'land.csv') is None
+
+
+def test_output_folder_is_hashed_over_its_files(tmp_path):
+    folder = tmp_path / 'merged.dataset'
+    folder.mkdir()
+    (folder / 'features.npy').write_bytes(b'features')
+    (folder / 'labels.npy').write_bytes(b'labels')
+    manifest = Manifest(str(tmp_path / 'manifest.json'))
+    manifest.record('dataset', 'merged.dataset', 'key', str(folder))
+    assert manifest.fresh('dataset', 'merged.dataset', 'key', str(folder))
+
+    before = path_hash(str(folder))
+    (folder / 'labels.npy').write_bytes(b'other labels')
+    assert path_hash(str(folder)) != before
+    assert not manifest.fresh('dataset', 'merged.dataset', 'key', str(folder))
@@ -0,0 +1,69 @@
+#################################################################################
+# Dataset tests
+#
+# save_dataset -> load_dataset round trip of a small merged DataFrame, the
+# conversion of a merged .csv file and the checks of the schema.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from dataset import SCHEMA_FILE, Dataset, convert, load_dataset, save_dataset
+
+
+@pytest.fixture
+def merged():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.normal(size=(6, 4)), columns=['00_accX', '00_accY', '01_accX', '01_accY'])
+    df['category'] = ['start', 'land', 'start', 'wp_next', 'land', 'start']
+    return df
+
+
+def test_round_trip(tmp_path, merged):
+    path = str(tmp_path / 'merged.dataset')
+    save_dataset(path, Dataset.from_dataframe(merged))
+
+    for mmap in (True, False):
+        dataset = load_dataset(path, mmap=mmap)
+        assert len(dataset) == 6
+        assert dataset.columns == ['00_accX', '00_accY', '01_accX', '01_accY']
+        assert dataset.categories == ['land', 'start', 'wp_next']
+        assert dataset.features.dtype == np.float32
+        np.testing.assert_allclose(dataset.features, merged.iloc[:, :4].to_numpy(), rtol=1e-6)
+        assert list(dataset.category_names()) == list(merged['category'])
+        pd.testing.assert_frame_equal(dataset.to_dataframe(), merged, check_dtype=False, rtol=1e-6)
+
+    #memory mapped datasets are read only
+    with pytest.raises(ValueError):
+        load_dataset(path).features[0, 0] = 1.0
+
+
+def test_convert_drops_the_index_column(tmp_path, merged):
+    csv_file = tmp_path / 'merged.csv'
+    merged.to_csv(csv_file)
+
+    path = convert(str(csv_file))
+    assert path == str(tmp_path / 'merged.dataset')
+    assert load_dataset(path).columns == ['00_accX', '00_accY', '01_accX', '01_accY']
+
+
+def test_schema_is_checked(tmp_path, merged):
+    path = tmp_path / 'merged.dataset'
+    save_dataset(str(path), Dataset.from_dataframe(merged))
+    schema = json.loads((path / SCHEMA_FILE).read_text())
+
+    schema['rows'] = 7
+    (path / SCHEMA_FILE).write_text(json.dumps(schema))
+    with pytest.raises(ValueError):
+        load_dataset(str(path))
+
+    schema['version'] = 0
+    (path / SCHEMA_FILE).write_text(json.dumps(schema))
+    with pytest.raises(ValueError):
+        load_dataset(str(path))
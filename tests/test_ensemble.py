@@ -0,0 +1,73 @@
+#################################################################################
+# FusedEnsemble tests
+#
+# The fused forward pass must score like predict_proba of every single
+# one class classifier.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import warnings
+import numpy as np
+import pytest
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neural_network import MLPClassifier
+from sklearn.tree import DecisionTreeClassifier
+from ensemble import ClassifierEnsemble, FusedEnsemble
+from predictor import fuse
+
+
+def one_class_data(gesture, seed):
+    rng = np.random.RandomState(seed)
+    X = rng.randn(60, 12)
+    y = np.where(X[:, seed % 12] > 0, gesture, 'unknown')
+    return X, y
+
+
+def gesture_probabilities(classifiers, X):
+    #the former Predictor.prediction took the column that is not 'unknown'
+    return np.column_stack([clf.predict_proba(X)[:, 1 - list(clf.classes_).index('unknown')] for clf in classifiers])
+
+
+def train(model, gestures):
+    classifiers = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        for seed, gesture in enumerate(gestures):
+            X, y = one_class_data(gesture, seed)
+            classifiers.append(model().fit(X, y))
+    return classifiers
+
+
+#'land' sorts before 'unknown', 'wp_next' after it, so both orders of
+#classes_ are covered
+GESTURES = ['land', 'wp_next', 'start']
+
+
+def test_fused_ensemble_scores_like_predict_proba():
+    classifiers = train(lambda: MLPClassifier(hidden_layer_sizes=(8, 4), max_iter=50, random_state=0), GESTURES)
+    ensemble = fuse(classifiers)
+    assert isinstance(ensemble, FusedEnsemble)
+    assert ensemble.n_features == 12
+
+    X = np.random.RandomState(1).randn(20, 12)
+    np.testing.assert_allclose(ensemble.scores(X), gesture_probabilities(classifiers, X), rtol=1e-10, atol=1e-12)
+
+
+def test_decision_trees_fall_back_to_predict_proba():
+    classifiers = train(lambda: DecisionTreeClassifier(max_depth=3, random_state=0), GESTURES)
+    ensemble = fuse(classifiers)
+    assert isinstance(ensemble, ClassifierEnsemble)
+    assert len(ensemble) == 3
+
+    X = np.random.RandomState(2).randn(20, 12)
+    np.testing.assert_array_equal(ensemble.scores(X), gesture_probabilities(classifiers, X))
+
+
+def test_decision_trees_can_not_be_fused():
+    classifiers = train(lambda: DecisionTreeClassifier(max_depth=3, random_state=0), GESTURES)
+    with pytest.raises(ValueError):
+        FusedEnsemble.from_classifiers(classifiers)
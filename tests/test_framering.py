@@ -0,0 +1,61 @@
+#################################################################################
+# FrameRing tests
+#
+# Counters of the shared memory ring in a single process: written, dropped
+# and overruns of a full ring and the order of the frames when the head
+# wraps around the capacity.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import queue
+import pytest
+from framering import HEAD, FrameRing
+
+
+def frame(i):
+    return bytes([i % 256]) * 20
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing(capacity=4)
+    yield ring
+    ring.close()
+
+
+def test_full_ring_drops_and_counts_overruns(ring):
+    for i in range(4):
+        assert ring.put(frame(i))
+    assert not ring.put(frame(4))
+    assert not ring.put(frame(5))
+    assert ring.stats() == {'written': 4, 'dropped': 2, 'overruns': 1, 'depth': 4}
+
+    #a free slot ends the overrun, the next full ring is a new one
+    assert ring.get() == frame(0)
+    assert ring.put(frame(6))
+    assert not ring.put(frame(7))
+    assert ring.stats() == {'written': 5, 'dropped': 3, 'overruns': 2, 'depth': 4}
+
+    assert [ring.get() for i in range(4)] == [frame(1), frame(2), frame(3), frame(6)]
+
+
+def test_frames_stamps_and_tags_survive_the_wrap(ring):
+    for i in range(11):
+        assert ring.put(frame(i), stamp=1000 + i, tag=i)
+        assert ring.get() == frame(i)
+        assert (ring.stamp, ring.tag) == (1000 + i, i)
+    assert ring.counters[HEAD] == 11
+    assert ring.stats() == {'written': 11, 'dropped': 0, 'overruns': 0, 'depth': 0}
+
+
+def test_empty_ring(ring):
+    with pytest.raises(queue.Empty):
+        ring.get(block=False)
+    with pytest.raises(queue.Empty):
+        ring.get(timeout=0.02)
+    with pytest.raises(ValueError):
+        ring.put(b'short')
@@ -0,0 +1,57 @@
+#################################################################################
+# Model bundle tests
+#
+# A bundle written by save_bundle must load the same ensembles back, the
+# float32 weights may only change the scores within float32 precision.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import warnings
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neural_network import MLPClassifier
+from ensemble import FusedEnsemble
+from modelbundle import CHANNELS_3D, load_bundle, save_bundle
+
+
+CLASS_NAMES = ['land', 'wp_next', 'start']
+
+
+def ensemble(n_features, hidden_layer_sizes, seed):
+    rng = np.random.RandomState(seed)
+    classifiers = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        for gesture, sizes in zip(CLASS_NAMES, hidden_layer_sizes):
+            X = rng.randn(60, n_features)
+            y = np.where(X[:, 0] + X[:, 1] > 0, gesture, 'unknown')
+            classifiers.append(MLPClassifier(hidden_layer_sizes=sizes, max_iter=50, random_state=seed).fit(X, y))
+    return FusedEnsemble.from_classifiers(classifiers)
+
+
+def test_save_load_round_trip(tmp_path):
+    #equal hidden layers are stacked, different ones block diagonal
+    early = ensemble(12, [(8, 8)] * 3, 0)
+    validation = ensemble(24, [(8, 8), (6, 8), (8, 8)], 1)
+    assert early.coefs[1].ndim == 3
+    assert validation.coefs[1].ndim == 2
+    metadata = {'early_timeframe': 2, 'validation_timeframe': 4, 'channels': CHANNELS_3D, 'kind': 'nn'}
+
+    path = str(tmp_path / 'gestures.bundle')
+    save_bundle(path, CLASS_NAMES, early, validation, metadata)
+    bundle = load_bundle(path)
+
+    assert bundle.class_names == CLASS_NAMES
+    assert bundle.metadata == metadata
+    rng = np.random.RandomState(2)
+    for saved, loaded in ((early, bundle.early), (validation, bundle.validation)):
+        assert loaded.activation == saved.activation
+        np.testing.assert_array_equal(loaded.invert, saved.invert)
+        assert [c.shape for c in loaded.coefs] == [c.shape for c in saved.coefs]
+        assert all(c.dtype == np.float32 for c in loaded.coefs)
+        X = rng.randn(50, saved.n_features)
+        np.testing.assert_allclose(loaded.scores(X), saved.scores(X), rtol=0, atol=1e-5)
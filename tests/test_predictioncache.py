@@ -0,0 +1,54 @@
+#################################################################################
+# PredictionCache tests
+#
+# LRU eviction of the prediction cache of the predictor: a lookup moves the
+# entry to the end, the least recently used entry is evicted first, hits
+# and misses are counted in stats().
+#
+
+
+#################################################################################
+# needed imports
+#
+
+from predictor import PredictionCache
+
+
+def test_evicts_least_recently_used():
+    cache = PredictionCache(maxsize=2)
+    cache.put('a', 'land')
+    cache.put('b', 'start')
+    #'a' becomes the most recently used entry
+    assert cache.get('a') == 'land'
+    cache.put('c', 'wp_next')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'land'
+    assert cache.get('c') == 'wp_next'
+    assert list(cache.entries) == ['a', 'c']
+
+
+def test_put_of_a_known_key_refreshes_it():
+    cache = PredictionCache(maxsize=2)
+    cache.put('a', 'land')
+    cache.put('b', 'start')
+    cache.put('a', 'stillGesture')
+    cache.put('c', 'wp_next')
+
+    assert cache.get('a') == 'stillGesture'
+    assert cache.get('b') is None
+    assert len(cache.entries) == 2
+
+
+def test_stats_count_hits_and_misses():
+    cache = PredictionCache(maxsize=4)
+    assert cache.stats()['hit rate'] == 0.0
+    cache.get('a')
+    cache.put('a', 'land')
+    cache.get('a')
+    cache.get('a')
+
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'size': 1, 'hit rate': 2 / 3}
+
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'size': 0, 'hit rate': 0.0}
@@ -0,0 +1,52 @@
+#################################################################################
+# Regression tests
+#
+# Replays a recorded session through the gesture recognizer and preprocesses
+# a recording again, the results must not change with optimizations of the
+# predictor or the preprocessing. Run from the repository root with
+#
+#   python -m pytest -q tests
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import os
+import sys
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import preprocessing as pre
+from modelbundle import load_bundle
+from replay import create_predictor, load_frames, replay
+
+
+@pytest.fixture(autouse=True)
+def repository_root(monkeypatch):
+    #the modules use paths relative to the repository root
+    monkeypatch.chdir(ROOT)
+
+
+def test_replay_land_events():
+    predictor = create_predictor(load_bundle('./models/crazyFlyGestures.bundle'))
+    result = replay(load_frames('./data/raw/land.csv'), predictor)
+
+    counts = result.counts()
+    assert counts['vali'] == 90
+    assert counts['false'] == 20
+
+
+def test_preprocessing_land_unchanged():
+    raw_training_df = pd.read_csv('./data/raw/land.csv', float_precision='legacy')
+    raw_training_df.columns = raw_training_df.columns.str.replace(" ", "")
+
+    runs, channels = pre.flatten_runs(pre.segment_runs(raw_training_df))
+    processed_df = pre.runs_to_dataframe(runs, channels).assign(category='land')
+
+    with open('./data/preprocessed/land.csv') as f:
+        assert processed_df.to_csv() == f.read()
@@ -0,0 +1,63 @@
+#################################################################################
+# RingBuffer tests
+#
+# The window of the ring buffer must read like the former shifting numpy
+# array of Data3D: the last samples in chronological order followed by zeros.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import numpy as np
+from predictor import RingBuffer
+
+
+def shifting_write(window, sample, limit):
+    #the former Data3D dropped the oldest samples of a full window and
+    #appended the new one
+    while len(window) >= limit:
+        window.pop(0)
+    window.append(sample)
+
+
+def padded(window, width, capacity):
+    values = np.zeros(width * capacity)
+    values[:len(window) * width] = np.ravel(window)
+    return values
+
+
+def test_window_matches_shifting_array_with_wrap():
+    rng = np.random.RandomState(0)
+    ring = RingBuffer(6, 40)
+    window = []
+    #early window of 20 samples, then the validation window of 40, more
+    #than twice the capacity so the start wraps several times
+    for i in range(130):
+        limit = 20 if i < 50 else 40
+        sample = rng.randn(6)
+        ring.write(sample, limit)
+        shifting_write(window, sample, limit)
+        np.testing.assert_array_equal(ring.read(), padded(window, 6, 40))
+    assert ring.start != 0
+
+
+def test_energy_and_idle_follow_the_window():
+    ring = RingBuffer(3, 4)
+    ring.write(np.array([1.0, 0.0, 2.0]), 2)
+    ring.write(np.zeros(3), 2)
+    assert ring.energy == 5.0
+    assert not ring.idle(0.0)
+    ring.write(np.zeros(3), 2)
+    assert ring.energy == 0.0
+    assert ring.idle(0.0)
+
+
+def test_clear_empties_the_window():
+    ring = RingBuffer(3, 4)
+    for i in range(7):
+        ring.write(np.full(3, i + 1.0), 4)
+    ring.clear()
+    assert ring.count == 0
+    np.testing.assert_array_equal(ring.read(), np.zeros(12))
@@ -0,0 +1,85 @@
+#################################################################################
+# StreamHealth tests
+#
+# Accounting of the 16 bit frame timestamps: gaps, the wraparound at 2^16,
+# the reset of the timestamp to 1, duplicate and late frames.
+#
+
+
+#################################################################################
+# needed imports
+#
+
+import pytest
+from streamhealth import FRAME_INTERVAL_NS, StreamHealth
+
+
+def feed(health, timestamps):
+    #one frame every 20ms, returns the results of update()
+    return [health.update(timestamp, i * FRAME_INTERVAL_NS) for i, timestamp in enumerate(timestamps)]
+
+
+def test_gaps_are_counted_as_lost_frames():
+    health = StreamHealth()
+    assert feed(health, [1, 2, 3, 6, 7, 9]) == [0, 0, 0, 2, 0, 1]
+
+    stats = health.stats()
+    assert stats['lost'] == 3
+    assert stats['gaps'] == {1: 1, 2: 1}
+    assert stats['received'] == 6
+    #9 frames sent, 3 of them lost
+    assert stats['loss rate'] == pytest.approx(3 / 9)
+    assert stats['frames/s'] == pytest.approx(50.0)
+
+
+def test_wraparound_of_the_16_bit_timestamp():
+    health = StreamHealth()
+    assert feed(health, [65534, 65535, 0, 1, 3]) == [0, 0, 0, 0, 1]
+    assert health.wraparounds == 1
+    assert health.lost == 1
+
+    health.reset()
+    #frames lost across the wraparound
+    assert feed(health, [65534, 1]) == [0, 2]
+    assert health.wraparounds == 1
+    assert health.gaps == {2: 1}
+
+
+def test_reset_to_1_far_behind_the_stream():
+    health = StreamHealth()
+    assert feed(health, [5000, 5001, 1, 2, 3]) == [0, 0, 0, 0, 0]
+    assert health.resets == 1
+    assert health.lost == 0
+    assert health.late == 0
+
+
+def test_reset_to_1_close_behind_the_stream():
+    health = StreamHealth()
+    #1 looks like a late frame until 2 follows it
+    assert feed(health, [500, 501, 1, 2, 3]) == [0, 0, -1, 0, 0]
+    assert health.resets == 1
+    assert health.late == 0
+    assert health.lost == 0
+
+
+def test_duplicate_and_late_frames():
+    health = StreamHealth()
+    assert feed(health, [10, 11, 11, 13, 12, 14]) == [0, 0, -1, 1, -1, 0]
+
+    stats = health.stats()
+    assert stats['duplicates'] == 1
+    assert stats['late'] == 1
+    #the late frame 12 was counted as lost before it arrived
+    assert stats['lost'] == 1
+    assert stats['duplicate rate'] == pytest.approx(1 / 6)
+    assert stats['resets'] == 0
+
+
+def test_resync_forgets_the_previous_frame():
+    health = StreamHealth()
+    feed(health, [100, 101])
+    health.resync()
+    assert health.update(7, 10 * FRAME_INTERVAL_NS) == 0
+    assert health.update(8, 11 * FRAME_INTERVAL_NS) == 0
+    assert health.lost == 0
+    assert health.resets == 0
@@ -57,5 +57,15 @@ categories = ['land',
 #pre.train_one_class_classifier_nn_evaluation('crazyFlyGestures.csv', categories, 20, test_data_size=0.2)
 pre.accuracy_over_epochs_nn('crazyFlyGestures.csv', categories, 20, test_data_size=0.8, training_epochs=200)
 
+#long overfitting study: accuracies every 10 epochs on a quarter of the training data,
+#stop when the test accuracy did not improve in 5 scorings
+#pre.accuracy_over_epochs_nn('crazyFlyGestures.csv', categories, 20, test_data_size=0.8, training_epochs=1000, score_interval=10, train_score_size=0.25, patience=5, report_dir='./reports/epochs')
+
 #pre.train_one_class_classifier_nn('crazyFlyGestures.csv', categories, 40)
 
+#all timeframes of the models in one run, the data is loaded only once
+#pre.train_one_class_classifier_nn('crazyFlyGestures.csv', categories, [20, 40])
+
+#evaluation without plot windows, the plots and results are saved into ./reports/nn
+#pre.train_one_class_classifier_nn_evaluation('crazyFlyGestures.csv', categories, [20, 40], report_dir='./reports/nn')
+